@@ -0,0 +1,271 @@
+import asyncio
+import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from app.outbox import Outbox
+from app.rate_limiter import BACKGROUND, request_priority
+from app.stock_api import StockAPI as HttpStockAPI
+from utils.db_utils import DatabaseManager
+
+ABOVE = '>'
+BELOW = '<'
+
+# "/alert AAPL > 200", "/alert aapl<199.5"
+ALERT_PATTERN = re.compile(r'^\s*([A-Za-z0-9.\-]{1,10})\s*([<>])\s*(\d+(?:\.\d+)?)\s*$')
+
+MAX_ALERTS_PER_USER = 50
+
+
+def parse_alert(text: str) -> Optional[Tuple[str, str, float]]:
+    """
+    Parses "SYMBOL > PRICE" / "SYMBOL < PRICE" into (symbol, direction, threshold).
+    """
+    match = ALERT_PATTERN.match(text)
+    if match is None:
+        return None
+    symbol, direction, threshold = match.groups()
+    return symbol.upper(), direction, float(threshold)
+
+
+class Alert:
+    __slots__ = ('alert_id', 'user_id', 'symbol', 'direction', 'threshold')
+
+    def __init__(self, alert_id: int, user_id: int, symbol: str, direction: str, threshold: float):
+        self.alert_id = alert_id
+        self.user_id = user_id
+        self.symbol = symbol
+        self.direction = direction
+        self.threshold = threshold
+
+    def describe(self) -> str:
+        return f"#{self.alert_id} {self.symbol} {self.direction} {self.threshold:g}"
+
+
+class _SymbolThresholds:
+    """
+    Thresholds of one symbol in two sorted arrays, with alert ids in matching order.
+    """
+    __slots__ = ('above', 'above_ids', 'below', 'below_ids')
+
+    def __init__(self):
+        self.above: List[float] = []
+        self.above_ids: List[int] = []
+        self.below: List[float] = []
+        self.below_ids: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.above) + len(self.below)
+
+    def add(self, threshold: float, alert_id: int, direction: str):
+        thresholds, ids = (self.above, self.above_ids) if direction == ABOVE else (self.below, self.below_ids)
+        position = bisect_right(thresholds, threshold)
+        thresholds.insert(position, threshold)
+        ids.insert(position, alert_id)
+
+    def remove(self, threshold: float, alert_id: int, direction: str):
+        thresholds, ids = (self.above, self.above_ids) if direction == ABOVE else (self.below, self.below_ids)
+        start, end = bisect_left(thresholds, threshold), bisect_right(thresholds, threshold)
+        for position in range(start, end):
+            if ids[position] == alert_id:
+                del thresholds[position]
+                del ids[position]
+                return
+
+    def trigger(self, price: float) -> List[int]:
+        """
+        Pops and returns the alerts `price` has crossed: "above" thresholds at or
+        under it and "below" thresholds at or over it.
+        """
+        crossed_above = bisect_right(self.above, price)
+        crossed_below = bisect_left(self.below, price)
+        fired = self.above_ids[:crossed_above] + self.below_ids[crossed_below:]
+        del self.above[:crossed_above], self.above_ids[:crossed_above]
+        del self.below[crossed_below:], self.below_ids[crossed_below:]
+        return fired
+
+
+class AlertIndex:
+    """
+    In-memory index of the active alerts, by id, by user and by symbol.
+    """
+
+    def __init__(self):
+        self.alerts: Dict[int, Alert] = {}
+        self._by_user: Dict[int, Dict[int, Alert]] = defaultdict(dict)
+        self._by_symbol: Dict[str, _SymbolThresholds] = {}
+
+    def __len__(self) -> int:
+        return len(self.alerts)
+
+    def symbols(self) -> List[str]:
+        return list(self._by_symbol)
+
+    def for_user(self, user_id: int) -> List[Alert]:
+        return sorted(self._by_user.get(user_id, {}).values(), key=lambda alert: alert.alert_id)
+
+    def add(self, alert: Alert):
+        self.alerts[alert.alert_id] = alert
+        self._by_user[alert.user_id][alert.alert_id] = alert
+        thresholds = self._by_symbol.get(alert.symbol)
+        if thresholds is None:
+            thresholds = self._by_symbol[alert.symbol] = _SymbolThresholds()
+        thresholds.add(alert.threshold, alert.alert_id, alert.direction)
+
+    def remove(self, alert_id: int) -> Optional[Alert]:
+        alert = self.alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+        self._forget(alert)
+        thresholds = self._by_symbol[alert.symbol]
+        thresholds.remove(alert.threshold, alert_id, alert.direction)
+        if not thresholds:
+            del self._by_symbol[alert.symbol]
+        return alert
+
+    def trigger(self, symbol: str, price: float) -> List[Alert]:
+        thresholds = self._by_symbol.get(symbol)
+        if thresholds is None:
+            return []
+        fired = [self.alerts.pop(alert_id) for alert_id in thresholds.trigger(price)]
+        for alert in fired:
+            self._forget(alert)
+        if not thresholds:
+            del self._by_symbol[symbol]
+        return fired
+
+    def _forget(self, alert: Alert):
+        alerts = self._by_user[alert.user_id]
+        del alerts[alert.alert_id]
+        if not alerts:
+            del self._by_user[alert.user_id]
+
+
+class AlertEngine:
+    """
+    Checks price alerts against fresh quotes and notifies their owners.
+
+    Runs as a repeating job. Each run fetches one quote per watched symbol,
+    however many alerts follow it, at background priority and through the
+    shared cache. With more than `symbols_per_run` watched symbols, runs take
+    turns through them so the job stays within quota. Alerts are one-shot:
+    fired ones are deleted in one batch and each user gets a single message
+    listing everything that fired for them, through `outbox` when given.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, http_api: HttpStockAPI, interval: float = 60.0,
+                 symbols_per_run: int = 100, max_concurrent_sends: int = 20, outbox: Optional[Outbox] = None):
+        self.db = db_manager
+        self.outbox = outbox
+        self.http_api = http_api
+        self.interval = interval
+        self.symbols_per_run = symbols_per_run
+        self.max_concurrent_sends = max_concurrent_sends
+        self.index = AlertIndex()
+        self._cursor = 0
+        self.checks = 0
+        self.fired = 0
+        self.notified = 0
+
+    def load(self, shard: Tuple[int, int] = (0, 1)) -> int:
+        """
+        Loads the stored alerts. With shard=(index, count), only those of users
+        whose id % count == index: the supervisor routes each user's updates to
+        that worker, so it also handles their /alert commands.
+        """
+        index, count = shard
+        with self.db.get_connection() as conn:
+            rows = conn.execute('SELECT alert_id, user_id, symbol, direction, threshold FROM alerts '
+                                'WHERE user_id % ? = ?', (count, index)).fetchall()
+        for row in rows:
+            self.index.add(Alert(*row))
+        return len(rows)
+
+    async def add(self, user_id: int, symbol: str, direction: str, threshold: float) -> Optional[Alert]:
+        """
+        Stores a new alert, or returns None if the user already has MAX_ALERTS_PER_USER.
+        """
+        if len(self.index.for_user(user_id)) >= MAX_ALERTS_PER_USER:
+            return None
+        alert_id = await self.db.run(self._insert, user_id, symbol, direction, threshold)
+        alert = Alert(alert_id, user_id, symbol, direction, threshold)
+        self.index.add(alert)
+        return alert
+
+    @staticmethod
+    def _insert(conn, user_id: int, symbol: str, direction: str, threshold: float) -> int:
+        return conn.execute('INSERT INTO alerts (user_id, symbol, direction, threshold) VALUES (?, ?, ?, ?)',
+                            (user_id, symbol, direction, threshold)).lastrowid
+
+    async def remove(self, user_id: int, alert_id: int) -> bool:
+        alert = self.index.alerts.get(alert_id)
+        if alert is None or alert.user_id != user_id:
+            return False
+        self.index.remove(alert_id)
+        await self.db.execute('DELETE FROM alerts WHERE alert_id = ?', (alert_id,))
+        return True
+
+    def alerts_for(self, user_id: int) -> List[Alert]:
+        return self.index.for_user(user_id)
+
+    def _next_symbols(self) -> List[str]:
+        symbols = self.index.symbols()
+        if len(symbols) <= self.symbols_per_run:
+            return symbols
+        start = self._cursor % len(symbols)
+        self._cursor = start + self.symbols_per_run
+        return (symbols + symbols)[start:start + self.symbols_per_run]
+
+    async def run(self, context=None):
+        symbols = self._next_symbols()
+        if not symbols:
+            return
+        token = request_priority.set(BACKGROUND)
+        try:
+            quotes = await self.http_api.get_bulk_quotes(symbols)
+        finally:
+            request_priority.reset(token)
+
+        fired: List[Tuple[Alert, float]] = []
+        for symbol, quote in quotes.items():
+            try:
+                price = float(quote['05. price'])
+            except (TypeError, KeyError, ValueError):
+                continue
+            self.checks += 1
+            fired.extend((alert, price) for alert in self.index.trigger(symbol, price))
+        if not fired:
+            return
+
+        self.fired += len(fired)
+        await self.db.executemany('DELETE FROM alerts WHERE alert_id = ?', [(alert.alert_id,) for alert, _ in fired])
+        if context is not None or self.outbox is not None:
+            await self.notify(context.bot if context is not None else None, fired)
+
+    async def notify(self, bot, fired: List[Tuple[Alert, float]]):
+        by_user: Dict[int, List[str]] = defaultdict(list)
+        for alert, price in fired:
+            by_user[alert.user_id].append(f"🔔 {alert.symbol} {alert.direction} {alert.threshold:g} (now {price:g})")
+
+        if self.outbox is not None:
+            for user_id, lines in by_user.items():
+                if self.outbox.send(user_id, "\n".join(lines)):
+                    self.notified += 1
+            return
+
+        slots = asyncio.Semaphore(self.max_concurrent_sends)
+
+        async def send(user_id: int, lines: List[str]):
+            async with slots:
+                try:
+                    await bot.send_message(chat_id=user_id, text="\n".join(lines))
+                    self.notified += 1
+                except Exception as e:
+                    print(f"Failed to send alert to {user_id}: {e}")
+
+        await asyncio.gather(*(send(user_id, lines) for user_id, lines in by_user.items()))
+
+    def stats(self) -> Dict[str, int]:
+        return {'alerts': len(self.index), 'symbols': len(self.index.symbols()), 'checks': self.checks,
+                'fired': self.fired, 'notified': self.notified}
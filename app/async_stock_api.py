@@ -0,0 +1,166 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from app.c_stock_api import StockAPI, _dividend, _holders, _is_transient, _series_function, _week52
+from app.singleflight import AsyncSingleFlight
+from utils.metrics import metrics
+
+
+class AsyncStockAPI:
+    """
+    Async facade over the blocking c_stock_api.StockAPI.
+
+    Cache lookups, coalescing of identical misses and the wait for the request
+    scheduler happen on the event loop. Only the upstream call itself, with its
+    scheduler token already taken, runs on the bounded thread pool, so a slow
+    Alpha Vantage reply does not block the loop and a drained quota does not
+    tie up pool threads. At most `max_in_flight` calls are admitted to the pool
+    at once and each upstream request is abandoned after `timeout` seconds;
+    the alpha_vantage requests themselves time out after the StockAPI's
+    `request_timeout`, which frees their threads.
+    The caller's context (e.g. the request priority) is carried into the
+    worker thread.
+
+    The cached lookups return `(data, stale_age)`: `stale_age` is the age in
+    seconds of the payload `data` was built from if it is a stale entry served
+    because the upstream failed or timed out, else None.
+    """
+
+    def __init__(self, stock_api: StockAPI, max_workers: int = 8, max_in_flight: int = 16,
+                 timeout: float = 15.0):
+        self.stock_api = stock_api
+        self.cache = stock_api.cache
+        self.scheduler = stock_api.scheduler
+        self.resilience = stock_api.resilience
+        self.single_flight = AsyncSingleFlight()
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stock-api')
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+
+    async def _run(self, func: Callable, *args) -> Any:
+        """
+        Runs `func` on the pool. Its in-flight slot is held until the thread
+        returns, even if the caller is cancelled first, so calls that outlive
+        their caller still count against `max_in_flight`.
+        """
+        loop = asyncio.get_running_loop()
+        await self._in_flight.acquire()
+        try:
+            future = self._executor.submit(contextvars.copy_context().run, func, *args)
+        except BaseException:
+            self._in_flight.release()
+            raise
+        future.add_done_callback(lambda _: loop.is_closed() or loop.call_soon_threadsafe(self._in_flight.release))
+        return await asyncio.wrap_future(future)
+
+    async def _scheduled(self, function: str, call: Callable, *args) -> Any:
+        """
+        Same as StockAPI._scheduled, but the scheduler token is awaited here
+        before each attempt takes a pool thread.
+        """
+        return await self.resilience.call(function,
+                                          lambda timeout: self._run(functools.partial(
+                                              self.stock_api._attempt, function, call, *args, timeout=timeout)),
+                                          is_transient=_is_transient,
+                                          acquire=self.scheduler.acquire if self.scheduler is not None else None)
+
+    async def _bounded(self, function: str, request) -> Any:
+        """
+        Awaits `request` for at most `timeout` seconds, scheduler wait included.
+        """
+        try:
+            return await asyncio.wait_for(request, self.timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"{function} timed out after {self.timeout:g}s") from None
+
+    async def _fetch(self, function: str, symbol: str) -> Tuple[Any, Optional[float]]:
+        """
+        Returns the cached payload for (function, symbol), or fetches and caches it.
+        If the upstream fails or times out, the last good payload is returned with its age.
+        """
+        data = self.cache.get(function, symbol)
+        if data is None:
+            data = await self.cache.load(function, symbol)
+        metrics.inc('lookups_total', function=function, result='miss' if data is None else 'hit')
+        if data is not None:
+            return data, None
+        try:
+            return await self.refresh(function, symbol), None
+        except Exception:
+            data = self.cache.get_stale(function, symbol)
+            if data is None:
+                data = await self.cache.load(function, symbol, self.cache.max_stale)
+            if data is None:
+                raise
+            metrics.inc('stale_served_total', function=function)
+            return data, self.cache.staleness(function, symbol)
+
+    async def _get(self, function: str, symbol: str,
+                   view: Optional[Callable[[Any], Any]] = None) -> Tuple[Any, Optional[float]]:
+        try:
+            data, stale_age = await self._fetch(function, symbol)
+            return (data if view is None else view(data)), stale_age
+        except Exception as e:
+            return {"error": str(e)}, None
+
+    async def get_stock_info(self, symbol: str):
+        return await self._get('GLOBAL_QUOTE', symbol)
+
+    async def get_sentiment(self, symbol: str):
+        return await self._get('NEWS_SENTIMENT', symbol)
+
+    async def get_holdings(self, symbol: str):
+        if symbol.startswith("ETF"):
+            return await self._run(self.stock_api.get_holdings, symbol), None
+        return await self._get('OVERVIEW', symbol, _holders)
+
+    async def get_earnings(self, symbol: str):
+        return await self._get('EARNINGS', symbol)
+
+    async def get_dividend(self, symbol: str):
+        return await self._get('OVERVIEW', symbol, _dividend)
+
+    async def get_52week(self, symbol: str):
+        return await self._get('GLOBAL_QUOTE', symbol, _week52)
+
+    async def get_time_series(self, symbol: str, interval: str = 'daily', outputsize: str = 'compact'):
+        """
+        Daily or intraday bars as StockAPI.get_time_series returns them; not cached.
+        """
+        function = _series_function(interval)
+        try:
+            return await self.single_flight.do(
+                (function, symbol, interval, outputsize),
+                lambda: self._bounded(function, self._scheduled(function, self.stock_api._series_call,
+                                                                symbol, interval, outputsize))
+            )
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def warm_up(self):
+        """
+        Imports and builds the alpha_vantage clients on a worker thread.
+        """
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.stock_api.warm_up)
+
+    async def refresh(self, function: str, symbol: str):
+        """
+        Re-fetches (function, symbol) upstream, replacing its cache entry.
+        """
+        return await self.single_flight.do(
+            (function, symbol), lambda: self._bounded(function, self._fetch_upstream(function, symbol))
+        )
+
+    async def _fetch_upstream(self, function: str, symbol: str) -> Any:
+        data = await self._scheduled(function, self.stock_api._upstream_call, function, symbol)
+        self.cache.set(function, symbol, data)
+        return data
+
+    def shutdown(self, wait: bool = False):
+        """
+        Stops the worker threads. Calls still running upstream are left to finish on their own.
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -1,70 +1,251 @@
-from alpha_vantage.timeseries import TimeSeries
-from alpha_vantage.fundamentaldata import FundamentalData
-from alpha_vantage.alphaintelligence import AlphaIntelligence
+import contextvars
+import threading
+import time
+from app.cache import ResponseCache
+from app.singleflight import SingleFlight
+from app.rate_limiter import is_throttle_message
+from app.resilience import Resilience
+from utils.metrics import metrics
+
+
+# Timeout of the alpha_vantage request made by the current attempt; see _TimedRequests.
+_request_timeout = contextvars.ContextVar('request_timeout', default=15.0)
+
+
+class _TimedRequests:
+    """
+    Stands in for the `requests` module inside alpha_vantage, whose clients
+    call requests.get without a timeout, so a hung call would never count as
+    a failure. Each thread keeps its own pooled session.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self, url, **kwargs):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session.get(url, timeout=_request_timeout.get(), **kwargs)
+
+
+def _records(result):
+    """
+    The alpha_vantage client returns some endpoints as a DataFrame whatever the
+    output format; cached payloads are plain lists of dicts.
+    """
+    data, meta = result
+    if hasattr(data, 'to_dict'):
+        data = data.to_dict('records')
+    return data, meta
+
+
+def _holders(overview):
+    return overview.get("InstitutionalHolders", "Institutional holders not available.")
+
+
+def _dividend(overview):
+    return {
+        "DividendPerShare": overview.get("DividendPerShare", "No dividend data available."),
+        "DividendYield": overview.get("DividendYield", "No dividend yield available."),
+        "ExDividendDate": overview.get("ExDividendDate", "No ex-dividend date available."),
+        "DividendDate": overview.get("DividendDate", "No dividend date available."),
+    }
+
+
+def _week52(quote):
+    return {
+        "52_Week_High": quote.get("52WeekHigh", "Data not available"),
+        "52_Week_Low": quote.get("52WeekLow", "Data not available"),
+    }
+
+
+def _series_function(interval):
+    return 'TIME_SERIES_DAILY' if interval == 'daily' else 'TIME_SERIES_INTRADAY'
+
+
+def _is_transient(error):
+    # requests' exceptions derive from OSError. Throttling notes (raised as ValueError) are not
+    # retried here: the scheduler already holds back further calls.
+    return isinstance(error, OSError)
 
 
 class StockAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, cache=None, scheduler=None, base_url=None, resilience=None, request_timeout=15.0):
         self.api_key = api_key
-        self.ts = TimeSeries(key=api_key, output_format='json')
-        self.fd = FundamentalData(key=api_key, output_format='json')
-        self.ai = AlphaIntelligence(key=api_key, output_format='json')
+        self.base_url = base_url
+        self.request_timeout = request_timeout
+        self._clients = None
+        self._clients_lock = threading.Lock()
+        self.cache = cache if cache is not None else ResponseCache()
+        self.single_flight = SingleFlight()
+        self.scheduler = scheduler
+        self.resilience = resilience if resilience is not None else Resilience()
 
-    def get_stock_info(self, symbol):
+    def _client(self, name):
         """
-        Retrieves general stock information, including price, volume, etc.
+        Returns the 'ts', 'fd' or 'ai' alpha_vantage client. They are built on the
+        first upstream call, since importing alpha_vantage loads pandas.
+        """
+        if self._clients is None:
+            with self._clients_lock:
+                if self._clients is None:
+                    from alpha_vantage import alphavantage
+                    from alpha_vantage.alphaintelligence import AlphaIntelligence
+                    from alpha_vantage.alphavantage import AlphaVantage
+                    from alpha_vantage.fundamentaldata import FundamentalData
+                    from alpha_vantage.timeseries import TimeSeries
+                    if self.base_url:
+                        # The alpha_vantage client reads its endpoint from the class, so this is process-wide.
+                        AlphaVantage._ALPHA_VANTAGE_API_URL = self.base_url + '?'
+                    # Process-wide as well: gives every alpha_vantage request a timeout.
+                    alphavantage.requests = _TimedRequests()
+                    self._clients = {
+                        'ts': TimeSeries(key=self.api_key, output_format='json'),
+                        'fd': FundamentalData(key=self.api_key, output_format='json'),
+                        'ai': AlphaIntelligence(key=self.api_key, output_format='json'),
+                    }
+        return self._clients[name]
+
+    def warm_up(self):
+        """
+        Builds the alpha_vantage clients ahead of the first request.
         """
+        self._client('ts')
+
+    @property
+    def ts(self):
+        return self._client('ts')
+
+    @property
+    def fd(self):
+        return self._client('fd')
+
+    @property
+    def ai(self):
+        return self._client('ai')
+
+    def _upstream_call(self, function, symbol):
+        """
+        Calls the alpha_vantage client for (function, symbol).
+        """
+        if function == 'GLOBAL_QUOTE':
+            return self.ts.get_quote_endpoint(symbol)
+        if function == 'NEWS_SENTIMENT':
+            return _records(self.ai.get_news_sentiment(symbol))
+        if function == 'OVERVIEW':
+            return self.fd.get_company_overview(symbol)
+        if function == 'EARNINGS':
+            earnings, meta = _records(self.fd.get_earnings_quarterly(symbol))
+            return {'quarterlyEarnings': earnings}, meta
+        raise ValueError(f"Unsupported function: {function}")
+
+    def _series_call(self, symbol, interval, outputsize):
+        """
+        Calls the alpha_vantage client for daily or intraday bars.
+        """
+        if interval == 'daily':
+            return self.ts.get_daily(symbol, outputsize)
+        return self.ts.get_intraday(symbol, interval, outputsize)
+
+    def _fetch(self, function, symbol):
+        """
+        Returns the cached payload for (function, symbol), or fetches and caches it.
+        Concurrent misses for the same key share one upstream call. Errors are not cached.
+        If the upstream fails, the last good payload is returned; see ResponseCache.staleness.
+        """
+        data = self.cache.get(function, symbol)
+        metrics.inc('lookups_total', function=function, result='miss' if data is None else 'hit')
+        if data is None:
+            try:
+                data = self.refresh(function, symbol)
+            except Exception:
+                data = self.cache.get_stale(function, symbol)
+                if data is None:
+                    raise
+                metrics.inc('stale_served_total', function=function)
+        return data
+
+    def refresh(self, function, symbol):
+        """
+        Fetches (function, symbol) upstream even if cached and replaces the cache entry.
+        """
+        return self.single_flight.do((function, symbol), lambda: self._fetch_upstream(function, symbol))
+
+    def _fetch_upstream(self, function, symbol):
+        data = self._scheduled(function, self._upstream_call, function, symbol)
+        self.cache.set(function, symbol, data)
+        return data
+
+    def _scheduled(self, function, call, *args):
+        """
+        Runs one alpha_vantage client call through the circuit breaker of `function`,
+        retrying transient failures, and returns its data part.
+        """
+        return self.resilience.call_blocking(function,
+                                             lambda timeout: self._attempt(function, call, *args, timeout=timeout),
+                                             _is_transient,
+                                             self.scheduler.acquire_blocking if self.scheduler is not None else None)
+
+    def _attempt(self, function, call, *args, timeout=None):
+        """
+        Makes one alpha_vantage client call, its request bounded by `request_timeout`
+        and the remaining `timeout`, and reports throttling notes to the scheduler.
+        A request that times out raises requests.Timeout, a transient OSError.
+        """
+        timeout = self.request_timeout if timeout is None else min(self.request_timeout, max(timeout, 0.001))
+        token = _request_timeout.set(timeout)
+        started = time.perf_counter()
+        outcome = 'error'
         try:
-            data, _ = self.ts.get_quote_endpoint(symbol)
+            data, _ = call(*args)
+            outcome = 'ok'
             return data
-        except Exception as e:
-            return {"error": str(e)}
+        except ValueError as e:
+            # alpha_vantage raises the "Note"/"Information" text as a ValueError.
+            if is_throttle_message(e):
+                outcome = 'throttled'
+                if self.scheduler is not None:
+                    self.scheduler.on_throttled()
+            raise
+        finally:
+            _request_timeout.reset(token)
+            metrics.observe('upstream_seconds', time.perf_counter() - started, function=function, outcome=outcome)
 
-    def get_sentiment(self, symbol):
+    def get_time_series(self, symbol, interval='daily', outputsize='compact'):
         """
-        Retrieves news sentiment (limited to the latest fundamental news from Alpha Vantage).
+        Retrieves daily or intraday ('1min' ... '60min') OHLCV bars, keyed by timestamp.
+        Not cached here; HistoryStore keeps the parsed series.
         """
+        function = _series_function(interval)
         try:
-            news_data, _ = self.ai.get_news_sentiment(symbol)
-            return news_data.get("LatestQuarter", "No sentiment data available.")
+            return self.single_flight.do(
+                (function, symbol, interval, outputsize),
+                lambda: self._scheduled(function, self._series_call, symbol, interval, outputsize)
+            )
         except Exception as e:
             return {"error": str(e)}
 
-    def get_top_gainers(self):
+    def get_stock_info(self, symbol):
         """
-        Retrieves the top gainers for the day.
+        Retrieves general stock information, including price, volume, etc.
         """
         try:
-            data, _ = self.ai.get_top_gainers()
-            top_10_df = data.head(10)
-
-            formatted_response = "\n".join(
-                [
-                    (
-                        f"Ticker: {row['ticker']}\n"
-                        f"Price: {row['price']}\n"
-                        f"Change Amount: {row['change_amount']}\n"
-                        f"Change Percentage: {row['change_percentage']}%\n"
-                        f"Volume: {row['volume']}\n"
-                        "-----------------------------"
-                    )
-                    for _, row in top_10_df.iterrows()
-                ]
-            )
-
-            return formatted_response
+            return self._fetch('GLOBAL_QUOTE', symbol)
         except Exception as e:
             return {"error": str(e)}
 
-    def get_top_losers(self):
+    def get_sentiment(self, symbol):
         """
-        Retrieves the top losers for the day.
+        Retrieves news sentiment (limited to the latest fundamental news from Alpha Vantage).
         """
         try:
-            data, _ = self.ai.get_top_losers()
-            return data
+            # The client already unwraps the payload to its article feed.
+            return self._fetch('NEWS_SENTIMENT', symbol)
         except Exception as e:
             return {"error": str(e)}
+
     def get_holdings(self, symbol):
         """
         Retrieves ETF holdings or equity holders.
@@ -74,8 +255,7 @@ class StockAPI:
                 data, _ = self.fd.get_etf_sector_performance()
                 return data
             else:
-                data, _ = self.fd.get_company_overview(symbol)
-                return data.get("InstitutionalHolders", "Institutional holders not available.")
+                return _holders(self._fetch('OVERVIEW', symbol))
         except Exception as e:
             return {"error": str(e)}
 
@@ -84,8 +264,7 @@ class StockAPI:
         Retrieves earnings data for a stock.
         """
         try:
-            data, _ = self.fd.get_earnings(symbol)
-            return data
+            return self._fetch('EARNINGS', symbol)
         except Exception as e:
             return {"error": str(e)}
 
@@ -94,13 +273,7 @@ class StockAPI:
         Retrieves dividend data for a stock.
         """
         try:
-            data, _ = self.fd.get_company_overview(symbol)
-            return {
-                "DividendPerShare": data.get("DividendPerShare", "No dividend data available."),
-                "DividendYield": data.get("DividendYield", "No dividend yield available."),
-                "ExDividendDate": data.get("ExDividendDate", "No ex-dividend date available."),
-                "DividendDate": data.get("DividendDate", "No dividend date available."),
-            }
+            return _dividend(self._fetch('OVERVIEW', symbol))
         except Exception as e:
             return {"error": str(e)}
 
@@ -109,11 +282,7 @@ class StockAPI:
         Retrieves the 52-week high and low for a stock.
         """
         try:
-            data, _ = self.ts.get_quote_endpoint(symbol)
-            return {
-                "52_Week_High": data.get("52WeekHigh", "Data not available"),
-                "52_Week_Low": data.get("52WeekLow", "Data not available"),
-            }
+            return _week52(self._fetch('GLOBAL_QUOTE', symbol))
         except Exception as e:
             return {"error": str(e)}
 
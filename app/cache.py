@@ -0,0 +1,225 @@
+import itertools
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Seconds each Alpha Vantage function stays fresh. Quotes move all day,
+# fundamentals change a few times a quarter.
+DEFAULT_TTLS = {
+    'GLOBAL_QUOTE': 30,
+    'TOP_GAINERS_LOSERS': 5 * 60,
+    'NEWS_SENTIMENT': 15 * 60,
+    'OVERVIEW': 6 * 60 * 60,
+    'EARNINGS': 6 * 60 * 60,
+    'EARNINGS_CALENDAR': 6 * 60 * 60,
+    'INSTITUTIONAL_HOLDERS': 24 * 60 * 60,
+    'ETF_HOLDINGS': 24 * 60 * 60,
+}
+DEFAULT_TTL = 60
+
+# Seconds an expired payload is kept to answer with while the upstream is failing.
+DEFAULT_MAX_STALE = 24 * 60 * 60
+
+CacheKey = Tuple[str, Optional[str]]
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Rough deep size of a decoded JSON payload in bytes.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+
+class _Entry:
+    __slots__ = ('value', 'stored_at', 'expires_at', 'size', 'version')
+
+    def __init__(self, value: Any, stored_at: float, expires_at: float, size: int, version: int):
+        self.value = value
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+        self.size = size
+        self.version = version
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache for Alpha Vantage payloads, keyed by (function, symbol).
+
+    Values are the payloads as the StockAPI methods consume them, so both
+    StockAPI implementations can share one instance. Entries are evicted
+    least-recently-used first once either `max_entries` or `max_bytes` is
+    exceeded. Thread-safe, since c_stock_api runs on an executor.
+
+    Expired entries are misses for `get`, but are kept for up to `max_stale`
+    seconds past expiry so `get_stale` can serve them when a refresh fails.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024,
+                 ttls: Optional[Dict[str, float]] = None, default_ttl: float = DEFAULT_TTL,
+                 max_stale: float = DEFAULT_MAX_STALE):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_stale = max_stale
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.default_ttl = default_ttl
+        # Called as on_set(function, symbol, value) after every set(); restore() skips it.
+        self.on_set: Optional[Callable[[str, Optional[str], Any], None]] = None
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._versions = itertools.count(1)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+
+    def ttl_for(self, function: str) -> float:
+        return self.ttls.get(function, self.default_ttl)
+
+    def get(self, function: str, symbol: Optional[str] = None) -> Optional[Any]:
+        key = (function, symbol)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            now = time.monotonic()
+            if entry.expires_at <= now:
+                if entry.expires_at + self.max_stale <= now:
+                    self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def expires_in(self, function: str, symbol: Optional[str] = None) -> Optional[float]:
+        """
+        Seconds until (function, symbol) expires, or None if it is not cached.
+        Does not count as a lookup and does not touch the LRU order.
+        """
+        with self._lock:
+            entry = self._entries.get((function, symbol))
+            if entry is None:
+                return None
+            return max(0.0, entry.expires_at - time.monotonic())
+
+    def get_stale(self, function: str, symbol: Optional[str] = None) -> Optional[Any]:
+        """
+        The last value stored for (function, symbol), even if expired, or None
+        if there is none or it is more than `max_stale` seconds past expiry.
+        """
+        key = (function, symbol)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at + self.max_stale <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self.stale_hits += 1
+            return entry.value
+
+    async def load(self, function: str, symbol: Optional[str] = None, max_stale: float = 0.0) -> Optional[Any]:
+        """
+        Looks (function, symbol) up in a store shared with other processes after
+        a local miss, accepting values up to `max_stale` seconds past expiry.
+        ResponseCache has no such store.
+        """
+        return None
+
+    def staleness(self, function: str, symbol: Optional[str] = None) -> Optional[float]:
+        """
+        Age in seconds of the value stored for (function, symbol) if it has
+        expired, None if it is fresh or not cached.
+        """
+        with self._lock:
+            entry = self._entries.get((function, symbol))
+            now = time.monotonic()
+            if entry is None or entry.expires_at > now:
+                return None
+            return now - entry.stored_at
+
+    def version(self, function: str, symbol: Optional[str] = None) -> Optional[int]:
+        """
+        Number identifying the fresh value stored for (function, symbol), or None.
+        It changes whenever the value is replaced, so it can key derived data.
+        """
+        with self._lock:
+            entry = self._entries.get((function, symbol))
+            if entry is None or entry.expires_at <= time.monotonic():
+                return None
+            return entry.version
+
+    def set(self, function: str, symbol: Optional[str], value: Any, ttl: Optional[float] = None):
+        if value is None:
+            return
+        if ttl is None:
+            ttl = self.ttl_for(function)
+        if self.restore(function, symbol, value, ttl) and self.on_set is not None:
+            self.on_set(function, symbol, value)
+
+    def restore(self, function: str, symbol: Optional[str], value: Any, ttl: float, age: float = 0.0) -> bool:
+        """
+        Stores a value without notifying `on_set`, e.g. when warming from disk
+        with a value fetched `age` seconds ago. Returns False if the value is
+        too large to cache.
+        """
+        key = (function, symbol)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            now = time.monotonic()
+            self._entries[key] = _Entry(value, now - age, now + ttl, size, next(self._versions))
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, function: str, symbol: Optional[str] = None):
+        with self._lock:
+            if (function, symbol) in self._entries:
+                self._remove((function, symbol))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: CacheKey):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'stale_hits': self.stale_hits,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
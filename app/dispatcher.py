@@ -0,0 +1,118 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+from functools import wraps
+from typing import Dict, Hashable
+
+from telegram import Update
+from telegram.ext import Application
+
+from utils.metrics import SlowRequestProfiler, metrics
+
+
+class HandlerLatency:
+    """
+    Per-handler latency samples, kept in a bounded window for percentiles.
+
+    `timed` also feeds the handler_seconds histogram and runs the callback
+    under the slow-request profiler.
+    """
+
+    def __init__(self, window: int = 1024, profiler: SlowRequestProfiler = None):
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._counts: Dict[str, int] = defaultdict(int)
+        self.profiler = profiler or SlowRequestProfiler()
+
+    def record(self, name: str, seconds: float):
+        self._samples[name].append(seconds)
+        self._counts[name] += 1
+
+    def timed(self, name: str, callback):
+        @wraps(callback)
+        async def wrapped(update, context, *args, **kwargs):
+            started = time.perf_counter()
+            detail = ' '.join(context.args or []) if context is not None else ''
+            try:
+                with self.profiler.profile(name, detail):
+                    return await callback(update, context, *args, **kwargs)
+            except Exception:
+                metrics.inc('handler_errors_total', handler=name)
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                self.record(name, elapsed)
+                metrics.observe('handler_seconds', elapsed, handler=name)
+
+        return wrapped
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        stats = {}
+        for name, samples in self._samples.items():
+            ordered = sorted(samples)
+            stats[name] = {
+                'count': self._counts[name],
+                'avg_ms': sum(ordered) / len(ordered) * 1000,
+                'p50_ms': ordered[len(ordered) // 2] * 1000,
+                'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+                'max_ms': ordered[-1] * 1000,
+            }
+        return stats
+
+
+class OrderedApplication(Application):
+    """
+    Application that processes updates from different chats concurrently while
+    updates from the same chat run one after another, in arrival order.
+
+    At most `max_concurrent_updates` handlers run at once. Once
+    `max_pending_updates` updates are accepted but unfinished, `process_update`
+    waits, which stalls the update fetcher or the webhook request.
+    """
+
+    def __init__(self, max_concurrent_updates: int = 32, max_pending_updates: int = 1000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_concurrent_updates = max_concurrent_updates
+        self._running_slots = asyncio.Semaphore(max_concurrent_updates)
+        self._pending_slots = asyncio.Semaphore(max_pending_updates)
+        self._chat_queues: Dict[Hashable, deque] = {}
+        self.latency = HandlerLatency()
+
+    @staticmethod
+    def _ordering_key(update: object) -> Hashable:
+        if isinstance(update, Update):
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+            if update.effective_user is not None:
+                return ('user', update.effective_user.id)
+        # Updates without a chat or user have nothing to be ordered against.
+        return object()
+
+    async def process_update(self, update: object) -> None:
+        await self._pending_slots.acquire()
+        key = self._ordering_key(update)
+        queue = self._chat_queues.get(key)
+        if queue is not None:
+            queue.append((update, time.perf_counter()))
+            return
+        self._chat_queues[key] = deque([(update, time.perf_counter())])
+        self.create_task(self._drain(key))
+
+    async def _drain(self, key: Hashable):
+        queue = self._chat_queues[key]
+        try:
+            while queue:
+                update, queued_at = queue[0]
+                async with self._running_slots:
+                    waited = time.perf_counter() - queued_at
+                    self.latency.record('queue_wait', waited)
+                    metrics.observe('update_queue_wait_seconds', waited)
+                    try:
+                        await super().process_update(update)
+                    finally:
+                        queue.popleft()
+                        self._pending_slots.release()
+        finally:
+            del self._chat_queues[key]
+
+    def pending_updates(self) -> int:
+        return sum(len(queue) for queue in self._chat_queues.values())
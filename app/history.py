@@ -0,0 +1,203 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.async_stock_api import AsyncStockAPI
+from app.indicators import ema, rsi_averages, rsi_from_averages
+from app.singleflight import AsyncSingleFlight
+
+INTRADAY_INTERVALS = ('1min', '5min', '15min', '30min', '60min')
+
+# Seconds a series is served before new bars are requested.
+DEFAULT_SERIES_TTLS = {'daily': 60 * 60, **{interval: 5 * 60 for interval in INTRADAY_INTERVALS}}
+
+# Field names of the alpha_vantage TIME_SERIES_* bars, in PriceSeries column order.
+BAR_FIELDS = ('1. open', '2. high', '3. low', '4. close', '5. volume')
+
+
+class PriceSeries:
+    """
+    OHLCV bars of one symbol and interval as column arrays, oldest first.
+    """
+    __slots__ = ('interval', 'last_key', 'timestamps', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, interval: str):
+        self.interval = interval
+        self.last_key = ''
+        self.timestamps = np.empty(0, dtype='datetime64[s]')
+        self.open = self.high = self.low = self.close = self.volume = np.empty(0)
+
+    def __len__(self) -> int:
+        return len(self.close)
+
+    @staticmethod
+    def _columns(payload: Dict[str, Dict[str, str]], keys: list) -> Tuple[np.ndarray, ...]:
+        bars = np.array([[payload[key][field] for field in BAR_FIELDS] for key in keys], dtype=float).reshape(-1, 5)
+        return (np.array(keys, dtype='datetime64[s]'),) + tuple(bars.T)
+
+    def extend(self, payload: Dict[str, Dict[str, str]], max_bars: int) -> Optional[Tuple[int, int]]:
+        """
+        Adds the bars of `payload` that are not older than the last stored bar; the
+        last bar itself is replaced, since today's daily bar keeps changing.
+
+        Returns the index of the first bar that changed and how many bars were
+        dropped from the front to stay within `max_bars`. Returns None when the
+        payload does not reach back to the stored bars and the series must be rebuilt.
+        """
+        if self.last_key and min(payload) > self.last_key:
+            return None
+        keys = sorted(key for key in payload if key >= self.last_key)
+        if not keys:
+            return len(self), 0
+        changed_from = len(self) - 1 if keys[0] == self.last_key else len(self)
+        columns = self._columns(payload, keys)
+        names = ('timestamps', 'open', 'high', 'low', 'close', 'volume')
+        for name, column in zip(names, columns):
+            merged = np.concatenate((getattr(self, name)[:changed_from], column))
+            setattr(self, name, merged)
+        self.last_key = keys[-1]
+        overflow = max(0, len(self) - max_bars)
+        if overflow:
+            for name in names:
+                setattr(self, name, getattr(self, name)[overflow:])
+        return max(0, changed_from - overflow), overflow
+
+
+class IndicatorState:
+    """
+    Running EMA-based indicators over a PriceSeries.
+
+    `sync` only computes the bars from the first changed one on, continuing each
+    average from its previous value, so new bars never recompute the history.
+    Window indicators (SMA, returns, volatility) need just the tail and are
+    computed on read.
+    """
+    __slots__ = ('ema_fast', 'ema_slow', 'macd_signal', 'avg_gain', 'avg_loss', 'fast', 'slow', 'signal', 'rsi_period')
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9, rsi_period: int = 14):
+        self.fast, self.slow, self.signal, self.rsi_period = fast, slow, signal, rsi_period
+        self.ema_fast = self.ema_slow = self.macd_signal = self.avg_gain = self.avg_loss = np.empty(0)
+
+    def sync(self, series: PriceSeries, changed_from: int, trimmed: int = 0):
+        """
+        Brings the indicators up to date after `series.extend`. `trimmed` is how
+        many bars were dropped from the front.
+        """
+        if trimmed:
+            for name in ('ema_fast', 'ema_slow', 'macd_signal', 'avg_gain', 'avg_loss'):
+                setattr(self, name, getattr(self, name)[trimmed:])
+        close = series.close
+        start = min(changed_from, len(self.ema_fast))
+        new = close[start:]
+        if not len(new):
+            return
+        if start == 0:
+            fast, slow = ema(close, self.fast), ema(close, self.slow)
+            self.ema_fast, self.ema_slow, self.macd_signal = fast, slow, ema(fast - slow, self.signal)
+            self.avg_gain, self.avg_loss = rsi_averages(close, self.rsi_period)
+            return
+        fast = ema(new, self.fast, initial=self.ema_fast[start - 1])
+        slow = ema(new, self.slow, initial=self.ema_slow[start - 1])
+        signal = ema(fast - slow, self.signal, initial=self.macd_signal[start - 1])
+        gain, loss = rsi_averages(new, self.rsi_period, previous=(self.avg_gain[start - 1], self.avg_loss[start - 1]),
+                                  last_close=close[start - 1])
+        self.ema_fast = np.concatenate((self.ema_fast[:start], fast))
+        self.ema_slow = np.concatenate((self.ema_slow[:start], slow))
+        self.macd_signal = np.concatenate((self.macd_signal[:start], signal))
+        self.avg_gain = np.concatenate((self.avg_gain[:start], gain))
+        self.avg_loss = np.concatenate((self.avg_loss[:start], loss))
+
+    def latest(self) -> Dict[str, float]:
+        if not len(self.ema_fast):
+            return {}
+        line = self.ema_fast[-1] - self.ema_slow[-1]
+        return {
+            f'ema{self.fast}': float(self.ema_fast[-1]),
+            f'ema{self.slow}': float(self.ema_slow[-1]),
+            'macd': float(line),
+            'macd_signal': float(self.macd_signal[-1]),
+            'macd_hist': float(line - self.macd_signal[-1]),
+            f'rsi{self.rsi_period}': float(rsi_from_averages(self.avg_gain[-1:], self.avg_loss[-1:])[0]),
+        }
+
+
+class _CachedSeries:
+    __slots__ = ('series', 'indicators', 'fetched_at')
+
+    def __init__(self, series: PriceSeries):
+        self.series = series
+        self.indicators = IndicatorState()
+        self.fetched_at = 0.0
+
+
+class HistoryStore:
+    """
+    Per-symbol price history with indicators, extended incrementally.
+
+    The first request for a (symbol, interval) downloads `initial_outputsize`
+    bars. Once the series is older than its TTL, the next request fetches only
+    the compact (latest 100 bars) payload and appends the new bars; a series
+    that payload no longer reaches is rebuilt from it, or downloaded again if
+    `initial_outputsize` is 'full'. The `max_series` most recently used series
+    are kept.
+    """
+
+    def __init__(self, stock_api: AsyncStockAPI, initial_outputsize: str = 'compact', max_series: int = 200,
+                 max_bars: int = 8000, ttls: Optional[Dict[str, float]] = None):
+        self.stock_api = stock_api
+        self.initial_outputsize = initial_outputsize
+        self.max_series = max_series
+        self.max_bars = max_bars
+        self.ttls = dict(DEFAULT_SERIES_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.single_flight = AsyncSingleFlight()
+        self._series: "OrderedDict[Tuple[str, str], _CachedSeries]" = OrderedDict()
+        self.downloads = 0
+        self.appended_bars = 0
+
+    async def get(self, symbol: str, interval: str = 'daily') -> Any:
+        """
+        Returns the up-to-date _CachedSeries, or an {"error": ...} dict when nothing is cached.
+        """
+        key = (symbol, interval)
+        cached = self._series.get(key)
+        if cached is not None and time.monotonic() - cached.fetched_at < self.ttls[interval]:
+            self._series.move_to_end(key)
+            return cached
+        return await self.single_flight.do(key, lambda: self._update(key, cached))
+
+    async def _update(self, key: Tuple[str, str], cached: Optional[_CachedSeries]) -> Any:
+        symbol, interval = key
+        outputsize = self.initial_outputsize if cached is None else 'compact'
+        payload = await self.stock_api.get_time_series(symbol, interval, outputsize)
+        if not isinstance(payload, dict) or 'error' in payload or not payload:
+            # Serve the old bars rather than nothing.
+            return cached if cached is not None else (payload or {"error": f"No data for {symbol}"})
+        self.downloads += 1
+
+        before = len(cached.series) if cached is not None else 0
+        extended = cached.series.extend(payload, self.max_bars) if cached is not None else None
+        if extended is None:
+            if cached is not None and self.initial_outputsize != 'compact':
+                # Too far behind for the compact payload; download the full history again.
+                return await self._update(key, None)
+            # A compact first download would fetch just this payload, so rebuild from it.
+            before = 0
+            cached = _CachedSeries(PriceSeries(interval))
+            extended = cached.series.extend(payload, self.max_bars)
+        changed_from, trimmed = extended
+        self.appended_bars += len(cached.series) + trimmed - before
+        cached.indicators.sync(cached.series, changed_from, trimmed)
+        cached.fetched_at = time.monotonic()
+
+        self._series[key] = cached
+        self._series.move_to_end(key)
+        while len(self._series) > self.max_series:
+            self._series.popitem(last=False)
+        return cached
+
+    def stats(self) -> Dict[str, int]:
+        return {'series': len(self._series), 'downloads': self.downloads, 'appended_bars': self.appended_bars}
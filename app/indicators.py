@@ -0,0 +1,131 @@
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Trading days per year, for annualizing volatility.
+TRADING_DAYS = 252
+
+SPARK_BLOCKS = '▁▂▃▄▅▆▇█'
+
+
+def sma(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    Simple moving average; NaN until `period` values are available.
+    """
+    out = np.full(len(values), np.nan)
+    if len(values) < period:
+        return out
+    sums = np.cumsum(values, dtype=float)
+    out[period - 1] = sums[period - 1]
+    out[period:] = sums[period:] - sums[:-period]
+    out[period - 1:] /= period
+    return out
+
+
+def ema(values: np.ndarray, period: int = None, alpha: float = None, initial: Optional[float] = None) -> np.ndarray:
+    """
+    Exponential moving average with y[i] = alpha * x[i] + (1 - alpha) * y[i-1].
+
+    `alpha` defaults to 2 / (period + 1). Without `initial` the series is seeded
+    with its first value; with it, the average continues from a previous run,
+    which is how cached indicators are extended by new bars only.
+
+    The recurrence is evaluated block by block in closed form. Blocks are short
+    enough that (1 - alpha) ** -n stays within float precision.
+    """
+    if alpha is None:
+        alpha = 2.0 / (period + 1)
+    values = np.asarray(values, dtype=float)
+    out = np.empty(len(values))
+    if not len(values):
+        return out
+    if initial is None:
+        initial, values, out[0] = values[0], values[1:], values[0]
+        start = 1
+    else:
+        start = 0
+    decay = 1.0 - alpha
+    block = len(values) if decay <= 0 else max(1, int(20 / -math.log(decay)))
+    previous = initial
+    for offset in range(0, len(values), block):
+        chunk = values[offset:offset + block]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        # y[i] = decay^(i+1) * previous + alpha * sum_j decay^(i-j) x[j]
+        weighted = np.cumsum(chunk / powers * decay)
+        result = powers * previous + alpha * powers / decay * weighted
+        out[start + offset:start + offset + len(chunk)] = result
+        previous = result[-1]
+    return out
+
+
+def rsi_averages(close: np.ndarray, period: int = 14, previous: Tuple[float, float] = None,
+                 last_close: float = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Wilder-smoothed average gains and losses per bar. `previous` and `last_close`
+    continue the averages from an earlier run.
+    """
+    if last_close is not None:
+        changes = np.diff(np.concatenate(([last_close], close)))
+    else:
+        changes = np.diff(close, prepend=close[:1])
+    gains = np.clip(changes, 0, None)
+    losses = np.clip(-changes, 0, None)
+    alpha = 1.0 / period
+    if previous is None:
+        return ema(gains, alpha=alpha), ema(losses, alpha=alpha)
+    return ema(gains, alpha=alpha, initial=previous[0]), ema(losses, alpha=alpha, initial=previous[1])
+
+
+def rsi_from_averages(avg_gain: np.ndarray, avg_loss: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+    return np.where(avg_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + rs))
+
+
+def rsi(close: np.ndarray, period: int = 14) -> np.ndarray:
+    return rsi_from_averages(*rsi_averages(close, period))
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    MACD line, signal line and histogram.
+    """
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def period_return(close: np.ndarray, bars: int) -> float:
+    """
+    Fractional change over the last `bars` bars, NaN if the series is shorter.
+    """
+    if len(close) <= bars:
+        return float('nan')
+    return float(close[-1] / close[-1 - bars] - 1.0)
+
+
+def volatility(close: np.ndarray, bars: int = 21, periods_per_year: int = TRADING_DAYS) -> float:
+    """
+    Annualized standard deviation of log returns over the last `bars` bars.
+    """
+    if len(close) <= bars:
+        return float('nan')
+    log_returns = np.diff(np.log(close[-bars - 1:]))
+    return float(np.std(log_returns, ddof=1) * math.sqrt(periods_per_year))
+
+
+def sparkline(values: np.ndarray, width: int = 30) -> str:
+    """
+    One-line text chart of `values`, resampled to at most `width` points.
+    """
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return ''
+    if len(values) > width:
+        values = values[np.linspace(0, len(values) - 1, width).round().astype(int)]
+    low, high = values.min(), values.max()
+    if high == low:
+        return SPARK_BLOCKS[0] * len(values)
+    levels = ((values - low) / (high - low) * (len(SPARK_BLOCKS) - 1)).round().astype(int)
+    return ''.join(SPARK_BLOCKS[level] for level in levels)
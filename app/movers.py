@@ -0,0 +1,71 @@
+from array import array
+from typing import Any, Dict, List, Optional
+
+SECTIONS = ('top_gainers', 'top_losers', 'most_actively_traded')
+DEFAULT_COUNT = 10
+SEPARATOR = "-----------------------------"
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(str(value).rstrip('%'))
+    except ValueError:
+        return float('nan')
+
+
+def format_mover(row: Dict[str, Any]) -> str:
+    change_percentage = str(row.get('change_percentage', ''))
+    if not change_percentage.endswith('%'):
+        change_percentage += '%'
+    return (
+        f"Ticker: {row.get('ticker')}\n"
+        f"Price: {row.get('price')}\n"
+        f"Change Amount: {row.get('change_amount')}\n"
+        f"Change Percentage: {change_percentage}\n"
+        f"Volume: {row.get('volume')}\n"
+        f"{SEPARATOR}"
+    )
+
+
+class MoverList:
+    """
+    One TOP_GAINERS_LOSERS section held as columns, with every row rendered once.
+
+    Price and volume live in arrays so filters scan plain floats. The default
+    top-N reply is joined up front and reused for every request.
+    """
+    __slots__ = ('tickers', 'prices', 'volumes', 'lines', 'text')
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.tickers = [row.get('ticker') for row in rows]
+        self.prices = array('d', (_number(row.get('price')) for row in rows))
+        self.volumes = array('d', (_number(row.get('volume')) for row in rows))
+        self.lines = [format_mover(row) for row in rows]
+        self.text = "\n".join(self.lines[:DEFAULT_COUNT])
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def render(self, count: int = DEFAULT_COUNT, min_volume: float = 0.0, min_price: float = 0.0) -> str:
+        if count == DEFAULT_COUNT and not min_volume and not min_price:
+            return self.text
+        if min_volume or min_price:
+            lines = [line for line, price, volume in zip(self.lines, self.prices, self.volumes)
+                     if price >= min_price and volume >= min_volume]
+        else:
+            lines = self.lines
+        return "\n".join(lines[:count])
+
+
+class MarketMovers:
+    """
+    All sections of one TOP_GAINERS_LOSERS payload, parsed once per refresh.
+    """
+    __slots__ = ('last_updated', 'sections')
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.last_updated: Optional[str] = payload.get('last_updated')
+        self.sections = {section: MoverList(payload.get(section) or []) for section in SECTIONS}
+
+    def __getitem__(self, section: str) -> MoverList:
+        return self.sections[section]
@@ -0,0 +1,287 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from app.rate_limiter import BACKGROUND, INTERACTIVE, TokenBucket
+from utils.metrics import metrics
+
+# Telegram's documented flood limits: about 30 messages per second overall,
+# one per second in a private chat and 20 per minute in a group.
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+GROUP_RATE = 20 / 60
+
+# Per-chat buckets kept before idle ones are dropped.
+MAX_IDLE_CHATS = 10000
+
+
+class Broadcast:
+    """
+    Delivery progress of one message sent to many chats.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+    def _record(self, delivered: bool):
+        if delivered:
+            self.sent += 1
+        else:
+            self.failed += 1
+        if self.sent + self.failed >= self.total:
+            self.finished_at = time.monotonic()
+            self.done.set()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def summary(self) -> str:
+        rate = self.sent / self.elapsed if self.elapsed else 0.0
+        return (f"Delivered {self.sent}/{self.total} in {self.elapsed:.1f}s ({rate:.1f} msg/s), "
+                f"failed {self.failed}")
+
+
+class _Message:
+    __slots__ = ('chat_id', 'text', 'kwargs', 'broadcast', 'priority', 'attempts')
+
+    def __init__(self, chat_id: int, text: str, kwargs: Dict[str, Any], broadcast: Optional[Broadcast],
+                 priority: int):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.broadcast = broadcast
+        self.priority = priority
+        self.attempts = 0
+
+
+class Outbox:
+    """
+    Queue for outbound Telegram messages, sent by `workers` concurrent tasks
+    within the global and per-chat flood limits.
+
+    Messages wait in per-chat queues and chats take turns, so one busy chat
+    does not hold up the others and each chat gets its messages in order.
+    Chats whose next message is INTERACTIVE (admin notices, alerts) go before
+    those waiting on a BACKGROUND broadcast.
+    A RetryAfter from Telegram pauses all sending for the time it asks for and
+    the message is retried. At most `max_queue` messages are held: `send`
+    drops messages beyond that, `put` and `broadcast` wait for room.
+    """
+
+    def __init__(self, max_queue: int = 10000, workers: int = 30, global_rate: float = GLOBAL_RATE,
+                 chat_rate: float = CHAT_RATE, group_rate: float = GROUP_RATE, max_attempts: int = 3):
+        self.max_queue = max_queue
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_attempts = max_attempts
+        self.bot = None
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._pending: Dict[int, Deque[_Message]] = {}
+        self._ready: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._size = 0
+        self._not_full = asyncio.Condition()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._paused_until = 0.0
+        self._tasks: List[asyncio.Task] = []
+        self._feeders = set()
+        self._recent: Deque[float] = deque()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+        self.flood_waits = 0
+
+    def start(self, bot):
+        self.bot = bot
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 5.0):
+        """
+        Waits up to `timeout` seconds for queued messages to go out, then stops the workers.
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Outbox stopped with {self._size} unsent messages")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def send(self, chat_id: int, text: str, priority: int = INTERACTIVE, **kwargs) -> bool:
+        """
+        Queues a message without waiting. Returns False if the queue is full.
+        """
+        if self._size >= self.max_queue:
+            self.dropped += 1
+            metrics.inc('outbound_messages_total', outcome='dropped')
+            return False
+        self._enqueue(_Message(chat_id, text, kwargs, None, priority))
+        return True
+
+    async def put(self, chat_id: int, text: str, priority: int = INTERACTIVE, broadcast: Optional[Broadcast] = None,
+                  **kwargs):
+        """
+        Queues a message, waiting while the queue is full.
+        """
+        async with self._not_full:
+            await self._not_full.wait_for(lambda: self._size < self.max_queue)
+            self._enqueue(_Message(chat_id, text, kwargs, broadcast, priority))
+
+    def broadcast(self, chat_ids: Iterable[int], text: str, **kwargs) -> Broadcast:
+        """
+        Sends `text` to every chat in `chat_ids`. Queuing runs in the background;
+        the returned Broadcast tracks delivery.
+        """
+        chat_ids = list(dict.fromkeys(chat_ids))
+        broadcast = Broadcast(len(chat_ids))
+        if not chat_ids:
+            broadcast.done.set()
+            return broadcast
+
+        async def enqueue():
+            for chat_id in chat_ids:
+                await self.put(chat_id, text, BACKGROUND, broadcast, **kwargs)
+
+        task = asyncio.create_task(enqueue())
+        self._feeders.add(task)
+        task.add_done_callback(self._feeders.discard)
+        return broadcast
+
+    def _enqueue(self, message: _Message):
+        self._size += 1
+        self._idle.clear()
+        queue = self._pending.get(message.chat_id)
+        if queue is None:
+            # The chat was idle; it goes to the back of the line.
+            self._pending[message.chat_id] = deque([message])
+            self._schedule(message.chat_id)
+        else:
+            queue.append(message)
+
+    def _schedule(self, chat_id: int):
+        self._ready.put_nowait((self._pending[chat_id][0].priority, next(self._seq), chat_id))
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_IDLE_CHATS:
+                self._forget_idle_chats()
+            # Group and channel ids are negative; channels may also be given as @username.
+            rate = self.group_rate if str(chat_id).startswith(('-', '@')) else self.chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(1, rate)
+        return bucket
+
+    def _forget_idle_chats(self):
+        now = time.monotonic()
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            if chat_id not in self._pending and bucket.time_until_available(now) == 0:
+                del self._chat_buckets[chat_id]
+
+    async def _acquire(self, chat_id: int):
+        bucket = self._chat_bucket(chat_id)
+        while True:
+            now = time.monotonic()
+            delay = max(self._paused_until - now, bucket.time_until_available(now),
+                        self._global.time_until_available(now))
+            if delay <= 0:
+                bucket.consume()
+                self._global.consume()
+                return
+            await asyncio.sleep(delay)
+
+    async def _worker(self):
+        while True:
+            _, _, chat_id = await self._ready.get()
+            queue = self._pending[chat_id]
+            message = queue[0]
+            await self._acquire(chat_id)
+            if await self._deliver(message):
+                queue.popleft()
+                await self._finished()
+            if queue:
+                self._schedule(chat_id)
+            else:
+                del self._pending[chat_id]
+
+    async def _deliver(self, message: _Message) -> bool:
+        """
+        Sends one message. Returns False if it should be retried.
+        """
+        message.attempts += 1
+        started = time.perf_counter()
+        try:
+            await self.bot.send_message(chat_id=message.chat_id, text=message.text, **message.kwargs)
+        except RetryAfter as e:
+            self.flood_waits += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + float(e.retry_after))
+            return self._retry('flood_wait')
+        except (BadRequest, Forbidden) as e:
+            # Blocked the bot, chat not found and the like; retrying will not help.
+            self._fail(message, e)
+            return True
+        except Exception as e:
+            if message.attempts < self.max_attempts:
+                await asyncio.sleep(min(2.0 ** message.attempts, 30.0))
+                return self._retry('error')
+            self._fail(message, e)
+            return True
+        metrics.observe('outbound_send_seconds', time.perf_counter() - started)
+        metrics.inc('outbound_messages_total', outcome='sent')
+        self.sent += 1
+        now = time.monotonic()
+        self._recent.append(now)
+        while self._recent and self._recent[0] < now - 60:
+            self._recent.popleft()
+        if message.broadcast is not None:
+            message.broadcast._record(True)
+        return True
+
+    def _retry(self, reason: str) -> bool:
+        self.retried += 1
+        metrics.inc('outbound_messages_total', outcome=reason)
+        return False
+
+    def _fail(self, message: _Message, error: Exception):
+        self.failed += 1
+        metrics.inc('outbound_messages_total', outcome='failed')
+        print(f"Failed to send message to {message.chat_id}: {error}")
+        if message.broadcast is not None:
+            message.broadcast._record(False)
+
+    async def _finished(self):
+        self._size -= 1
+        if not self._size:
+            self._idle.set()
+        async with self._not_full:
+            self._not_full.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        recent = sum(1 for sent_at in self._recent if sent_at >= now - 60)
+        return {
+            'queued': self._size,
+            'chats_waiting': len(self._pending),
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'retried': self.retried,
+            'flood_waits': self.flood_waits,
+            'sent_last_minute': recent,
+            'paused_for': round(max(0.0, self._paused_until - now), 1),
+        }
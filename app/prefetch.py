@@ -0,0 +1,100 @@
+import math
+import time
+from typing import Dict, List
+
+from app.async_stock_api import AsyncStockAPI
+from app.cache import ResponseCache
+from app.rate_limiter import BACKGROUND, RequestScheduler, request_priority
+from app.stock_api import StockAPI as HttpStockAPI
+
+
+class HotSymbolTracker:
+    """
+    Counts symbol requests with exponential decay, so recent interest outweighs old interest.
+    """
+
+    def __init__(self, half_life: float = 3600.0, max_symbols: int = 1000):
+        self.half_life = half_life
+        self.max_symbols = max_symbols
+        self._scores: Dict[str, float] = {}
+        self._epoch = time.monotonic()
+
+    def _weight(self) -> float:
+        # Newer requests weigh more instead of decaying every stored score.
+        return 2 ** ((time.monotonic() - self._epoch) / self.half_life)
+
+    def record(self, symbol: str):
+        weight = self._weight()
+        if weight > 1e12:
+            self._scores = {s: score / weight for s, score in self._scores.items()}
+            self._epoch = time.monotonic()
+            weight = 1.0
+        self._scores[symbol] = self._scores.get(symbol, 0.0) + weight
+        if len(self._scores) > self.max_symbols:
+            coldest = min(self._scores, key=self._scores.get)
+            del self._scores[coldest]
+
+    def top(self, n: int) -> List[str]:
+        return sorted(self._scores, key=self._scores.get, reverse=True)[:n]
+
+
+class Prefetcher:
+    """
+    Refreshes market movers and the hottest quotes before their cache entries expire.
+
+    Runs as a repeating job. Each run spends at most `quota_share` of the
+    per-minute quota for its interval, at background priority, and skips the
+    run while interactive calls are queued.
+    """
+
+    def __init__(self, stock_api: AsyncStockAPI, http_api: HttpStockAPI, cache: ResponseCache,
+                 scheduler: RequestScheduler, tracker: HotSymbolTracker, interval: float = 60.0, quota_share: float = 0.2,
+                 hot_symbols: int = 10):
+        self.stock_api = stock_api
+        self.http_api = http_api
+        self.cache = cache
+        self.scheduler = scheduler
+        self.tracker = tracker
+        self.interval = interval
+        self.quota_share = quota_share
+        self.hot_symbols = hot_symbols
+        self.refreshed = 0
+        self.skipped_runs = 0
+
+    def budget(self) -> int:
+        per_minute = self.scheduler.buckets[0].capacity
+        return math.floor(per_minute * self.interval / 60 * self.quota_share)
+
+    def _due(self, function: str, symbol: str) -> bool:
+        remaining = self.cache.expires_in(function, symbol)
+        return remaining is None or remaining <= self.interval
+
+    def candidates(self) -> List[tuple]:
+        keys = [('TOP_GAINERS_LOSERS', None)]
+        keys += [('GLOBAL_QUOTE', symbol) for symbol in self.tracker.top(self.hot_symbols)]
+        return [key for key in keys if self._due(*key)]
+
+    async def run(self, context=None):
+        if self.scheduler.queue_depth():
+            self.skipped_runs += 1
+            return
+
+        token = request_priority.set(BACKGROUND)
+        try:
+            for function, symbol in self.candidates()[:self.budget()]:
+                try:
+                    if function == 'TOP_GAINERS_LOSERS':
+                        result = await self.http_api.get_market_movers(refresh=True)
+                    else:
+                        result = await self.stock_api.refresh(function, symbol)
+                except Exception as e:
+                    print(f"Prefetch of {function} {symbol} failed: {e}")
+                    continue
+                if result is None or isinstance(result, dict) and "error" in result:
+                    continue
+                self.refreshed += 1
+        finally:
+            request_priority.reset(token)
+
+    def stats(self) -> Dict[str, int]:
+        return {'refreshed': self.refreshed, 'skipped_runs': self.skipped_runs, 'budget': self.budget()}
@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import itertools
+import re
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# Priority of upstream calls made by the current task. Background jobs set it
+# to BACKGROUND; AsyncStockAPI carries it into its executor threads.
+request_priority: ContextVar[int] = ContextVar('request_priority', default=INTERACTIVE)
+
+_THROTTLE_PATTERN = re.compile(r'call frequency|rate limit|requests per (day|minute)', re.IGNORECASE)
+
+
+def is_throttle_message(message: Any) -> bool:
+    """
+    True if an Alpha Vantage "Note"/"Information" text says the quota was hit.
+    """
+    return bool(_THROTTLE_PATTERN.search(str(message)))
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self._updated = now
+
+    def time_until_available(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.refill_per_second
+
+    def consume(self):
+        self.tokens -= 1
+
+    def drain(self):
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0)
+
+
+class RequestScheduler:
+    """
+    Admits upstream Alpha Vantage calls within per-minute and per-day quotas.
+
+    Callers over the quota wait in a priority queue instead of failing; lower
+    priority values go first, FIFO within a priority. The scheduler lives on
+    the bot's event loop. Executor threads use `acquire_blocking`.
+    """
+
+    def __init__(self, per_minute: int = 5, per_day: int = 500):
+        self.buckets: List[TokenBucket] = [
+            TokenBucket(per_minute, per_minute / 60),
+            TokenBucket(per_day, per_day / 86400),
+        ]
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.granted = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_queue_depth = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """
+        Sets the loop that `acquire_blocking` submits to.
+        """
+        self._loop = loop
+
+    async def acquire(self, priority: Optional[int] = None):
+        if priority is None:
+            priority = request_priority.get()
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), time.monotonic(), future))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        if self._timer is None:
+            self._dispatch()
+        await future
+
+    def acquire_blocking(self, priority: Optional[int] = None):
+        """
+        Waits for a slot from a thread other than the scheduler's loop.
+        """
+        if priority is None:
+            priority = request_priority.get()
+        if self._loop is None or self._loop.is_closed():
+            raise RuntimeError("RequestScheduler is not bound to a running loop")
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            raise RuntimeError("acquire_blocking() would deadlock on the scheduler's own loop")
+        asyncio.run_coroutine_threadsafe(self.acquire(priority), self._loop).result()
+
+    def on_throttled(self):
+        """
+        Called when Alpha Vantage reports the quota as exhausted; holds new calls
+        until the per-minute bucket has refilled.
+        """
+        self.throttled += 1
+        self.buckets[0].drain()
+
+    def _take(self) -> float:
+        """
+        Takes a token from every bucket if each has one and returns 0, otherwise
+        returns the seconds until they might.
+        """
+        now = time.monotonic()
+        delay = max(bucket.time_until_available(now) for bucket in self.buckets)
+        if delay <= 0:
+            for bucket in self.buckets:
+                bucket.consume()
+        return delay
+
+    def _dispatch(self):
+        self._timer = None
+        while self._waiters:
+            priority, _, enqueued_at, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            delay = self._take()
+            if delay > 0:
+                self._timer = self._loop.call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            waited = time.monotonic() - enqueued_at
+            self.granted += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            future.set_result(None)
+
+    def queue_depth(self) -> int:
+        return sum(1 for *_, future in self._waiters if not future.done())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queue_depth': self.queue_depth(),
+            'max_queue_depth': self.max_queue_depth,
+            'granted': self.granted,
+            'throttled': self.throttled,
+            'avg_wait': self.total_wait / self.granted if self.granted else 0.0,
+            'max_wait': self.max_wait,
+            'tokens_minute': round(self.buckets[0].tokens, 2),
+            'tokens_day': round(self.buckets[1].tokens, 2),
+        }
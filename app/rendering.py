@@ -0,0 +1,367 @@
+import threading
+from collections import OrderedDict
+from string import Formatter
+from typing import Any, Callable, Dict, Hashable, List, Mapping, Optional, Tuple
+
+from app.rate_limiter import is_throttle_message
+
+# Telegram rejects messages longer than this.
+MAX_MESSAGE_LENGTH = 4096
+
+DEFAULT_LANGUAGE = 'he'
+
+_CONVERSIONS = {'r': repr, 's': str, 'a': ascii}
+
+
+def compile_template(text: str) -> Callable[[Mapping[str, Any]], str]:
+    """
+    Turns a str.format-style template into a function of a fields mapping.
+
+    The template is parsed once into literal and field pieces, so rendering
+    does no parsing at request time.
+    """
+    pieces: List[Tuple[str, Optional[str], Optional[Callable[[Any], str]], str]] = []
+    for literal, field, spec, conversion in Formatter().parse(text):
+        pieces.append((literal, field, _CONVERSIONS[conversion] if conversion else None, spec or ''))
+    if not pieces:
+        return lambda fields: ''
+    if len(pieces) == 1 and pieces[0][1] is None:
+        literal = pieces[0][0]
+        return lambda fields: literal
+
+    def render(fields: Mapping[str, Any]) -> str:
+        parts = []
+        for literal, field, convert, spec in pieces:
+            parts.append(literal)
+            if field is not None:
+                value = fields[field]
+                if convert is not None:
+                    value = convert(value)
+                parts.append(format(value, spec))
+        return ''.join(parts)
+
+    return render
+
+
+class Template:
+    """
+    A compiled reply: `header`, then `item` once per row joined by `separator`,
+    then `footer`. Rows marked 'missing' use `missing_item`. `empty` is sent
+    when there is no data at all.
+    """
+    __slots__ = ('header', 'item', 'missing_item', 'footer', 'separator', 'empty', 'max_items')
+
+    def __init__(self, header: str = '', item: str = '', footer: str = '', separator: str = '\n',
+                 empty: str = '', missing_item: str = '', max_items: Optional[int] = None):
+        self.header = compile_template(header)
+        self.item = compile_template(item)
+        self.missing_item = compile_template(missing_item)
+        self.footer = compile_template(footer)
+        self.separator = separator
+        self.empty = compile_template(empty)
+        self.max_items = max_items
+
+    def render(self, fields: Mapping[str, Any], items: List[Mapping[str, Any]] = ()) -> str:
+        if self.max_items is not None:
+            items = items[:self.max_items]
+        body = self.separator.join(self.missing_item(item) if item.get('missing') else self.item(item)
+                                   for item in items)
+        return self.header(fields) + body + self.footer(fields)
+
+
+View = Tuple[Dict[str, Any], List[Dict[str, Any]]]
+
+
+def _error(data: Any) -> bool:
+    return not data or isinstance(data, dict) and any(key in data for key in ('error', 'Error Message', 'Note',
+                                                                               'Information'))
+
+
+def _throttled(data: Any) -> bool:
+    return isinstance(data, dict) and is_throttle_message(data.get('error') or data.get('Note')
+                                                          or data.get('Information') or '')
+
+
+def _quote_view(quote: Any, context: Mapping[str, Any]) -> Optional[View]:
+    if _error(quote) or not isinstance(quote, dict) or '05. price' not in quote:
+        return None
+    return {
+        'symbol': quote.get('01. symbol', context.get('symbol')),
+        'open': quote.get('02. open', 'N/A'),
+        'high': quote.get('03. high', 'N/A'),
+        'low': quote.get('04. low', 'N/A'),
+        'price': quote['05. price'],
+        'volume': quote.get('06. volume', 'N/A'),
+        'day': quote.get('07. latest trading day', 'N/A'),
+        'previous_close': quote.get('08. previous close', 'N/A'),
+        'change': quote.get('09. change', 'N/A'),
+        'change_percent': quote.get('10. change percent', 'N/A'),
+    }, []
+
+
+def _quotes_view(quotes: Any, context: Mapping[str, Any]) -> Optional[View]:
+    items = []
+    for symbol in context['symbols']:
+        quote = quotes.get(symbol)
+        if quote is None:
+            items.append({'symbol': symbol, 'missing': True})
+        else:
+            items.append({'symbol': symbol, 'price': quote['05. price'], 'change': quote['09. change'],
+                          'change_percent': quote['10. change percent']})
+    return {}, items
+
+
+def _overview_view(data: Any, context: Mapping[str, Any]) -> Optional[View]:
+    if _error(data) or not isinstance(data, dict):
+        return None
+    return {
+        'symbol': context.get('symbol', data.get('Symbol')),
+        'price': data.get('Price', 'N/A'),
+        'high_52': data.get('52WeekHigh', 'N/A'),
+        'low_52': data.get('52WeekLow', 'N/A'),
+        'dividend_per_share': data.get('DividendPerShare', 'N/A'),
+        'dividend_yield': data.get('DividendYield', 'N/A'),
+        'ex_dividend_date': data.get('ExDividendDate', 'N/A'),
+        'dividend_date': data.get('DividendDate', 'N/A'),
+    }, []
+
+
+def _news_view(feed: Any, context: Mapping[str, Any]) -> Optional[View]:
+    if not isinstance(feed, list) or not feed:
+        return None
+    return {}, [{'title': article.get('title'), 'label': article.get('overall_sentiment_label'),
+                 'score': article.get('overall_sentiment_score')} for article in feed[:3]]
+
+
+def _sentiment_view(summary: Any, context: Mapping[str, Any]) -> Optional[View]:
+    if _error(summary) or not isinstance(summary, dict) or not summary.get('count'):
+        return None
+    return {**context, **summary}, summary['articles']
+
+
+def _earnings_view(data: Any, context: Mapping[str, Any]) -> Optional[View]:
+    if _error(data) or not isinstance(data, dict):
+        return None
+    # EARNINGS has quarterlyEarnings, EARNINGS_CALENDAR has earnings.
+    rows = data.get('quarterlyEarnings') or data.get('earnings')
+    if not rows:
+        return None
+    return {}, [{'date': row.get('reportDate') or row.get('fiscalDateEnding'),
+                 'estimated': row.get('estimatedEPS', 'N/A'),
+                 'reported': row.get('reportedEPS', 'N/A')} for row in rows[:3]]
+
+
+def _etf_holdings_view(data: Any, context: Mapping[str, Any]) -> Optional[View]:
+    if not isinstance(data, dict) or not data.get('holdings'):
+        return None
+    return {}, [{'symbol': holding.get('symbol') or holding.get('ticker'),
+                 'name': holding.get('description') or holding.get('name'),
+                 'weight': holding.get('weight')} for holding in data['holdings'][:5]]
+
+
+def _institutional_view(data: Any, context: Mapping[str, Any]) -> Optional[View]:
+    if not isinstance(data, dict) or not data.get('institutionalHolders'):
+        return None
+    return {}, [{'name': holder.get('name'), 'shares': holder.get('shares'), 'percentage': holder.get('percentage')}
+                for holder in data['institutionalHolders'][:5]]
+
+
+def _text_view(text: Any, context: Mapping[str, Any]) -> Optional[View]:
+    if not text or not isinstance(text, str):
+        return None
+    return {'text': text}, []
+
+
+def _context_view(data: Any, context: Mapping[str, Any]) -> Optional[View]:
+    return dict(context), []
+
+
+QUOTE_FIELDS = (
+    "Symbol: {symbol}\n"
+    "Open: {open}\n"
+    "High: {high}\n"
+    "Low: {low}\n"
+    "Price: {price}\n"
+    "Volume: {volume}\n"
+    "Latest Trading Day: {day}\n"
+    "Previous Close: {previous_close}\n"
+    "Change: {change}\n"
+    "Change Percent: {change_percent}"
+)
+DIVIDEND_FIELDS = (
+    "Dividend Per Share: ${dividend_per_share}\n"
+    "Dividend Yield: {dividend_yield}%\n"
+    "Ex-Dividend Date: {ex_dividend_date}\n"
+    "Dividend Date: {dividend_date}"
+)
+
+# command -> (view, {language: template}). Missing languages fall back to DEFAULT_LANGUAGE.
+TEMPLATES: Dict[str, Tuple[Callable, Dict[str, Template]]] = {
+    'stock': (_quote_view, {
+        'he': Template(QUOTE_FIELDS, empty="מידע לא נמצא"),
+        'en': Template(QUOTE_FIELDS, empty="No data found"),
+    }),
+    'quotes': (_quotes_view, {
+        'he': Template(item="{symbol}: {price} ({change}, {change_percent})", missing_item="{symbol}: מידע לא נמצא"),
+        'en': Template(item="{symbol}: {price} ({change}, {change_percent})", missing_item="{symbol}: not found"),
+    }),
+    'dividend': (_overview_view, {
+        'he': Template(DIVIDEND_FIELDS, empty="לא נמצא מידע על דיבידנדים"),
+        'en': Template(DIVIDEND_FIELDS, empty="No dividend data found"),
+    }),
+    'sentiment': (_news_view, {
+        'he': Template(item="כותרת: {title}\nסנטימנט: {label} ({score})", separator="\n\n", empty="לא נמצאו חדשות"),
+        'en': Template(item="Title: {title}\nSentiment: {label} ({score})", separator="\n\n", empty="No news found"),
+    }),
+    'sentiment_summary': (_sentiment_view, {
+        'he': Template("סנטימנט {symbol} ב-{window} האחרונים: {label} ({score:+.3f})\n"
+                       "{count} כתבות: {bullish} חיוביות, {bearish} שליליות\n\n",
+                       item="{title}\n{source} · {published} · {label} ({score:+.3f})", separator="\n\n",
+                       empty="לא נמצאו חדשות על {symbol} ב-{window} האחרונים"),
+        'en': Template("{symbol} sentiment over the last {window}: {label} ({score:+.3f})\n"
+                       "{count} articles: {bullish} bullish, {bearish} bearish\n\n",
+                       item="{title}\n{source} · {published} · {label} ({score:+.3f})", separator="\n\n",
+                       empty="No news about {symbol} in the last {window}"),
+    }),
+    'earnings': (_earnings_view, {
+        'he': Template("דוחות כספיים:\n\n", item="תאריך: {date}\nEPS צפוי: ${estimated}\nEPS בפועל: ${reported}",
+                       separator="\n\n", empty="לא נמצאו נתוני רווחים"),
+        'en': Template("Earnings:\n\n", item="Date: {date}\nEstimated EPS: ${estimated}\nReported EPS: ${reported}",
+                       separator="\n\n", empty="No earnings data found"),
+    }),
+    'holdings': (_text_view, {
+        'he': Template("{text}", empty="לא נמצאו נתוני החזקות"),
+        'en': Template("{text}", empty="No holdings data found"),
+    }),
+    'etf_holdings': (_etf_holdings_view, {
+        'he': Template("החזקות הקרן:\n\n", item="מניה: {symbol} ({name})\nאחוז מהתיק: {weight}%", separator="\n\n",
+                       empty="לא נמצאו נתוני החזקות"),
+    }),
+    'institutional_holders': (_institutional_view, {
+        'he': Template("מחזיקים מוסדיים:\n\n", item="שם: {name}\nמניות: {shares}\nאחוז החזקה: {percentage}%",
+                       separator="\n\n", empty="לא נמצאו נתוני החזקות"),
+    }),
+    'overview': (_overview_view, {
+        'he': Template("מידע על {symbol}:\nמחיר נוכחי: ${price}\nשיא 52 שבועות: ${high_52}\nשפל 52 שבועות: ${low_52}",
+                       empty="מידע לא נמצא"),
+    }),
+    'overview_dividend': (_overview_view, {
+        'he': Template("מידע על דיבידנדים {symbol}:\nתשואת דיבידנד: {dividend_yield}%\n"
+                       "תאריך אקס-דיבידנד: {ex_dividend_date}\nתדירות: {dividend_per_share} לרבעון",
+                       empty="לא נמצא מידע על דיבידנדים"),
+    }),
+    'movers': (_text_view, {
+        'he': Template("{text}", empty="לא נמצאו מניות מתאימות"),
+        'en': Template("{text}", empty="No matching stocks found"),
+    }),
+    'stale': (_context_view, {
+        'he': Template("⚠️ השירות אינו זמין כרגע, הנתונים מלפני {minutes} דקות"),
+        'en': Template("⚠️ The data service is unavailable; this data is {minutes} minutes old"),
+    }),
+    'rate_limited': (_context_view, {
+        'he': Template("⚠️ הגענו למכסת הבקשות לשירות הנתונים, נסו שוב בעוד דקה"),
+        'en': Template("⚠️ The data service's rate limit was reached; please try again in a minute"),
+    }),
+}
+
+LANGUAGES = frozenset(language for _, templates in TEMPLATES.values() for language in templates)
+
+
+def _render(command: str, data: Any, language: str, context: Mapping[str, Any]) -> Tuple[str, bool]:
+    view, templates = TEMPLATES[command]
+    template = templates.get(language) or templates[DEFAULT_LANGUAGE]
+    fields = view(data, context)
+    if fields is None:
+        if _throttled(data):
+            return _render('rate_limited', None, language, context)[0], False
+        return template.empty(context), False
+    return template.render(*fields), True
+
+
+def render(command: str, data: Any, language: str = DEFAULT_LANGUAGE, **context) -> str:
+    """
+    Renders `data` with the template of `command` in `language`.
+    """
+    return _render(command, data, language, context)[0]
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> Tuple[str, ...]:
+    """
+    Splits `text` into parts of at most `limit` characters, preferring paragraph
+    and then line breaks.
+    """
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind('\n\n', 0, limit)
+        if cut <= 0:
+            cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    parts.append(text)
+    return tuple(parts)
+
+
+class Renderer:
+    """
+    Renders handler replies and caches the split result.
+
+    Entries are keyed by (command, language, key, version), where `version`
+    identifies the cached payload the reply was built from (see
+    ResponseCache.version). A refreshed payload gets a new version, so stale
+    replies are never served and simply age out of the LRU.
+    """
+
+    def __init__(self, default_language: str = DEFAULT_LANGUAGE, max_entries: int = 4096):
+        self.default_language = default_language
+        self.max_entries = max_entries
+        self._rendered: "OrderedDict[Hashable, Tuple[str, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def language_for(self, user) -> str:
+        code = (getattr(user, 'language_code', None) or '').split('-')[0].lower()
+        return code if code in LANGUAGES else self.default_language
+
+    def lookup(self, command: str, language: str, key: Hashable, version: Optional[int]) -> Optional[Tuple[str, ...]]:
+        if version is None:
+            return None
+        with self._lock:
+            parts = self._rendered.get((command, language, key, version))
+            if parts is None:
+                self.misses += 1
+                return None
+            self._rendered.move_to_end((command, language, key, version))
+            self.hits += 1
+            return parts
+
+    def render(self, command: str, language: str, data: Any, key: Hashable = None, version: Optional[int] = None,
+               **context) -> Tuple[str, ...]:
+        """
+        Renders and splits a reply. It is cached when `version` is given and `data` rendered without error.
+        """
+        text, found = _render(command, data, language, context)
+        parts = split_message(text)
+        if version is not None and found:
+            with self._lock:
+                self._rendered[(command, language, key, version)] = parts
+                while len(self._rendered) > self.max_entries:
+                    self._rendered.popitem(last=False)
+        return parts
+
+    def mark_stale(self, parts: Tuple[str, ...], language: str, age: float) -> Tuple[str, ...]:
+        """
+        Appends a note that the reply was built from data `age` seconds old.
+        """
+        note = render('stale', None, language, minutes=max(1, round(age / 60)))
+        if len(parts[-1]) + len(note) + 2 > MAX_MESSAGE_LENGTH:
+            return parts + (note,)
+        return parts[:-1] + (f"{parts[-1]}\n\n{note}",)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._rendered), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
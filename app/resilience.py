@@ -0,0 +1,238 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from utils.metrics import metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an endpoint whose circuit is open.
+    """
+
+    def __init__(self, function: str, retry_in: float):
+        super().__init__(f"{function} is unavailable, retrying in {retry_in:.0f}s")
+        self.function = function
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Stops calling an endpoint after `failure_threshold` consecutive failures.
+
+    After `reset_timeout` seconds one probe call is let through (half-open);
+    its success closes the circuit, its failure opens it again. A probe that
+    reports nothing, e.g. because its caller hung, is replaced by another
+    after a further `reset_timeout`. Thread-safe, since c_stock_api calls come
+    from executor threads.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def retry_in(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now >= self.opened_at + self.reset_timeout:
+                self.state = HALF_OPEN
+                # Times out this probe if it never reports back.
+                self.opened_at = now
+                return True
+            # Open, or half-open with the probe still out.
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def record_abandoned(self):
+        """
+        Called when a call ends without an outcome, e.g. cancelled. A half-open
+        probe counts as failed, so the circuit opens again instead of waiting on it.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+class RetryPolicy:
+    """
+    Up to `attempts` tries with full-jitter exponential backoff, all within
+    `budget` seconds. A retry that would start after the budget is not made.
+    """
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.5, max_delay: float = 4.0, budget: float = 10.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class Resilience:
+    """
+    Per-endpoint circuit breakers and a shared retry policy for upstream calls.
+
+    One instance is shared by both StockAPI implementations, so they agree on
+    which Alpha Vantage functions are currently failing. `call` and
+    `call_blocking` run one logical request: `attempt(timeout)` is retried
+    while it raises a transient error (or returns a result `is_failure`
+    rejects) and the budget allows. Only the final outcome counts towards the
+    breaker. While a circuit is open, calls fail at once with CircuitOpenError
+    and the StockAPIs answer from stale cache entries instead.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, retry: Optional[RetryPolicy] = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.retry = retry or RetryPolicy()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.short_circuited = 0
+
+    def breaker(self, function: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(function)
+            if breaker is None:
+                breaker = self._breakers[function] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def _admit(self, function: str) -> CircuitBreaker:
+        breaker = self.breaker(function)
+        if not breaker.allow():
+            self.short_circuited += 1
+            metrics.inc('circuit_rejected_total', function=function)
+            raise CircuitOpenError(function, breaker.retry_in())
+        return breaker
+
+    def _next_delay(self, function: str, attempt: int, deadline: float) -> Optional[float]:
+        """
+        Backoff before retry number `attempt` + 1, or None if no retry fits.
+        """
+        if attempt + 1 >= self.retry.attempts:
+            return None
+        delay = self.retry.backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return None
+        self.retries += 1
+        metrics.inc('upstream_retries_total', function=function)
+        return delay
+
+    async def call(self, function: str, attempt: Callable[[float], Awaitable[Any]],
+                   is_failure: Callable[[Any], bool] = lambda result: False,
+                   is_transient: Callable[[BaseException], bool] = lambda error: True,
+                   acquire: Optional[Callable[[], Awaitable[None]]] = None) -> Any:
+        """
+        `acquire()`, if given, is awaited before every attempt (the request
+        scheduler); time spent in it does not count towards the budget.
+        """
+        breaker = self._admit(function)
+        settled = False
+        try:
+            deadline = time.monotonic() + self.retry.budget
+            for number in range(self.retry.attempts):
+                if acquire is not None:
+                    queued_at = time.monotonic()
+                    await acquire()
+                    deadline += time.monotonic() - queued_at
+                error = None
+                try:
+                    result = await attempt(max(0.0, deadline - time.monotonic()))
+                except Exception as e:
+                    if not is_transient(e):
+                        settled = True
+                        breaker.record_success()
+                        raise
+                    error = e
+                else:
+                    if not is_failure(result):
+                        settled = True
+                        breaker.record_success()
+                        return result
+                delay = self._next_delay(function, number, deadline)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+            settled = True
+            breaker.record_failure()
+            if error is not None:
+                raise error
+            return result
+        finally:
+            if not settled:
+                # Cancelled or interrupted before the outcome was known.
+                breaker.record_abandoned()
+
+    def call_blocking(self, function: str, attempt: Callable[[float], Any],
+                      is_transient: Callable[[BaseException], bool] = lambda error: True,
+                      acquire: Optional[Callable[[], None]] = None) -> Any:
+        breaker = self._admit(function)
+        settled = False
+        try:
+            deadline = time.monotonic() + self.retry.budget
+            for number in range(self.retry.attempts):
+                if acquire is not None:
+                    queued_at = time.monotonic()
+                    acquire()
+                    deadline += time.monotonic() - queued_at
+                try:
+                    result = attempt(max(0.0, deadline - time.monotonic()))
+                except Exception as e:
+                    if not is_transient(e):
+                        settled = True
+                        breaker.record_success()
+                        raise
+                    delay = self._next_delay(function, number, deadline)
+                    if delay is None:
+                        settled = True
+                        breaker.record_failure()
+                        raise
+                    time.sleep(delay)
+                else:
+                    settled = True
+                    breaker.record_success()
+                    return result
+        finally:
+            if not settled:
+                breaker.record_abandoned()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {
+            'retries': self.retries,
+            'short_circuited': self.short_circuited,
+            'open': sorted(function for function, breaker in breakers.items() if breaker.state != CLOSED),
+            'times_opened': sum(breaker.times_opened for breaker in breakers.values()),
+        }
@@ -0,0 +1,116 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.cache import ResponseCache
+from utils.db_utils import DatabaseManager
+
+# Only payloads that stay fresh at least this long are worth keeping across restarts.
+DEFAULT_MIN_TTL = 5 * 60
+
+
+class ResponseStore:
+    """
+    On-disk copy of the longer-lived ResponseCache entries, so restarts start warm.
+
+    Every cached payload whose TTL is at least `min_ttl` is queued with its fetch
+    time and written in batches by `flush`, which runs as a repeating job and at
+    shutdown. `load` reads the still-fresh rows back into the cache in one query
+    and keeps their remaining TTL.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, cache: ResponseCache, min_ttl: float = DEFAULT_MIN_TTL):
+        self.db = db_manager
+        self.cache = cache
+        self.min_ttl = min_ttl
+        self._pending: Dict[Tuple[str, str], Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self.loaded = 0
+        self.written = 0
+        self.skipped = 0
+
+    def init_table(self):
+        with self.db.get_connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS responses
+                     (function TEXT,
+                      symbol TEXT,
+                      payload TEXT,
+                      fetched_at REAL,
+                      PRIMARY KEY (function, symbol))''')
+
+    def attach(self):
+        """
+        Starts queueing every new cache entry for the next flush.
+        """
+        self.cache.on_set = self.record
+
+    def record(self, function: str, symbol: Optional[str], value: Any):
+        if self.cache.ttl_for(function) < self.min_ttl:
+            return
+        # The section-less movers payload is keyed by None; SQLite keys need a value.
+        with self._lock:
+            self._pending[(function, symbol or '')] = (value, time.time())
+
+    def load(self) -> int:
+        """
+        Warms the cache with every row that has not expired yet and deletes the rest.
+        Returns how many entries were restored.
+        """
+        now = time.time()
+        with self.db.get_connection() as conn:
+            rows = conn.execute('SELECT function, symbol, payload, fetched_at FROM responses '
+                                'ORDER BY fetched_at').fetchall()
+            expired = []
+            for function, symbol, payload, fetched_at in rows:
+                remaining = self.cache.ttl_for(function) - (now - fetched_at)
+                if remaining <= 0:
+                    expired.append((function, symbol))
+                    continue
+                # Oldest first, so the newest entries end up most recently used.
+                if self.cache.restore(function, symbol or None, json.loads(payload), remaining,
+                                      now - fetched_at):
+                    self.loaded += 1
+            conn.executemany('DELETE FROM responses WHERE function = ? AND symbol = ?', expired)
+        return self.loaded
+
+    async def flush(self, context=None) -> int:
+        """
+        Writes the queued entries in one transaction and returns how many were written.
+        If the write fails, the entries are queued again unless newer ones replaced them.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [(function, symbol, value, fetched_at) for (function, symbol), (value, fetched_at) in pending.items()]
+        try:
+            written = await self.db.run(self._write, rows)
+        except sqlite3.Error as e:
+            with self._lock:
+                for key, entry in pending.items():
+                    self._pending.setdefault(key, entry)
+            print(f"Failed to persist {len(rows)} responses, will retry: {e}")
+            return 0
+        self.skipped += len(rows) - written
+        self.written += written
+        return written
+
+    @staticmethod
+    def _write(conn, rows) -> int:
+        # Serialized on the DB thread, off the event loop.
+        encoded = []
+        for function, symbol, value, fetched_at in rows:
+            try:
+                encoded.append((function, symbol, json.dumps(value, allow_nan=False), fetched_at))
+            except (TypeError, ValueError) as e:
+                print(f"Not persisting {function} {symbol}: {e}")
+        conn.executemany('INSERT OR REPLACE INTO responses (function, symbol, payload, fetched_at) '
+                         'VALUES (?, ?, ?, ?)', encoded)
+        return len(encoded)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            pending = len(self._pending)
+        return {'loaded': self.loaded, 'written': self.written, 'skipped': self.skipped, 'pending': pending}
@@ -0,0 +1,277 @@
+import bisect
+import heapq
+import re
+import time
+from calendar import timegm
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.cache import DEFAULT_TTLS
+from app.singleflight import AsyncSingleFlight
+from app.stock_api import ERROR_KEYS, StockAPI
+
+# Alpha Vantage's time_published / time_from formats. Times are read as UTC.
+PUBLISHED_FORMAT = '%Y%m%dT%H%M%S'
+TIME_FROM_FORMAT = '%Y%m%dT%H%M'
+
+DEFAULT_WINDOW = 7 * 24 * 60 * 60
+DEFAULT_RETENTION = 30 * 24 * 60 * 60
+
+# NEWS_SENTIMENT returns at most this many articles per call.
+FEED_LIMIT = 1000
+
+_WINDOW_UNITS = {'m': 60, 'h': 60 * 60, 'd': 24 * 60 * 60, 'w': 7 * 24 * 60 * 60}
+_WINDOW = re.compile(r'(\d+)([mhdw])')
+
+
+def parse_window(text: str) -> Optional[int]:
+    """
+    Parses a window such as '90m', '24h', '7d' or '2w' into seconds.
+    """
+    match = _WINDOW.fullmatch(text.strip().lower())
+    if match is None or not int(match.group(1)):
+        return None
+    return int(match.group(1)) * _WINDOW_UNITS[match.group(2)]
+
+
+def sentiment_label(score: float) -> str:
+    """
+    Alpha Vantage's label for a sentiment score.
+    """
+    if score <= -0.35:
+        return 'Bearish'
+    if score <= -0.15:
+        return 'Somewhat-Bearish'
+    if score < 0.15:
+        return 'Neutral'
+    if score < 0.35:
+        return 'Somewhat-Bullish'
+    return 'Bullish'
+
+
+def _parse_published(value: str) -> Optional[float]:
+    try:
+        return float(timegm(time.strptime(value, PUBLISHED_FORMAT)))
+    except (TypeError, ValueError):
+        return None
+
+
+def _float(value: Any, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class Article:
+    __slots__ = ('url', 'title', 'source', 'published', 'tickers')
+
+    def __init__(self, url: str, title: str, source: str, published: float):
+        self.url = url
+        self.title = title
+        self.source = source
+        self.published = published
+        # ticker -> (ticker_sentiment_score, relevance_score)
+        self.tickers: Dict[str, Tuple[float, float]] = {}
+
+
+class TickerSentiment:
+    """
+    The articles that mention one ticker, oldest first, with running totals.
+
+    The totals cover every article held, so the whole-retention aggregate is
+    O(1); a shorter window bisects for its first article and sums the tail.
+    """
+    __slots__ = ('times', 'articles', 'scores', 'weights', 'weighted_total', 'weight_total')
+
+    def __init__(self):
+        self.times: List[float] = []
+        self.articles: List[Article] = []
+        self.scores: List[float] = []
+        self.weights: List[float] = []
+        self.weighted_total = 0.0
+        self.weight_total = 0.0
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def add(self, article: Article, score: float, relevance: float):
+        # Feeds come newest first, so articles are usually appended at the end.
+        index = bisect.bisect_right(self.times, article.published)
+        self.times.insert(index, article.published)
+        self.articles.insert(index, article)
+        self.scores.insert(index, score)
+        self.weights.insert(index, relevance)
+        self.weighted_total += score * relevance
+        self.weight_total += relevance
+
+    def remove(self, article: Article):
+        # Expired articles are the oldest, so this is usually index 0.
+        index = bisect.bisect_left(self.times, article.published)
+        while self.articles[index] is not article:
+            index += 1
+        self.weighted_total -= self.scores[index] * self.weights[index]
+        self.weight_total -= self.weights[index]
+        for column in (self.times, self.articles, self.scores, self.weights):
+            del column[index]
+        if not self.times:
+            # Keep float drift from accumulating across refills.
+            self.weighted_total = self.weight_total = 0.0
+
+    def summary(self, since: float, latest: int = 3) -> Dict[str, Any]:
+        """
+        Relevance-weighted sentiment of the articles published since `since`, with the `latest` newest.
+        """
+        start = bisect.bisect_left(self.times, since)
+        if start == 0:
+            weighted, weight = self.weighted_total, self.weight_total
+        else:
+            weighted = sum(score * weight for score, weight in zip(self.scores[start:], self.weights[start:]))
+            weight = sum(self.weights[start:])
+        scores = self.scores[start:]
+        score = weighted / weight if weight > 0 else (sum(scores) / len(scores) if scores else 0.0)
+        labels = [sentiment_label(value) for value in scores]
+        newest = range(len(self.times) - 1, max(start, len(self.times) - latest) - 1, -1)
+        return {
+            'count': len(scores),
+            'score': score,
+            'label': sentiment_label(score),
+            'bullish': sum(label.endswith('Bullish') for label in labels),
+            'bearish': sum(label.endswith('Bearish') for label in labels),
+            'articles': [{
+                'title': self.articles[index].title,
+                'source': self.articles[index].source,
+                'published': time.strftime('%Y-%m-%d %H:%M', time.gmtime(self.times[index])),
+                'score': self.scores[index],
+                'label': sentiment_label(self.scores[index]),
+            } for index in newest],
+        }
+
+
+class SentimentStore:
+    """
+    News sentiment per ticker, kept up to date incrementally.
+
+    Articles live in one index keyed by URL. An article that mentions several
+    tickers is stored once and counted in the aggregate of each of them, so a
+    feed fetched for one symbol also fills in the others it mentions. The
+    first request for a ticker fetches the last `retention` seconds of its
+    news. Later ones, once `refresh_interval` has passed, only ask for articles
+    published since the newest one seen (time_from). Requests in between are
+    answered from the index. Articles older than `retention`, or the oldest
+    beyond `max_articles`, are dropped from the index and from every ticker's
+    totals.
+    """
+
+    def __init__(self, stock_api: StockAPI, refresh_interval: float = DEFAULT_TTLS['NEWS_SENTIMENT'],
+                 retention: float = DEFAULT_RETENTION, max_articles: int = 50000):
+        self.stock_api = stock_api
+        self.refresh_interval = refresh_interval
+        self.retention = retention
+        self.max_articles = max_articles
+        self.single_flight = AsyncSingleFlight()
+        self._articles: Dict[str, Article] = {}
+        self._by_age: List[Tuple[float, str]] = []
+        self._tickers: Dict[str, TickerSentiment] = {}
+        # ticker -> (monotonic time of the last successful fetch, newest published time seen in its feeds)
+        self._synced: Dict[str, Tuple[float, float]] = {}
+        self._floor = 0.0
+        self.fetches = 0
+        self.articles_received = 0
+        self.duplicates = 0
+
+    async def get(self, ticker: str, window: float = DEFAULT_WINDOW) -> Dict[str, Any]:
+        """
+        Returns the summary of `ticker` over the last `window` seconds. 'stale_for'
+        is set when the news could not be refreshed and the summary is that many
+        seconds old. Returns an {"error": ...} dict when nothing is known about the ticker.
+        """
+        synced = self._synced.get(ticker)
+        error = None
+        if synced is None or time.monotonic() - synced[0] >= self.refresh_interval:
+            error = await self.single_flight.do(ticker, lambda: self._refresh(ticker))
+            synced = self._synced.get(ticker)
+        if synced is None:
+            return {"error": error or f"No news for {ticker}"}
+        now = time.time()
+        self._expire(now)
+        sentiment = self._tickers.get(ticker) or TickerSentiment()
+        summary = sentiment.summary(now - min(window, self.retention))
+        if error is not None:
+            summary['stale_for'] = time.monotonic() - synced[0]
+        return summary
+
+    async def _refresh(self, ticker: str) -> Optional[str]:
+        """
+        Fetches the articles published since the last fetch. Returns an error message on failure.
+        """
+        synced = self._synced.get(ticker)
+        since = synced[1] if synced is not None else time.time() - self.retention
+        feed = await self.stock_api.get_news(ticker, time.strftime(TIME_FROM_FORMAT, time.gmtime(since)), FEED_LIMIT)
+        if not isinstance(feed, list):
+            message = next((feed[key] for key in ERROR_KEYS if key in feed), None) if isinstance(feed, dict) else None
+            return message or f"No news for {ticker}"
+        self.fetches += 1
+        newest = self.ingest(feed)
+        self._synced[ticker] = (time.monotonic(), max(since, newest))
+        return None
+
+    def ingest(self, feed: List[Dict[str, Any]]) -> float:
+        """
+        Adds the articles of a NEWS_SENTIMENT feed to the index. Returns the newest published time in it.
+        """
+        newest = 0.0
+        cutoff = max(time.time() - self.retention, self._floor)
+        for item in feed:
+            published = _parse_published(item.get('time_published'))
+            url = item.get('url')
+            if published is None or not url:
+                continue
+            newest = max(newest, published)
+            self.articles_received += 1
+            article = self._articles.get(url)
+            if article is None:
+                if published < cutoff:
+                    continue
+                article = self._articles[url] = Article(url, item.get('title') or '', item.get('source') or '',
+                                                        published)
+                heapq.heappush(self._by_age, (published, url))
+            else:
+                self.duplicates += 1
+            for mention in item.get('ticker_sentiment') or ():
+                ticker = mention.get('ticker')
+                if not ticker or ticker in article.tickers:
+                    continue
+                score = _float(mention.get('ticker_sentiment_score'))
+                relevance = _float(mention.get('relevance_score'))
+                article.tickers[ticker] = (score, relevance)
+                self._tickers.setdefault(ticker, TickerSentiment()).add(article, score, relevance)
+        while len(self._articles) > self.max_articles:
+            self._evict()
+        return newest
+
+    def _expire(self, now: float):
+        cutoff = now - self.retention
+        while self._by_age and self._by_age[0][0] < cutoff:
+            self._evict()
+
+    def _evict(self):
+        """
+        Drops the oldest article from the index and from the tickers it mentions.
+        """
+        published, url = heapq.heappop(self._by_age)
+        article = self._articles.pop(url)
+        self._floor = max(self._floor, published)
+        for ticker in article.tickers:
+            sentiment = self._tickers[ticker]
+            sentiment.remove(article)
+            if not sentiment:
+                del self._tickers[ticker]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'articles': len(self._articles),
+            'tickers': len(self._tickers),
+            'fetches': self.fetches,
+            'articles_received': self.articles_received,
+            'duplicates': self.duplicates,
+        }
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from app.cache import ResponseCache
+from app.rate_limiter import RequestScheduler
+from utils.db_utils import DatabaseManager
+from utils.metrics import metrics
+
+# Names of RequestScheduler.buckets in the shared_buckets table, in order.
+BUCKET_NAMES = ('minute', 'day')
+
+# Wait before retrying a quota transaction that found the database locked.
+LOCKED_RETRY_DELAY = 0.05
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _select(conn: sqlite3.Connection, function: str, symbol: Optional[str]) -> Optional[tuple]:
+    return conn.execute('SELECT payload, stored_at, expires_at FROM shared_cache WHERE function = ? AND symbol = ?',
+                        (function, symbol or '')).fetchone()
+
+
+def _insert(conn: sqlite3.Connection, row: tuple):
+    conn.execute('INSERT OR REPLACE INTO shared_cache (function, symbol, payload, stored_at, expires_at) '
+                 'VALUES (?, ?, ?, ?, ?)', row)
+
+
+def init_shared_tables(db: DatabaseManager):
+    """
+    Creates the tables the worker processes share. Safe to call from every worker.
+    """
+    with db.get_connection() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS shared_cache
+                 (function TEXT,
+                  symbol TEXT,
+                  payload TEXT,
+                  stored_at REAL,
+                  expires_at REAL,
+                  PRIMARY KEY (function, symbol))''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS shared_buckets
+                 (name TEXT PRIMARY KEY,
+                  tokens REAL,
+                  updated_at REAL)''')
+
+
+class SharedResponseCache(ResponseCache):
+    """
+    ResponseCache whose entries are shared by every worker process through SQLite.
+
+    The in-process entries stay the first level. On a miss the shared_cache
+    table is read and a payload another worker stored is kept locally for the
+    rest of its TTL, so each payload costs one upstream call for all workers.
+    Every `set` is written through. Table access runs on the DB thread: code on
+    the event loop reads it with `load`, while `get` and `get_stale` only read
+    it from other threads (c_stock_api's executor). Shared-table errors (e.g.
+    the database staying locked) are counted and otherwise ignored: the cache
+    then only serves this process, as it would in single-process mode. Times
+    in the table are wall-clock, since monotonic clocks are per process.
+    """
+
+    def __init__(self, db: DatabaseManager, **kwargs):
+        super().__init__(**kwargs)
+        self.db = db
+        self.shared_hits = 0
+        self.shared_writes = 0
+        self.shared_errors = 0
+
+    def get(self, function: str, symbol: Optional[str] = None) -> Optional[Any]:
+        value = super().get(function, symbol)
+        if value is None and not _on_event_loop():
+            value = self._restore_row(function, symbol, self._wait(self.db.submit(_select, function, symbol)), 0.0)
+        return value
+
+    def get_stale(self, function: str, symbol: Optional[str] = None) -> Optional[Any]:
+        value = super().get_stale(function, symbol)
+        if value is None and not _on_event_loop():
+            value = self._restore_row(function, symbol, self._wait(self.db.submit(_select, function, symbol)),
+                                      self.max_stale)
+        return value
+
+    async def load(self, function: str, symbol: Optional[str] = None, max_stale: float = 0.0) -> Optional[Any]:
+        try:
+            row = await self.db.run(_select, function, symbol)
+        except sqlite3.Error:
+            self.shared_errors += 1
+            return None
+        return self._restore_row(function, symbol, row, max_stale)
+
+    def _wait(self, future) -> Optional[tuple]:
+        try:
+            return future.result()
+        except sqlite3.Error:
+            self.shared_errors += 1
+            return None
+
+    def _restore_row(self, function: str, symbol: Optional[str], row: Optional[tuple],
+                     max_stale: float) -> Optional[Any]:
+        """
+        Copies a shared_cache row into this process if it expired less than
+        `max_stale` seconds ago, and returns its value.
+        """
+        now = time.time()
+        if row is None or row[2] + max_stale <= now:
+            return None
+        value = json.loads(row[0])
+        self.restore(function, symbol, value, row[2] - now, now - row[1])
+        self.shared_hits += 1
+        metrics.inc('shared_cache_hits_total', function=function)
+        return value
+
+    def set(self, function: str, symbol: Optional[str], value: Any, ttl: Optional[float] = None):
+        super().set(function, symbol, value, ttl)
+        if value is None:
+            return
+        now = time.time()
+        row = (function, symbol or '', json.dumps(value), now, now + (self.ttl_for(function) if ttl is None else ttl))
+        self.db.submit(_insert, row).add_done_callback(self._written)
+
+    def _written(self, future):
+        if future.exception() is None:
+            self.shared_writes += 1
+        else:
+            self.shared_errors += 1
+
+    async def prune(self, context=None) -> int:
+        """
+        Deletes shared entries past `max_stale`. Runs as a repeating job on one worker.
+        """
+        return await self.db.execute('DELETE FROM shared_cache WHERE expires_at + ? <= ?',
+                                     (self.max_stale, time.time()))
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(super().stats(), shared_hits=self.shared_hits, shared_writes=self.shared_writes,
+                    shared_errors=self.shared_errors)
+
+
+class SharedRequestScheduler(RequestScheduler):
+    """
+    RequestScheduler whose per-minute and per-day quotas are shared by every
+    worker process.
+
+    The token counts live in the shared_buckets table. Admitting a call refills
+    and takes a token from both buckets in one immediate transaction, so the
+    workers together stay within the Alpha Vantage quota. Waiting, priorities
+    and FIFO order stay per process. `buckets` mirror the shared counts as of
+    this process's last transaction.
+
+    The transaction runs on the event loop, so it uses its own connection that
+    does not wait for locks: if another worker holds the database, the
+    dispatch is retried after LOCKED_RETRY_DELAY instead. It only writes when
+    a token is taken and, like the pooled connections, uses synchronous=NORMAL,
+    so commits do not wait for an fsync.
+    """
+
+    def __init__(self, db: DatabaseManager, per_minute: int = 5, per_day: int = 500):
+        super().__init__(per_minute=per_minute, per_day=per_day)
+        self.db = db
+        self._conn = sqlite3.connect(db.db_path, timeout=0, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+
+    def close(self):
+        self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._conn
+            self._conn.execute('COMMIT')
+        except BaseException:
+            if self._conn.in_transaction:
+                self._conn.execute('ROLLBACK')
+            raise
+
+    def _take(self) -> float:
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                rows = dict((name, (tokens, updated_at)) for name, tokens, updated_at in
+                            conn.execute('SELECT name, tokens, updated_at FROM shared_buckets'))
+                levels = []
+                for name, bucket in zip(BUCKET_NAMES, self.buckets):
+                    tokens, updated_at = rows.get(name, (bucket.capacity, now))
+                    levels.append(min(bucket.capacity, tokens + max(0.0, now - updated_at) * bucket.refill_per_second))
+                delay = max((1 - tokens) / bucket.refill_per_second if tokens < 1 else 0.0
+                            for tokens, bucket in zip(levels, self.buckets))
+                if delay <= 0:
+                    levels = [tokens - 1 for tokens in levels]
+                    conn.executemany('INSERT OR REPLACE INTO shared_buckets (name, tokens, updated_at) '
+                                     'VALUES (?, ?, ?)',
+                                     [(name, tokens, now) for name, tokens in zip(BUCKET_NAMES, levels)])
+        except sqlite3.OperationalError:
+            return LOCKED_RETRY_DELAY
+        for bucket, tokens in zip(self.buckets, levels):
+            bucket.tokens = tokens
+        return delay
+
+    def on_throttled(self):
+        super().on_throttled()
+        minute = self.buckets[0]
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                conn.execute('UPDATE shared_buckets SET tokens = MIN(tokens + (? - updated_at) * ?, 0), '
+                             'updated_at = ? WHERE name = ?',
+                             (now, minute.refill_per_second, now, BUCKET_NAMES[0]))
+        except sqlite3.OperationalError:
+            pass
@@ -1,118 +1,312 @@
-import aiohttp
-from typing import Dict, Any
+import asyncio
+import time
+from typing import Dict, Any, List, Optional
+from app.cache import ResponseCache
+from app.singleflight import AsyncSingleFlight
+from app.rate_limiter import RequestScheduler, is_throttle_message
+from app.resilience import CircuitOpenError, Resilience
+from app.movers import MarketMovers
+from app.rendering import render
+from utils.lazy import lazy_import
+from utils.metrics import metrics
+
+# Loaded on the first upstream call rather than at bot startup.
+aiohttp = lazy_import('aiohttp')
+
+# Keys Alpha Vantage uses for error, throttling and premium-only replies.
+ERROR_KEYS = ("Error Message", "Note", "Information")
+
+ALPHA_VANTAGE_URL = "https://www.alphavantage.co/query"
+
+# REALTIME_BULK_QUOTES accepts up to 100 comma-separated symbols per call.
+BULK_QUOTE_LIMIT = 100
+
+
+def _is_throttled(data: Any) -> bool:
+    return isinstance(data, dict) and is_throttle_message(data.get("Note") or data.get("Information"))
+
+
+def _is_transient(error: BaseException) -> bool:
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def _quote_from_bulk_row(row: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Maps a REALTIME_BULK_QUOTES row onto the GLOBAL_QUOTE fields, so both share cache entries.
+    """
+    change_percent = str(row.get('change_percent', ''))
+    if change_percent and not change_percent.endswith('%'):
+        change_percent += '%'
+    return {
+        '01. symbol': row.get('symbol'),
+        '02. open': row.get('open'),
+        '03. high': row.get('high'),
+        '04. low': row.get('low'),
+        '05. price': row.get('close'),
+        '06. volume': row.get('volume'),
+        '07. latest trading day': str(row.get('timestamp', ''))[:10],
+        '08. previous close': row.get('previous_close'),
+        '09. change': row.get('change'),
+        '10. change percent': change_percent,
+    }
 
 
 class StockAPI:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, connection_limit: int = 20, limit_per_host: int = 10,
+                 keepalive_timeout: float = 30.0, dns_cache_ttl: int = 300, request_timeout: float = 15.0,
+                 cache: Optional[ResponseCache] = None, scheduler: Optional[RequestScheduler] = None,
+                 base_url: Optional[str] = None, resilience: Optional[Resilience] = None):
         self.api_key = api_key
-        self.base_url = "https://www.alphavantage.co/query"
+        self.cache = cache if cache is not None else ResponseCache()
+        self.single_flight = AsyncSingleFlight()
+        self.scheduler = scheduler
+        self.resilience = resilience if resilience is not None else Resilience()
+        self.bulk_quotes_available = True
+        self._movers: Optional[MarketMovers] = None
+        self._movers_payload = None
+        self.base_url = base_url or ALPHA_VANTAGE_URL
+        self.connection_limit = connection_limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.request_timeout = request_timeout
+        self.connection_stats = {'created': 0, 'reused': 0}
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    async def start(self) -> "StockAPI":
+        """
+        Opens the long-lived session. Safe to call more than once.
+        """
+        if self._session is None or self._session.closed:
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(self._on_connection_created)
+            trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+                trace_configs=[trace_config]
+            )
+        return self
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> "StockAPI":
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _on_connection_created(self, session, trace_config_ctx, params):
+        self.connection_stats['created'] += 1
+
+    async def _on_connection_reused(self, session, trace_config_ctx, params):
+        self.connection_stats['reused'] += 1
 
     async def _make_request(self, params: Dict[str, str]) -> Dict[str, Any]:
         params['apikey'] = self.api_key
-        async with aiohttp.ClientSession() as session:
-            async with session.get(self.base_url, params=params) as response:
-                return await response.json()
+        if self._session is None or self._session.closed:
+            await self.start()
+        async with self._session.get(self.base_url, params=params) as response:
+            return await response.json()
 
-    async def get_stock_info(self, symbol: str) -> str:
-        params = {
-            'function': 'OVERVIEW',
-            'symbol': symbol
-        }
-        data = await self._make_request(params)
+    async def _request(self, params: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Sends one upstream call through the scheduler and the circuit breaker of
+        its function. Connection errors and timeouts are retried within the retry
+        budget; throttling replies are returned as is, since the scheduler already
+        holds back further calls. Raises CircuitOpenError while the function's
+        circuit is open.
+        """
+        return await self.resilience.call(params['function'], lambda timeout: self._attempt(params, timeout),
+                                          is_transient=_is_transient,
+                                          acquire=self.scheduler.acquire if self.scheduler is not None else None)
 
-        if not data or "Error Message" in data:
-            return "מידע לא נמצא"
+    async def _attempt(self, params: Dict[str, str], timeout: float) -> Dict[str, Any]:
+        """
+        Makes one upstream call within `timeout` and reports throttling replies to the scheduler.
+        """
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            data = await asyncio.wait_for(self._make_request(dict(params)), timeout)
+            if _is_throttled(data):
+                outcome = 'throttled'
+                if self.scheduler is not None:
+                    self.scheduler.on_throttled()
+            elif data and not any(key in data for key in ERROR_KEYS):
+                outcome = 'ok'
+            return data
+        finally:
+            metrics.observe('upstream_seconds', time.perf_counter() - started,
+                            function=params['function'], outcome=outcome)
 
-        return (f"מידע על {symbol}:\n"
-                f"מחיר נוכחי: ${data.get('Price', 'N/A')}\n"
-                f"שיא 52 שבועות: ${data.get('52WeekHigh', 'N/A')}\n"
-                f"שפל 52 שבועות: ${data.get('52WeekLow', 'N/A')}")
+    async def _fetch(self, function: str, symbol: Optional[str], params: Optional[Dict[str, str]] = None,
+                     data_key: Optional[str] = None) -> Any:
+        """
+        Returns the cached payload for (function, symbol) or requests it.
 
-    async def get_sentiment(self, symbol: str) -> str:
-        params = {
-            'function': 'NEWS_SENTIMENT',
-            'symbol': symbol
-        }
-        data = await self._make_request(params)
+        `data_key` unwraps the same envelope the alpha_vantage client strips, so
+        entries are shared with c_stock_api. Concurrent misses for the same key share
+        one request. Error replies are returned but not cached. If the upstream
+        fails, the last good payload is returned; see ResponseCache.staleness.
+        """
+        data = self.cache.get(function, symbol)
+        if data is None:
+            data = await self.cache.load(function, symbol)
+        metrics.inc('lookups_total', function=function, result='miss' if data is None else 'hit')
+        if data is not None:
+            return data
+        try:
+            data = await self.refresh(function, symbol, params, data_key)
+        except (CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            data = {"Information": str(e) or type(e).__name__}
+        if data and not any(key in data for key in ERROR_KEYS):
+            return data
+        stale = self.cache.get_stale(function, symbol)
+        if stale is None:
+            stale = await self.cache.load(function, symbol, self.cache.max_stale)
+        if stale is None:
+            return data
+        metrics.inc('stale_served_total', function=function)
+        return stale
 
-        if "feed" not in data:
-            return "לא נמצאו חדשות"
+    async def refresh(self, function: str, symbol: Optional[str], params: Optional[Dict[str, str]] = None,
+                      data_key: Optional[str] = None) -> Any:
+        """
+        Requests (function, symbol) even if cached and replaces the cache entry.
+        """
+        return await self.single_flight.do(
+            (function, symbol), lambda: self._fetch_upstream(function, symbol, params, data_key)
+        )
 
-        news = []
-        for article in data["feed"][:3]:
-            news.append(
-                f"כותרת: {article['title']}\n"
-                f"סנטימנט: {article['overall_sentiment_label']} "
-                f"({article['overall_sentiment_score']})"
-            )
-        return "\n\n".join(news)
+    async def _fetch_upstream(self, function: str, symbol: Optional[str], params: Optional[Dict[str, str]],
+                              data_key: Optional[str]) -> Any:
+        if params is None:
+            params = {'function': function, 'symbol': symbol}
+        data = await self._request(params)
+        if not data or any(key in data for key in ERROR_KEYS):
+            return data
+        if data_key is not None:
+            data = data.get(data_key)
+        self.cache.set(function, symbol, data)
+        return data
 
-    async def get_holdings(self, symbol: str) -> str:
-        # First check if ETF
-        etf_params = {
-            'function': 'ETF_HOLDINGS',
-            'symbol': symbol
-        }
-        data = await self._make_request(etf_params)
+    async def get_quote(self, symbol: str) -> Optional[Dict[str, str]]:
+        data = await self._fetch('GLOBAL_QUOTE', symbol, data_key='Global Quote')
+        if not data or any(key in data for key in ERROR_KEYS):
+            return None
+        return data
 
-        if "holdings" in data:
-            holdings = []
-            for holding in data["holdings"][:5]:
-                holdings.append(
-                    f"מניה: {holding['ticker']} ({holding['name']})\n"
-                    f"אחוז מהתיק: {holding['weight']}%"
-                )
-            return "החזקות הקרן:\n\n" + "\n\n".join(holdings)
+    async def get_bulk_quotes(self, symbols: List[str]) -> Dict[str, Optional[Dict[str, str]]]:
+        """
+        Returns GLOBAL_QUOTE-shaped quotes for many symbols, None for unknown ones.
 
-        # If not ETF, get institutional holders
-        params = {
-            'function': 'INSTITUTIONAL_HOLDERS',
-            'symbol': symbol
-        }
-        data = await self._make_request(params)
+        Cached quotes are served first. The rest are requested with
+        REALTIME_BULK_QUOTES, 100 symbols per call. If the key has no access to
+        that endpoint, the remaining symbols are fetched concurrently with GLOBAL_QUOTE.
+        """
+        quotes = {}
+        missing = []
+        for symbol in symbols:
+            quote = self.cache.get('GLOBAL_QUOTE', symbol)
+            if quote is None:
+                quote = await self.cache.load('GLOBAL_QUOTE', symbol)
+            if quote is None:
+                missing.append(symbol)
+            # Unknown symbols are cached as an empty quote.
+            quotes[symbol] = quote or None
 
-        if "institutionalHolders" not in data:
-            return "לא נמצאו נתוני החזקות"
+        if self.bulk_quotes_available:
+            for start in range(0, len(missing), BULK_QUOTE_LIMIT):
+                chunk = missing[start:start + BULK_QUOTE_LIMIT]
+                try:
+                    data = await self._request({'function': 'REALTIME_BULK_QUOTES', 'symbol': ','.join(chunk)})
+                except (CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError):
+                    # Fall back to per-symbol quotes, which can be served stale.
+                    break
+                if not isinstance(data, dict) or not isinstance(data.get('data'), list):
+                    # Premium-only endpoint; fall back unless this was just throttling.
+                    if data and not is_throttle_message(data.get("Note") or data.get("Information")):
+                        self.bulk_quotes_available = False
+                    break
+                for row in data['data']:
+                    quote = _quote_from_bulk_row(row)
+                    if quote['01. symbol'] in quotes:
+                        quotes[quote['01. symbol']] = quote
+                        self.cache.set('GLOBAL_QUOTE', quote['01. symbol'], quote)
+            missing = [symbol for symbol in missing if quotes[symbol] is None]
 
-        holders = []
-        for holder in data["institutionalHolders"][:5]:
-            holders.append(
-                f"שם: {holder['name']}\n"
-                f"מניות: {holder['shares']}\n"
-                f"אחוז החזקה: {holder['percentage']}%"
-            )
-        return "מחזיקים מוסדיים:\n\n" + "\n\n".join(holders)
+        if missing:
+            results = await asyncio.gather(*(self.get_quote(symbol) for symbol in missing))
+            quotes.update(zip(missing, results))
+        return quotes
 
-    async def get_earnings(self, symbol: str) -> str:
+    async def get_market_movers(self, refresh: bool = False) -> Optional[MarketMovers]:
+        """
+        Returns the gainers, losers and most-active lists from one TOP_GAINERS_LOSERS call.
+        The payload is parsed once per refresh and shared by every view.
+        """
+        fetch = self.refresh if refresh else self._fetch
+        payload = await fetch('TOP_GAINERS_LOSERS', None, {'function': 'TOP_GAINERS_LOSERS'})
+        if not payload or any(key in payload for key in ERROR_KEYS):
+            return None
+        if payload is not self._movers_payload:
+            self._movers = MarketMovers(payload)
+            self._movers_payload = payload
+        return self._movers
+
+    async def get_stock_info(self, symbol: str) -> str:
+        data = await self._fetch('OVERVIEW', symbol)
+        return render('overview', data, symbol=symbol)
+
+    async def get_sentiment(self, symbol: str) -> str:
         params = {
-            'function': 'EARNINGS_CALENDAR',
-            'symbol': symbol
+            'function': 'NEWS_SENTIMENT',
+            'tickers': symbol
         }
-        data = await self._make_request(params)
+        feed = await self._fetch('NEWS_SENTIMENT', symbol, params, data_key='feed')
+        return render('sentiment', feed)
 
-        if "earnings" not in data:
-            return "לא נמצאו נתוני רווחים"
+    async def get_news(self, tickers: str, time_from: Optional[str] = None, limit: int = 50) -> Any:
+        """
+        Returns the NEWS_SENTIMENT articles about `tickers` published since
+        `time_from` (YYYYMMDDTHHMM), newest first, or the error reply.
+        Not cached; SentimentStore keeps the articles.
+        """
+        params = {'function': 'NEWS_SENTIMENT', 'tickers': tickers, 'sort': 'LATEST', 'limit': str(limit)}
+        if time_from:
+            params['time_from'] = time_from
+        try:
+            data = await self._request(params)
+        except (CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return {"Information": str(e) or type(e).__name__}
+        if not isinstance(data, dict) or any(key in data for key in ERROR_KEYS):
+            return data
+        return data.get('feed') or []
 
-        earnings = []
-        for earning in data["earnings"][:3]:
-            earnings.append(
-                f"תאריך: {earning['reportDate']}\n"
-                f"EPS צפוי: ${earning.get('estimatedEPS', 'N/A')}\n"
-                f"EPS בפועל: ${earning.get('reportedEPS', 'N/A')}"
-            )
-        return "דוחות כספיים:\n\n" + "\n\n".join(earnings)
+    async def get_holdings(self, symbol: str) -> str:
+        # First check if ETF
+        data = await self._fetch('ETF_HOLDINGS', symbol)
+        if isinstance(data, dict) and data.get("holdings"):
+            return render('etf_holdings', data)
 
-    async def get_dividend(self, symbol: str) -> str:
-        params = {
-            'function': 'OVERVIEW',
-            'symbol': symbol
-        }
-        data = await self._make_request(params)
+        # If not ETF, get institutional holders
+        data = await self._fetch('INSTITUTIONAL_HOLDERS', symbol)
+        return render('institutional_holders', data)
 
-        if not data or "Error Message" in data:
-            return "לא נמצא מידע על דיבידנדים"
+    async def get_earnings(self, symbol: str) -> str:
+        data = await self._fetch('EARNINGS_CALENDAR', symbol)
+        return render('earnings', data)
 
-        return (f"מידע על דיבידנדים {symbol}:\n"
-                f"תשואת דיבידנד: {data.get('DividendYield', 'N/A')}%\n"
-                f"תאריך אקס-דיבידנד: {data.get('ExDividendDate', 'N/A')}\n"
-                f"תדירות: {data.get('DividendPerShare', 'N/A')} לרבעון")
\ No newline at end of file
+    async def get_dividend(self, symbol: str) -> str:
+        data = await self._fetch('OVERVIEW', symbol)
+        return render('overview_dividend', data, symbol=symbol)
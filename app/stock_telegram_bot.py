@@ -1,11 +1,29 @@
+import asyncio
+import importlib
 import os
+import signal
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
 from app.c_stock_api import StockAPI
+from app.async_stock_api import AsyncStockAPI
+from app.stock_api import StockAPI as HttpStockAPI
+from app.cache import ResponseCache
+from app.response_store import ResponseStore
+from app.alerts import AlertEngine, parse_alert
+from app.outbox import Outbox
+from app.rendering import MAX_MESSAGE_LENGTH, Renderer
+from app.rate_limiter import RequestScheduler
+from app.resilience import Resilience, RetryPolicy
+from app.prefetch import HotSymbolTracker, Prefetcher
+from app.sentiment import DEFAULT_WINDOW, SentimentStore, parse_window
+from app.shared_state import SharedRequestScheduler, SharedResponseCache, init_shared_tables
+from app.movers import DEFAULT_COUNT
+from app.dispatcher import OrderedApplication
+from utils.metrics import MetricsServer, SlowRequestProfiler, metrics
 from utils import security
 from utils.security import Security
+from utils.user_cache import SharedUserStateCache
 from utils.db_utils import DatabaseManager
-import requests
 from datetime import datetime
 from dotenv import load_dotenv
 from pathlib import Path
@@ -14,73 +32,203 @@ from pathlib import Path
 from telegram.ext import Application, CommandHandler
 from functools import partial
 
+# Upper bound on symbols in one /stock or /watchlist reply.
+MAX_SYMBOLS_PER_COMMAND = 20
+
 
 class StockTelegramBot:
-    def __init__(self, telegram_token: str, db_manager, security: Security, alpha_vantage_key: str):
-        self.application = Application.builder().token(telegram_token).build()
+    def __init__(self, telegram_token: str, db_manager, security: Security, alpha_vantage_key: str,
+                 api_workers: int = 8, api_max_in_flight: int = 16, api_timeout: float = 15.0,
+                 cache_max_entries: int = 1024, cache_max_bytes: int = 32 * 1024 * 1024,
+                 api_calls_per_minute: int = 5, api_calls_per_day: int = 500,
+                 counter_flush_interval: float = 30.0, prefetch_interval: float = 60.0,
+                 prefetch_quota_share: float = 0.2, prefetch_hot_symbols: int = 10,
+                 webhook_url: str = None, webhook_secret: str = None, webhook_listen: str = '0.0.0.0',
+                 webhook_port: int = 8443, webhook_path: str = '/telegram',
+                 max_concurrent_updates: int = 32, max_pending_updates: int = 1000,
+                 metrics_host: str = '127.0.0.1', metrics_port: int = None,
+                 profile_sample_rate: float = 0.0, profile_keep: int = 20, profile_dump_path: str = None,
+                 telegram_base_url: str = None, alpha_vantage_url: str = None,
+                 response_store_path: str = None, response_store_flush_interval: float = 30.0,
+                 alert_interval: float = 60.0, alert_symbols_per_run: int = 100,
+                 history_outputsize: str = 'compact', history_max_series: int = 200,
+                 default_language: str = 'he', render_cache_entries: int = 4096,
+                 circuit_failure_threshold: int = 5, circuit_reset_timeout: float = 30.0,
+                 upstream_attempts: int = 3, upstream_retry_budget: float = 10.0,
+                 warmup_delay: float = 5.0, outbox_workers: int = 30, outbox_max_queue: int = 10000,
+                 outbox_global_rate: float = 30.0, sentiment_refresh_interval: float = 15 * 60,
+                 sentiment_retention: float = 30 * 24 * 60 * 60, worker_id: int = None, workers: int = 1,
+                 shared_state_path: str = None):
+        builder = (
+            Application.builder()
+            .application_class(OrderedApplication, kwargs={
+                'max_concurrent_updates': max_concurrent_updates,
+                'max_pending_updates': max_pending_updates
+            })
+            .token(telegram_token)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+        )
+        if telegram_base_url:
+            builder = builder.base_url(telegram_base_url)
+        self.application = builder.build()
         self.db = db_manager
-        self.stock_api = StockAPI(alpha_vantage_key)
+        # Set when running as one of several worker processes under app.supervisor.
+        self.worker_id = worker_id
+        self.workers = workers
+        self.shared_db = None
+        if shared_state_path:
+            self.shared_db = DatabaseManager(shared_state_path)
+            init_shared_tables(self.shared_db)
+            self.cache = SharedResponseCache(self.shared_db, max_entries=cache_max_entries, max_bytes=cache_max_bytes)
+            self.scheduler = SharedRequestScheduler(self.shared_db, per_minute=api_calls_per_minute,
+                                                    per_day=api_calls_per_day)
+        else:
+            self.cache = ResponseCache(max_entries=cache_max_entries, max_bytes=cache_max_bytes)
+            self.scheduler = RequestScheduler(per_minute=api_calls_per_minute, per_day=api_calls_per_day)
+        self.response_store = None
+        # The shared cache is on disk already.
+        if response_store_path and self.shared_db is None:
+            self.response_store = ResponseStore(DatabaseManager(response_store_path), self.cache)
+            self.response_store.init_table()
+            print(f"Restored {self.response_store.load()} cached responses from {response_store_path}")
+            self.response_store.attach()
+        self.response_store_flush_interval = response_store_flush_interval
+        self.resilience = Resilience(
+            failure_threshold=circuit_failure_threshold,
+            reset_timeout=circuit_reset_timeout,
+            retry=RetryPolicy(attempts=upstream_attempts, budget=upstream_retry_budget)
+        )
+        self.stock_api = AsyncStockAPI(
+            StockAPI(alpha_vantage_key, cache=self.cache, scheduler=self.scheduler, base_url=alpha_vantage_url,
+                     resilience=self.resilience),
+            max_workers=api_workers,
+            max_in_flight=api_max_in_flight,
+            timeout=api_timeout
+        )
+        self.http_api = HttpStockAPI(alpha_vantage_key, cache=self.cache, scheduler=self.scheduler,
+                                     base_url=alpha_vantage_url, resilience=self.resilience)
+        self.hot_symbols = HotSymbolTracker()
+        self.prefetcher = Prefetcher(
+            self.stock_api, self.http_api, self.cache, self.scheduler, self.hot_symbols,
+            interval=prefetch_interval,
+            quota_share=prefetch_quota_share,
+            hot_symbols=prefetch_hot_symbols
+        )
+        self.renderer = Renderer(default_language=default_language, max_entries=render_cache_entries)
+        self.sentiment = SentimentStore(self.http_api, refresh_interval=sentiment_refresh_interval,
+                                        retention=sentiment_retention)
+        self.history_outputsize = history_outputsize
+        self.history_max_series = history_max_series
+        self._history = None
+        self.warmup_delay = warmup_delay
+        # Telegram's global limit is per bot, so workers split it.
+        self.outbox = Outbox(max_queue=outbox_max_queue, workers=outbox_workers,
+                             global_rate=outbox_global_rate / workers)
+        self.alerts = AlertEngine(self.db, self.http_api, interval=alert_interval,
+                                  symbols_per_run=alert_symbols_per_run, outbox=self.outbox)
+        self.alerts.load(shard=(worker_id or 0, workers))
         self._security = security
-
+        self._security.outbox = self.outbox
+        self.counter_flush_interval = counter_flush_interval
+        self.webhook_url = webhook_url
+        self.webhook_server = None
+        if webhook_url or worker_id is not None:
+            # aiohttp.web is only needed in webhook mode. Workers get their updates from the supervisor through it.
+            from app.webhook import WebhookServer
+            self.webhook_server = WebhookServer(
+                self.application,
+                secret_token=webhook_secret,
+                host=webhook_listen,
+                port=webhook_port,
+                path=webhook_path
+            )
+        self.application.latency.profiler = SlowRequestProfiler(sample_rate=profile_sample_rate, keep=profile_keep)
+        self.profile_dump_path = profile_dump_path
+        self.metrics_server = MetricsServer(metrics, host=metrics_host, port=metrics_port) if metrics_port else None
+        metrics.register_collector('cache', self.cache.stats)
+        metrics.register_collector('scheduler', self.scheduler.stats)
+        metrics.register_collector('prefetcher', self.prefetcher.stats)
+        metrics.register_collector('connections', lambda: dict(self.http_api.connection_stats))
+        metrics.register_collector('coalesced_stock_api', self.stock_api.single_flight.stats)
+        metrics.register_collector('coalesced_http_api', self.http_api.single_flight.stats)
+        metrics.register_collector('updates', lambda: {'pending': self.application.pending_updates()})
+        if self.response_store is not None:
+            metrics.register_collector('store', self.response_store.stats)
+        metrics.register_collector('alerts', self.alerts.stats)
+        metrics.register_collector('history', lambda: self._history.stats() if self._history is not None else {})
+        metrics.register_collector('rendering', self.renderer.stats)
+        metrics.register_collector('resilience', self.resilience.stats)
+        metrics.register_collector('outbox', self.outbox.stats)
+        metrics.register_collector('sentiment', self.sentiment.stats)
 
     def register_handlers(self):
-        authorized_start = self._security.authorize_user(self.start)
-        self.application.add_handler(CommandHandler("start", authorized_start))
-        self.application.add_handler(CommandHandler("register", self.register))
-        self.application.add_handler(CommandHandler("stock", self.get_stock_info))
-        self.application.add_handler(CommandHandler("authorize", self.authorize))
-        self.application.add_handler(CommandHandler("sentiment", self.get_sentiment))
-        self.application.add_handler(CommandHandler("earnings", self.get_earnings))
-        self.application.add_handler(CommandHandler("dividend", self.get_dividend_info))
-        self.application.add_handler(CommandHandler("holdings", self.get_holdings))
-        self.application.add_handler(CommandHandler("top_gainers", self.top_gainers))
-        self.application.add_handler(CommandHandler("top_losers", self.top_losers))
+        commands = {
+            "start": self._security.authorize_user(self.start),
+            "register": self.register,
+            "stock": self.get_stock_info,
+            "watchlist": self.watchlist,
+            "alert": self.alert,
+            "chart": self.chart,
+            "indicators": self.get_indicators,
+            "authorize": self.authorize,
+            "sentiment": self.get_sentiment,
+            "earnings": self.get_earnings,
+            "dividend": self.get_dividend_info,
+            "holdings": self.get_holdings,
+            "top_gainers": self.top_gainers,
+            "top_losers": self.top_losers,
+            "most_active": self.most_active,
+            "stats": self.stats,
+            "broadcast": self.broadcast,
+        }
+        latency = self.application.latency
+        for command, callback in commands.items():
+            self.application.add_handler(CommandHandler(command, latency.timed(command, callback)))
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             "ברוכים הבאים לבוט מידע על מניות! 📈\n"
             "השתמשו בפקודות הבאות:\n"
             "/stock SYMBOL - מידע בסיסי על מניה\n"
-            "/sentiment SYMBOL - ניתוח סנטימנט\n"
+            "/stock SYMBOL SYMBOL ... - מחירים של כמה מניות\n"
+            "/watchlist SYMBOL ... - שמירת רשימת מעקב, /watchlist להצגתה\n"
+            "/alert SYMBOL > PRICE - התראת מחיר, /alert להצגת ההתראות\n"
+            "/chart SYMBOL [5min] [N] - גרף מחירים\n"
+            "/indicators SYMBOL [5min] - SMA/EMA/RSI/MACD, תשואות ותנודתיות\n"
+            "/sentiment SYMBOL [24h|7d] - ניתוח סנטימנט\n"
             "/earnings SYMBOL - מידע על דוחות כספיים\n"
             "/dividend SYMBOL - מידע על דיבידנדים\n"
             "/holdings SYMBOL - מידע על החזקות המוסדיים\n"
-            "/top_gainers - המניות המובילות\n"
-            "/top_losers - המניות המפסידות"
+            "/top_gainers [N] - המניות המובילות\n"
+            "/top_losers [N] - המניות המפסידות\n"
+            "/most_active [N] - המניות הנסחרות ביותר\n"
+            "סינון: volume=100000 price=5"
         )
     async def register(self, update, context):
         user_id = update.effective_user.id
         username = update.effective_user.username
 
-        with self.db.get_connection() as conn:
-            c = conn.cursor()
-            c.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-            if c.fetchone():
-                await update.message.reply_text("כבר רשום במערכת!")
-                return
+        if await self.db.fetchone('SELECT * FROM users WHERE user_id = ?', (user_id,)):
+            await update.message.reply_text("כבר רשום במערכת!")
+            return
 
-            c.execute('''INSERT INTO users (user_id, username, requests_today, last_request_date, is_authorized, is_admin) 
-                        VALUES (?, ?, 0, ?, ?, ?)''',
-                     (user_id, username, datetime.now().strftime('%Y-%m-%d'), False, False))
+        await self.db.execute('''INSERT INTO users (user_id, username, requests_today, last_request_date, is_authorized, is_admin) 
+                    VALUES (?, ?, 0, ?, ?, ?)''',
+                              (user_id, username, datetime.now().strftime('%Y-%m-%d'), False, False))
+        self._security.invalidate_user(user_id)
 
         keyboard = [[InlineKeyboardButton("אשר משתמש", callback_data=f'auth_{user_id}')]]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-        for admin_id in self._security.admin_ids:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=f"בקשת הרשאה חדשה:\nID: {user_id}\nUsername: {username}",
-                    reply_markup=reply_markup
-                )
-            except Exception as e:
-                print(f"Failed to send message to admin {admin_id}: {e}")
+        await self._security.notify_admins(context.bot, f"בקשת הרשאה חדשה:\nID: {user_id}\nUsername: {username}",
+                                           reply_markup=reply_markup)
 
         await update.message.reply_text("הרשמתך נקלטה! ממתין לאישור מנהל.")
 
 
     async def authorize(self, update, context):
-        if str(update.effective_user.id) not in self.security.admin_ids:
+        if str(update.effective_user.id) not in self._security.admin_ids:
             return
 
         if not context.args:
@@ -88,10 +236,8 @@ class StockTelegramBot:
             return
 
         user_id = int(context.args[0])
-        with self.db.get_connection() as conn:
-            c = conn.cursor()
-            c.execute('UPDATE users SET is_authorized = TRUE WHERE user_id = ?',
-                      (user_id,))
+        await self.db.execute('UPDATE users SET is_authorized = TRUE WHERE user_id = ?', (user_id,))
+        self._security.invalidate_user(user_id)
 
         await update.message.reply_text(f"User {user_id} authorized")
         await context.bot.send_message(
@@ -104,37 +250,241 @@ class StockTelegramBot:
         if not context.args:
             await update.message.reply_text("אנא ציין סימול מניה, לדוגמה: /stock AAPL")
             return
+        if len(context.args) > 1:
+            await self._reply_quotes(update, context.args)
+            return
+        symbol = context.args[0].upper()
+        self.hot_symbols.record(symbol)
+        await self._reply_rendered(update, 'stock', ('GLOBAL_QUOTE', symbol),
+                                   lambda: self.stock_api.get_stock_info(symbol), symbol=symbol)
+
+    async def watchlist(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id
+        if context.args:
+            symbols = list(dict.fromkeys(arg.upper() for arg in context.args))[:MAX_SYMBOLS_PER_COMMAND]
+            await self.db.run(self._replace_watchlist, user_id, symbols)
+        else:
+            rows = await self.db.fetchall('SELECT symbol FROM watchlists WHERE user_id = ? ORDER BY position',
+                                          (user_id,))
+            symbols = [row[0] for row in rows]
+
+        if not symbols:
+            await update.message.reply_text("רשימת המעקב ריקה. לדוגמה: /watchlist AAPL MSFT NVDA")
+            return
+        await self._reply_quotes(update, symbols)
+
+    @staticmethod
+    def _replace_watchlist(conn, user_id: int, symbols: list):
+        conn.execute('DELETE FROM watchlists WHERE user_id = ?', (user_id,))
+        conn.executemany('INSERT INTO watchlists (user_id, symbol, position) VALUES (?, ?, ?)',
+                         [(user_id, symbol, position) for position, symbol in enumerate(symbols)])
+
+    async def alert(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        /alert AAPL > 200 sets an alert, /alert lists them, /alert remove ID deletes one.
+        """
+        user_id = update.effective_user.id
+        if not context.args:
+            alerts = self.alerts.alerts_for(user_id)
+            if not alerts:
+                await update.message.reply_text("אין התראות פעילות. לדוגמה: /alert AAPL > 200")
+                return
+            await update.message.reply_text("\n".join(alert.describe() for alert in alerts))
+            return
+
+        if context.args[0].lower() == 'remove':
+            try:
+                alert_id = int(context.args[1].lstrip('#'))
+            except (IndexError, ValueError):
+                await update.message.reply_text("שימוש: /alert remove ID")
+                return
+            if await self.alerts.remove(user_id, alert_id):
+                await update.message.reply_text(f"התראה #{alert_id} נמחקה")
+            else:
+                await update.message.reply_text(f"התראה #{alert_id} לא נמצאה")
+            return
+
+        parsed = parse_alert(' '.join(context.args))
+        if parsed is None:
+            await update.message.reply_text("שימוש: /alert AAPL > 200 או /alert AAPL < 150")
+            return
+        alert = await self.alerts.add(user_id, *parsed)
+        if alert is None:
+            await update.message.reply_text("הגעת למספר ההתראות המרבי")
+            return
+        self.hot_symbols.record(alert.symbol)
+        await update.message.reply_text(f"התראה נשמרה: {alert.describe()}")
+
+    @property
+    def history(self):
+        """
+        The HistoryStore, built on the first /chart or /indicators since it loads NumPy.
+        """
+        if self._history is None:
+            from app.history import HistoryStore
+            self._history = HistoryStore(self.stock_api, initial_outputsize=self.history_outputsize,
+                                         max_series=self.history_max_series)
+        return self._history
+
+    async def _history_for(self, update: Update, context: ContextTypes.DEFAULT_TYPE, usage: str):
+        """
+        Parses "SYMBOL [interval] [bars]" and returns (cached series, bars), or None after replying.
+        """
+        from app.history import INTRADAY_INTERVALS
+        if not context.args:
+            await update.message.reply_text(usage)
+            return None
         symbol = context.args[0].upper()
-        response = self.stock_api.get_stock_info(symbol)
-        formatted_response = (
-            f"Symbol: {response['01. symbol']}\n"
-            f"Open: {response['02. open']}\n"
-            f"High: {response['03. high']}\n"
-            f"Low: {response['04. low']}\n"
-            f"Price: {response['05. price']}\n"
-            f"Volume: {response['06. volume']}\n"
-            f"Latest Trading Day: {response['07. latest trading day']}\n"
-            f"Previous Close: {response['08. previous close']}\n"
-            f"Change: {response['09. change']}\n"
-            f"Change Percent: {response['10. change percent']}"
+        interval, bars = 'daily', 30
+        for arg in context.args[1:]:
+            if arg.lower() in INTRADAY_INTERVALS:
+                interval = arg.lower()
+            elif arg.isdigit():
+                bars = max(2, int(arg))
+            else:
+                await update.message.reply_text(usage)
+                return None
+        self.hot_symbols.record(symbol)
+        cached = await self.history.get(symbol, interval)
+        if isinstance(cached, dict):
+            await update.message.reply_text(f"לא נמצאו נתונים היסטוריים עבור {symbol}")
+            return None
+        return symbol, cached, bars
+
+    async def chart(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        found = await self._history_for(update, context, "שימוש: /chart AAPL [5min] [60]")
+        if found is None:
+            return
+        from app import indicators
+        symbol, cached, bars = found
+        series = cached.series
+        close = series.close[-bars:]
+        unit = 'D' if series.interval == 'daily' else 'm'
+        start, end = (series.timestamps[[-len(close), -1]].astype(f'datetime64[{unit}]'))
+        change = indicators.period_return(close, len(close) - 1)
+        await update.message.reply_text(
+            f"{symbol} {series.interval}, {len(close)} bars\n"
+            f"{indicators.sparkline(close)}\n"
+            f"Low {close.min():.2f} · High {close.max():.2f} · Last {close[-1]:.2f} ({change:+.2%})\n"
+            f"{start} → {end}"
+        )
+
+    async def get_indicators(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        found = await self._history_for(update, context, "שימוש: /indicators AAPL [5min]")
+        if found is None:
+            return
+        from app import indicators
+        symbol, cached, _ = found
+        series, close = cached.series, cached.series.close
+        latest = cached.indicators.latest()
+
+        def value(number: float, fmt: str = '.2f') -> str:
+            return 'n/a' if number != number else format(number, fmt)
+
+        if series.interval == 'daily':
+            horizons = {'1D': 1, '1W': 5, '1M': 21, '3M': 63, '1Y': 252}
+            per_year = indicators.TRADING_DAYS
+        else:
+            horizons = {'1 bar': 1, '12 bars': 12, '48 bars': 48}
+            per_year = indicators.TRADING_DAYS * 390 // int(series.interval[:-3])
+        sma = {period: indicators.sma(close[-period:], period)[-1] if len(close) >= period else float('nan')
+               for period in (20, 50, 200)}
+        returns = ' '.join(f"{label} {value(indicators.period_return(close, n), '+.2%')}"
+                           for label, n in horizons.items())
+        vol = ' '.join(f"{label} {value(indicators.volatility(close, n, per_year), '.1%')}"
+                       for label, n in (('20', 20), ('60', 60)))
+        await update.message.reply_text(
+            f"{symbol} {series.interval} · {len(close)} bars · Close {close[-1]:.2f}\n"
+            f"SMA20 {value(sma[20])} · SMA50 {value(sma[50])} · SMA200 {value(sma[200])}\n"
+            f"EMA12 {value(latest['ema12'])} · EMA26 {value(latest['ema26'])}\n"
+            f"RSI14 {value(latest['rsi14'], '.1f')}\n"
+            f"MACD {value(latest['macd'], '.3f')} · Signal {value(latest['macd_signal'], '.3f')} · "
+            f"Hist {value(latest['macd_hist'], '.3f')}\n"
+            f"Returns: {returns}\n"
+            f"Volatility (ann., bars): {vol}"
         )
-        await update.message.reply_text(formatted_response)
+
+    async def _reply_quotes(self, update: Update, symbols: list):
+        """
+        Sends one combined reply with the quotes of several symbols, fetched in bulk.
+        """
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))[:MAX_SYMBOLS_PER_COMMAND]
+        for symbol in symbols:
+            self.hot_symbols.record(symbol)
+        quotes = await self.http_api.get_bulk_quotes(symbols)
+        language = self.renderer.language_for(update.effective_user)
+        parts = self.renderer.render('quotes', language, quotes, symbols=symbols)
+        # Only quotes that were found can have come from a stale entry.
+        ages = [age for age in (self.cache.staleness('GLOBAL_QUOTE', symbol) for symbol in symbols
+                                if quotes.get(symbol) is not None) if age is not None]
+        if ages:
+            parts = self.renderer.mark_stale(parts, language, max(ages))
+        for part in parts:
+            await update.message.reply_text(part)
 
     async def top_gainers(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        response = self.stock_api.get_top_gainers()
-        await update.message.reply_text(response)
+        await self._reply_movers(update, context, 'top_gainers')
 
     async def top_losers(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        response = self.stock_api.get_top_losers()
-        await update.message.reply_text(response)
+        await self._reply_movers(update, context, 'top_losers')
+
+    async def most_active(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await self._reply_movers(update, context, 'most_actively_traded')
+
+    async def _reply_movers(self, update: Update, context: ContextTypes.DEFAULT_TYPE, section: str):
+        """
+        Replies with one movers list. `N`, `volume=` and `price=` arguments filter the
+        already parsed list, so they never cost an extra upstream call.
+        """
+        count, min_volume, min_price = DEFAULT_COUNT, 0.0, 0.0
+        try:
+            for arg in context.args or []:
+                key, _, value = arg.partition('=')
+                if not value:
+                    count = max(1, int(key))
+                elif key.lower() == 'volume':
+                    min_volume = float(value)
+                elif key.lower() == 'price':
+                    min_price = float(value)
+                else:
+                    raise ValueError(arg)
+        except ValueError:
+            await update.message.reply_text("שימוש: /top_gainers 5 volume=100000 price=5")
+            return
+
+        async def fetch():
+            movers = await self.http_api.get_market_movers()
+            if movers is None:
+                return None, None
+            return movers[section].render(count, min_volume, min_price), self.cache.staleness('TOP_GAINERS_LOSERS')
+
+        await self._reply_rendered(update, 'movers', ('TOP_GAINERS_LOSERS', None), fetch,
+                                   key=(section, count, min_volume, min_price))
 
     async def get_sentiment(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        /sentiment AAPL [24h] replies with the news sentiment of AAPL over the window (default 7d),
+        answered from the SentimentStore.
+        """
         if not context.args:
             await update.message.reply_text("אנא ציין סימול מניה, לדוגמה: /sentiment AAPL")
             return
         symbol = context.args[0].upper()
-        response =  self.stock_api.get_sentiment(symbol)
-        await update.message.reply_text(response)
+        window, label = DEFAULT_WINDOW, '7d'
+        if len(context.args) > 1:
+            label = context.args[1].lower()
+            window = parse_window(label)
+            if window is None:
+                await update.message.reply_text("שימוש: /sentiment AAPL [24h|7d|2w]")
+                return
+        self.hot_symbols.record(symbol)
+        summary = await self.sentiment.get(symbol, window)
+        language = self.renderer.language_for(update.effective_user)
+        parts = self.renderer.render('sentiment_summary', language, summary, symbol=symbol, window=label)
+        if 'stale_for' in summary:
+            parts = self.renderer.mark_stale(parts, language, summary['stale_for'])
+        for part in parts:
+            await update.message.reply_text(part)
 
     
     async def get_holdings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -142,8 +492,8 @@ class StockTelegramBot:
             await update.message.reply_text("אנא ציין סימול מניה, לדוגמה: /holdings AAPL")
             return
         symbol = context.args[0].upper()
-        response = self.stock_api.get_holdings(symbol)
-        await update.message.reply_text(response)
+        await self._reply_rendered(update, 'holdings', ('OVERVIEW', symbol),
+                                   lambda: self.stock_api.get_holdings(symbol), symbol=symbol)
 
     
     async def get_earnings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -151,8 +501,8 @@ class StockTelegramBot:
             await update.message.reply_text("אנא ציין סימול מניה, לדוגמה: /earnings AAPL")
             return
         symbol = context.args[0].upper()
-        response = self.stock_api.get_earnings(symbol)
-        await update.message.reply_text(response)
+        await self._reply_rendered(update, 'earnings', ('EARNINGS', symbol),
+                                   lambda: self.stock_api.get_earnings(symbol), symbol=symbol)
 
     
     async def get_dividend_info(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -160,16 +510,194 @@ class StockTelegramBot:
             await update.message.reply_text("אנא ציין סימול מניה, לדוגמה: /dividend AAPL")
             return
         symbol = context.args[0].upper()
-        dividend_info =  self.stock_api.get_dividend(symbol)
-        formatted_response = (
-            f"Dividend Per Share: ${dividend_info['DividendPerShare']}\n"
-            f"Dividend Yield: {dividend_info['DividendYield']}%\n"
-            f"Ex-Dividend Date: {dividend_info['ExDividendDate']}\n"
-            f"Dividend Date: {dividend_info['DividendDate']}"
+        await self._reply_rendered(update, 'dividend', ('OVERVIEW', symbol),
+                                   lambda: self.stock_api.get_dividend(symbol), symbol=symbol)
+
+    async def _reply_rendered(self, update: Update, command: str, source: tuple, fetch, key=None, **context):
+        """
+        Replies with `command` rendered from the payload cached under `source`
+        (function, symbol). A reply already rendered from the same payload version
+        is resent as is; otherwise `fetch()` provides the data and the age of the
+        stale payload it was built from, if any. Replies built from a stale
+        payload, served while the upstream is failing, say so.
+        """
+        language = self.renderer.language_for(update.effective_user)
+        key = source[1] if key is None else key
+        parts = self.renderer.lookup(command, language, key, self.cache.version(*source))
+        if parts is None:
+            data, stale_age = await fetch()
+            parts = self.renderer.render(command, language, data, key=key, version=self.cache.version(*source),
+                                         **context)
+            if stale_age is not None:
+                parts = self.renderer.mark_stale(parts, language, stale_age)
+        for part in parts:
+            await update.message.reply_text(part)
+
+    async def broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Admin-only: /broadcast TEXT sends TEXT to every authorized user and reports
+        delivery once done.
+        """
+        admin_id = update.effective_user.id
+        if str(admin_id) not in self._security.admin_ids:
+            return
+        parts = (update.message.text or '').split(maxsplit=1)
+        if len(parts) < 2:
+            await update.message.reply_text("Usage: /broadcast TEXT")
+            return
+        rows = await self.db.fetchall('SELECT user_id FROM users WHERE is_authorized OR is_admin')
+        progress = self.outbox.broadcast((row[0] for row in rows), parts[1])
+        await update.message.reply_text(f"Broadcasting to {progress.total} users")
+
+        async def report():
+            await progress.done.wait()
+            self.outbox.send(admin_id, f"Broadcast finished. {progress.summary()}")
+
+        context.application.create_task(report())
+
+    async def stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Admin-only: /stats for latency and component counters, /stats slow for
+        the slowest profiled requests.
+        """
+        if str(update.effective_user.id) not in self._security.admin_ids:
+            await update.message.reply_text("You are not authorized to view stats.")
+            return
+
+        if context.args and context.args[0].lower() == 'slow':
+            await update.message.reply_text(self._format_slow_requests()[:MAX_MESSAGE_LENGTH])
+            return
+
+        lines = ["Handlers:"]
+        for name, handler in sorted(self.application.latency.stats().items()):
+            lines.append(f"  {name}: n={handler['count']} avg={handler['avg_ms']:.0f}ms "
+                         f"p50={handler['p50_ms']:.0f}ms p99={handler['p99_ms']:.0f}ms")
+        for title, name in (("Alpha Vantage:", 'upstream_seconds'), ("Database:", 'db_query_seconds')):
+            lines.append(title)
+            for labels, histogram in sorted(metrics.histograms(name).items()):
+                label = ' '.join(value for _, value in labels if value)
+                lines.append(f"  {label}: n={histogram.count} avg={histogram.sum / histogram.count * 1000:.0f}ms "
+                             f"p99<={histogram.quantile(0.99) * 1000:.0f}ms")
+        for component, values in metrics.collect().items():
+            lines.append(f"{component}: " + ', '.join(f"{key}={value}" for key, value in values.items()))
+        await update.message.reply_text('\n'.join(lines)[:MAX_MESSAGE_LENGTH])
+
+    def _format_slow_requests(self) -> str:
+        profiler = self.application.latency.profiler
+        if not profiler.enabled:
+            return "Profiling is off. Set PROFILE_SAMPLE_RATE to enable it."
+        slowest = profiler.slowest()
+        if not slowest:
+            return "No profiled requests yet."
+        lines = []
+        for record in slowest:
+            lines.append(f"/{record['request']} {record['detail']} {record['ms']:.0f}ms at {record['at']}")
+            for name, labels, ms in record['spans']:
+                lines.append(f"  {name} {' '.join(str(value) for value in labels.values())} {ms:.0f}ms")
+        return '\n'.join(lines)
+
+    async def _post_init(self, application: Application):
+        self.scheduler.bind(asyncio.get_running_loop())
+        self.outbox.start(application.bot)
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        application.job_queue.run_repeating(
+            self._security.flush_counters,
+            interval=self.counter_flush_interval,
+            name='flush_request_counters'
+        )
+        if self.response_store is not None:
+            application.job_queue.run_repeating(
+                self.response_store.flush,
+                interval=self.response_store_flush_interval,
+                name='flush_response_store'
+            )
+        application.job_queue.run_repeating(
+            self.alerts.run,
+            interval=self.alerts.interval,
+            first=self.alerts.interval,
+            name='price_alerts'
         )
-        await update.message.reply_text(formatted_response)
+        if self.warmup_delay >= 0:
+            application.job_queue.run_once(self._warm_up, when=self.warmup_delay, name='warm_up')
+        if self.worker_id:
+            # Prefetching and pruning the shared cache are left to worker 0.
+            return
+        if isinstance(self.cache, SharedResponseCache):
+            application.job_queue.run_repeating(self.cache.prune, interval=10 * 60, name='prune_shared_cache')
+        if self.prefetcher.budget() > 0:
+            application.job_queue.run_repeating(
+                self.prefetcher.run,
+                interval=self.prefetcher.interval,
+                first=self.prefetcher.interval,
+                name='prefetch'
+            )
+
+    async def _warm_up(self, context=None):
+        """
+        Loads the heavy dependencies left out of startup (alpha_vantage with pandas,
+        NumPy, aiohttp) off the event loop, so the first user to need them does not wait.
+        """
+        loop = asyncio.get_running_loop()
+        await self.stock_api.warm_up()
+        # Importing a submodule loads the lazily imported aiohttp package too.
+        for module in ('app.history', 'aiohttp.client'):
+            await loop.run_in_executor(None, importlib.import_module, module)
+        await self.http_api.start()
+
+    async def _post_shutdown(self, application: Application):
+        await self.outbox.stop()
+        await self._security.flush_counters()
+        self.db.close()
+        if self.response_store is not None:
+            await self.response_store.flush()
+            self.response_store.db.close()
+        if self.shared_db is not None:
+            self.scheduler.close()
+            self.shared_db.close()
+        self.stock_api.shutdown()
+        await self.http_api.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        for component, values in metrics.collect().items():
+            print(f"{component}: {values}")
+        print(f"Handler latency: {self.application.latency.stats()}")
+        profiler = self.application.latency.profiler
+        if profiler.enabled and self.profile_dump_path:
+            profiler.dump(self.profile_dump_path)
+            print(f"Slowest requests written to {self.profile_dump_path}")
+
     def run(self):
-        self.application.run_polling()
+        if self.webhook_server is not None:
+            asyncio.run(self._run_webhook())
+        else:
+            self.application.run_polling()
+
+    async def _run_webhook(self):
+        """
+        Serves updates through the local webhook server until SIGINT/SIGTERM.
+        """
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        await self.application.initialize()
+        await self._post_init(self.application)
+        await self.application.start()
+        try:
+            await self.webhook_server.start()
+            if self.worker_id is None:
+                await self.application.bot.set_webhook(
+                    url=self.webhook_url,
+                    secret_token=self.webhook_server.secret_token
+                )
+            await stop.wait()
+        finally:
+            await self.webhook_server.stop()
+            await self.application.stop()
+            await self._post_shutdown(self.application)
+            await self.application.shutdown()
 
 
 def load_environment():
@@ -199,21 +727,148 @@ def load_environment():
         'alpha_vantage_key': os.getenv('ALPHA_VANTAGE_KEY'),
         'admins': os.getenv('ALLOWED_USERS', '').split(','),
         'daily_cost_limit': float(os.getenv('DAILY_COST_LIMIT', '1.0')),
-        'max_requests': float(os.getenv('MAX_REQUESTS', '25'))
+        'max_requests': int(os.getenv('MAX_REQUESTS', '25')),
+        'api_workers': int(os.getenv('STOCK_API_WORKERS', '8')),
+        'api_max_in_flight': int(os.getenv('STOCK_API_MAX_IN_FLIGHT', '16')),
+        'api_timeout': float(os.getenv('STOCK_API_TIMEOUT', '15')),
+        'cache_max_entries': int(os.getenv('CACHE_MAX_ENTRIES', '1024')),
+        'cache_max_bytes': int(float(os.getenv('CACHE_MAX_MB', '32')) * 1024 * 1024),
+        'api_calls_per_minute': int(os.getenv('AV_CALLS_PER_MINUTE', '5')),
+        'api_calls_per_day': int(os.getenv('AV_CALLS_PER_DAY', '500')),
+        'counter_flush_interval': float(os.getenv('COUNTER_FLUSH_INTERVAL', '30')),
+        'prefetch_interval': float(os.getenv('PREFETCH_INTERVAL', '60')),
+        'prefetch_quota_share': float(os.getenv('PREFETCH_QUOTA_SHARE', '0.2')),
+        'prefetch_hot_symbols': int(os.getenv('PREFETCH_HOT_SYMBOLS', '10')),
+        'webhook_url': os.getenv('WEBHOOK_URL'),
+        'webhook_secret': os.getenv('WEBHOOK_SECRET'),
+        'webhook_listen': os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+        'webhook_port': int(os.getenv('WEBHOOK_PORT', '8443')),
+        'webhook_path': os.getenv('WEBHOOK_PATH', '/telegram'),
+        'max_concurrent_updates': int(os.getenv('MAX_CONCURRENT_UPDATES', '32')),
+        'max_pending_updates': int(os.getenv('MAX_PENDING_UPDATES', '1000')),
+        'metrics_host': os.getenv('METRICS_HOST', '127.0.0.1'),
+        'metrics_port': int(os.getenv('METRICS_PORT')) if os.getenv('METRICS_PORT') else None,
+        'profile_sample_rate': float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+        'profile_keep': int(os.getenv('PROFILE_KEEP', '20')),
+        'profile_dump_path': os.getenv('PROFILE_DUMP_PATH', 'slow_requests.json'),
+        'telegram_base_url': os.getenv('TELEGRAM_BASE_URL'),
+        'alpha_vantage_url': os.getenv('ALPHA_VANTAGE_URL'),
+        'response_store_path': os.getenv('RESPONSE_STORE_PATH', 'responses.db'),
+        'response_store_flush_interval': float(os.getenv('RESPONSE_STORE_FLUSH_INTERVAL', '30')),
+        'alert_interval': float(os.getenv('ALERT_CHECK_INTERVAL', '60')),
+        'alert_symbols_per_run': int(os.getenv('ALERT_SYMBOLS_PER_RUN', '100')),
+        'history_outputsize': os.getenv('HISTORY_OUTPUTSIZE', 'compact'),
+        'history_max_series': int(os.getenv('HISTORY_MAX_SERIES', '200')),
+        'default_language': os.getenv('DEFAULT_LANGUAGE', 'he'),
+        'render_cache_entries': int(os.getenv('RENDER_CACHE_ENTRIES', '4096')),
+        'circuit_failure_threshold': int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5')),
+        'circuit_reset_timeout': float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30')),
+        'upstream_attempts': int(os.getenv('UPSTREAM_ATTEMPTS', '3')),
+        'upstream_retry_budget': float(os.getenv('UPSTREAM_RETRY_BUDGET', '10')),
+        'warmup_delay': float(os.getenv('WARMUP_DELAY', '5')),
+        'outbox_workers': int(os.getenv('OUTBOX_WORKERS', '30')),
+        'outbox_max_queue': int(os.getenv('OUTBOX_MAX_QUEUE', '10000')),
+        'outbox_global_rate': float(os.getenv('OUTBOX_GLOBAL_RATE', '30')),
+        'sentiment_refresh_interval': float(os.getenv('SENTIMENT_REFRESH_INTERVAL', '900')),
+        'sentiment_retention': float(os.getenv('SENTIMENT_RETENTION_DAYS', '30')) * 24 * 60 * 60,
+        'workers': int(os.getenv('WORKERS', '1')),
+        'worker_base_port': int(os.getenv('WORKER_BASE_PORT', '8600')),
+        'shared_state_path': os.getenv('SHARED_STATE_PATH', 'shared_state.db'),
+        # Set by the supervisor for the worker processes it starts. WORKER_SECRET may
+        # also be given to the supervisor, e.g. to reach the workers directly.
+        'worker_id': int(os.getenv('WORKER_ID')) if os.getenv('WORKER_ID') else None,
+        'worker_secret': os.getenv('WORKER_SECRET')
     }
 
 
+def run_supervisor(env: dict):
+    from app.supervisor import Supervisor
+    Supervisor(
+        env['telegram_token'],
+        env['workers'],
+        base_url=env['telegram_base_url'],
+        worker_base_port=env['worker_base_port'],
+        webhook_url=env['webhook_url'],
+        webhook_secret=env['webhook_secret'],
+        webhook_listen=env['webhook_listen'],
+        webhook_port=env['webhook_port'],
+        webhook_path=env['webhook_path'],
+        max_pending_updates=env['max_pending_updates'],
+        worker_secret=env['worker_secret']
+    ).run()
+
+
 def main():
     try:
         db = DatabaseManager('bot_security.db')
         db.init_tables()
         env = load_environment()
-        sec = Security(db, env['admins'])
+        if env['workers'] > 1 and env['worker_id'] is None:
+            print(f"מפעיל {env['workers']} תהליכי עבודה")
+            run_supervisor(env)
+            return
+
+        worker_id = env['worker_id']
+        user_cache = None
+        if worker_id is not None:
+            # Updates come from the supervisor through a local webhook; request counters live in the shared table.
+            env.update(webhook_url=None, webhook_secret=env['worker_secret'], webhook_listen='127.0.0.1',
+                       webhook_port=env['worker_base_port'] + worker_id)
+            if env['metrics_port']:
+                env['metrics_port'] += 1 + worker_id
+            user_cache = SharedUserStateCache(db)
+        sec = Security(db, env['admins'], max_requests=env['max_requests'], user_cache=user_cache)
         bot = StockTelegramBot(
             telegram_token=env['telegram_token'],
             alpha_vantage_key=env['alpha_vantage_key'],
             security=sec,
-            db_manager=db
+            db_manager=db,
+            api_workers=env['api_workers'],
+            api_max_in_flight=env['api_max_in_flight'],
+            api_timeout=env['api_timeout'],
+            cache_max_entries=env['cache_max_entries'],
+            cache_max_bytes=env['cache_max_bytes'],
+            api_calls_per_minute=env['api_calls_per_minute'],
+            api_calls_per_day=env['api_calls_per_day'],
+            counter_flush_interval=env['counter_flush_interval'],
+            prefetch_interval=env['prefetch_interval'],
+            prefetch_quota_share=env['prefetch_quota_share'],
+            prefetch_hot_symbols=env['prefetch_hot_symbols'],
+            webhook_url=env['webhook_url'],
+            webhook_secret=env['webhook_secret'],
+            webhook_listen=env['webhook_listen'],
+            webhook_port=env['webhook_port'],
+            webhook_path=env['webhook_path'],
+            max_concurrent_updates=env['max_concurrent_updates'],
+            max_pending_updates=env['max_pending_updates'],
+            metrics_host=env['metrics_host'],
+            metrics_port=env['metrics_port'],
+            profile_sample_rate=env['profile_sample_rate'],
+            profile_keep=env['profile_keep'],
+            profile_dump_path=env['profile_dump_path'],
+            telegram_base_url=env['telegram_base_url'],
+            alpha_vantage_url=env['alpha_vantage_url'],
+            response_store_path=env['response_store_path'],
+            response_store_flush_interval=env['response_store_flush_interval'],
+            alert_interval=env['alert_interval'],
+            alert_symbols_per_run=env['alert_symbols_per_run'],
+            history_outputsize=env['history_outputsize'],
+            history_max_series=env['history_max_series'],
+            default_language=env['default_language'],
+            render_cache_entries=env['render_cache_entries'],
+            circuit_failure_threshold=env['circuit_failure_threshold'],
+            circuit_reset_timeout=env['circuit_reset_timeout'],
+            upstream_attempts=env['upstream_attempts'],
+            upstream_retry_budget=env['upstream_retry_budget'],
+            warmup_delay=env['warmup_delay'],
+            outbox_workers=env['outbox_workers'],
+            outbox_max_queue=env['outbox_max_queue'],
+            outbox_global_rate=env['outbox_global_rate'],
+            sentiment_refresh_interval=env['sentiment_refresh_interval'],
+            sentiment_retention=env['sentiment_retention'],
+            worker_id=worker_id,
+            workers=env['workers'] if worker_id is not None else 1,
+            shared_state_path=env['shared_state_path'] if worker_id is not None else None
         )
         bot.register_handlers()
         print("הבוט מופעל! 🚀")
@@ -0,0 +1,201 @@
+import asyncio
+import hmac
+import os
+import secrets
+import signal
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+import aiohttp
+from aiohttp import web
+
+from app.webhook import SECRET_HEADER
+
+TELEGRAM_BASE_URL = 'https://api.telegram.org/bot'
+
+MAIN_SCRIPT = Path(__file__).resolve().parent.parent / 'main.py'
+
+
+def user_id_of(update: dict) -> int:
+    """
+    The user who sent an update, falling back to its chat (e.g. channel posts); 0 if it has neither.
+    """
+    for key, value in update.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        sender = value.get('from')
+        if isinstance(sender, dict) and 'id' in sender:
+            return sender['id']
+        chat = value.get('chat')
+        if isinstance(chat, dict) and 'id' in chat:
+            return chat['id']
+    return 0
+
+
+class Supervisor:
+    """
+    Runs the bot as `workers` processes behind one update feed.
+
+    The supervisor is the only process that receives updates from Telegram:
+    it long-polls getUpdates, or serves the public webhook when `webhook_url`
+    is set. Each update's JSON is forwarded to the local webhook of worker
+    user_id % workers, one at a time per worker, so a user's updates always
+    reach the same worker and in order. Sharding by user keeps per-user
+    state, such as price alerts, on the worker that loaded it; in a private
+    chat the chat id is the user id. At most `max_pending_updates` wait per
+    worker; beyond that the feed waits. Workers that exit are restarted after
+    `restart_delay` seconds.
+
+    Workers are main.py started with WORKER_ID set. They share the quote
+    cache, the Alpha Vantage quota and per-user request counters through
+    SQLite (see app.shared_state and SharedUserStateCache).
+    """
+
+    def __init__(self, token: str, workers: int, base_url: Optional[str] = None, worker_base_port: int = 8600,
+                 webhook_url: Optional[str] = None, webhook_secret: Optional[str] = None,
+                 webhook_listen: str = '0.0.0.0', webhook_port: int = 8443, webhook_path: str = '/telegram',
+                 poll_timeout: int = 30, max_pending_updates: int = 1000, restart_delay: float = 1.0,
+                 stop_timeout: float = 15.0, worker_secret: Optional[str] = None):
+        self.token = token
+        self.workers = workers
+        self.api_url = f"{base_url or TELEGRAM_BASE_URL}{token}"
+        self.worker_base_port = worker_base_port
+        self.webhook_url = webhook_url
+        # Registered with setWebhook and checked on Telegram's requests; random unless given.
+        self.webhook_secret = webhook_secret or secrets.token_urlsafe(24)
+        self.webhook_listen = webhook_listen
+        self.webhook_port = webhook_port
+        self.webhook_path = webhook_path
+        self.poll_timeout = poll_timeout
+        self.restart_delay = restart_delay
+        self.stop_timeout = stop_timeout
+        # Authenticates the supervisor to the workers' local webhooks; random unless given.
+        self.worker_secret = worker_secret or secrets.token_urlsafe(24)
+        self._queues = [asyncio.Queue(max_pending_updates) for _ in range(workers)]
+        self._processes: Dict[int, asyncio.subprocess.Process] = {}
+        self._stopping = asyncio.Event()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.received = 0
+        self.forwarded = [0] * workers
+        self.restarts = 0
+
+    def run(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopping.set)
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.poll_timeout + 10))
+        tasks = [asyncio.create_task(self._keep_running(index)) for index in range(self.workers)]
+        tasks += [asyncio.create_task(self._forward(index)) for index in range(self.workers)]
+        feed = asyncio.create_task(self._serve_webhook() if self.webhook_url else self._poll())
+        try:
+            await self._stopping.wait()
+        finally:
+            feed.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(feed, *tasks, return_exceptions=True)
+            await self._stop_workers()
+            await self._session.close()
+            print(f"Supervisor: received {self.received} updates, forwarded {self.forwarded}, "
+                  f"restarted workers {self.restarts} times")
+
+    def worker_port(self, index: int) -> int:
+        return self.worker_base_port + index
+
+    async def _spawn(self, index: int) -> asyncio.subprocess.Process:
+        env = dict(os.environ, WORKER_ID=str(index), WORKERS=str(self.workers), WORKER_SECRET=self.worker_secret,
+                   WORKER_BASE_PORT=str(self.worker_base_port))
+        return await asyncio.create_subprocess_exec(sys.executable, str(MAIN_SCRIPT), env=env)
+
+    async def _keep_running(self, index: int):
+        while True:
+            process = self._processes[index] = await self._spawn(index)
+            print(f"Worker {index} started (pid {process.pid}, port {self.worker_port(index)})")
+            code = await process.wait()
+            if self._stopping.is_set():
+                return
+            self.restarts += 1
+            print(f"Worker {index} exited with {code}, restarting in {self.restart_delay:g}s")
+            await asyncio.sleep(self.restart_delay)
+
+    async def _stop_workers(self):
+        running = [process for process in self._processes.values() if process.returncode is None]
+        for process in running:
+            process.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(process.wait() for process in running)), self.stop_timeout)
+        except asyncio.TimeoutError:
+            for process in running:
+                if process.returncode is None:
+                    process.kill()
+            await asyncio.gather(*(process.wait() for process in running))
+
+    async def _dispatch(self, update: dict):
+        self.received += 1
+        await self._queues[user_id_of(update) % self.workers].put(update)
+
+    async def _forward(self, index: int):
+        """
+        Posts the updates of one worker in order, retrying while it is down or restarting.
+        """
+        url = f"http://127.0.0.1:{self.worker_port(index)}{self.webhook_path}"
+        headers = {SECRET_HEADER: self.worker_secret}
+        queue = self._queues[index]
+        while True:
+            update = await queue.get()
+            while True:
+                try:
+                    async with self._session.post(url, json=update, headers=headers) as response:
+                        if response.status < 500:
+                            break
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+                await asyncio.sleep(0.5)
+            self.forwarded[index] += 1
+
+    async def _call(self, method: str, **params):
+        async with self._session.post(f"{self.api_url}/{method}", json=params) as response:
+            data = await response.json()
+        if not data.get('ok'):
+            raise RuntimeError(f"{method} failed: {data.get('description')}")
+        return data['result']
+
+    async def _poll(self):
+        await self._call('deleteWebhook')
+        offset = 0
+        while True:
+            try:
+                updates = await self._call('getUpdates', offset=offset, timeout=self.poll_timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+                print(f"getUpdates failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update['update_id'] + 1
+                await self._dispatch(update)
+
+    async def _serve_webhook(self):
+        async def handle(request: web.Request) -> web.Response:
+            if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), self.webhook_secret):
+                return web.Response(status=403)
+            try:
+                update = await request.json()
+            except ValueError:
+                return web.Response(status=400)
+            await self._dispatch(update)
+            return web.Response()
+
+        app = web.Application()
+        app.router.add_post(self.webhook_path, handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, self.webhook_listen, self.webhook_port).start()
+            await self._call('setWebhook', url=self.webhook_url, secret_token=self.webhook_secret)
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
@@ -0,0 +1,58 @@
+import hmac
+import secrets
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+
+from app.dispatcher import OrderedApplication
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    """
+    Local aiohttp server that receives Telegram updates and hands them to the Application.
+
+    Each update is acknowledged once the Application has accepted it. With
+    OrderedApplication that is as soon as it is queued; when its
+    `max_pending_updates` are taken the request waits, which pushes back on
+    Telegram. Requests must carry `secret_token`; when none is configured a
+    random one is generated, for the caller to register with set_webhook.
+    """
+
+    def __init__(self, application: OrderedApplication, secret_token: Optional[str], host: str = '0.0.0.0',
+                 port: int = 8443, path: str = '/telegram'):
+        self.application = application
+        self.secret_token = secret_token or secrets.token_urlsafe(24)
+        self.host = host
+        self.port = port
+        self.path = path
+        self._runner: Optional[web.AppRunner] = None
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret_token):
+            self.rejected += 1
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except ValueError:
+            return web.Response(status=400)
+
+        self.received += 1
+        await self.application.process_update(update)
+        return web.Response()
@@ -0,0 +1,166 @@
+"""
+Drives StockTelegramBot handlers offline at N concurrent users.
+
+Runs the bot in polling mode against FakeTelegram, with Alpha Vantage replaced
+by FakeAlphaVantage. Every simulated user sends a command, waits for the reply
+and sends the next one. Reports push-to-reply throughput and latency per
+scenario, plus how many upstream calls it took.
+
+    python -m benchmarks.bot_scenarios --scenarios quote mixed --users 50 --requests 20 --av-latency 0.1
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from app.stock_telegram_bot import StockTelegramBot
+from benchmarks.fake_alpha_vantage import FakeAlphaVantage
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.stats import format_summary, summarize
+from utils.db_utils import DatabaseManager
+from utils.security import Security
+
+SYMBOLS = ['AAPL', 'MSFT', 'NVDA', 'AMZN', 'GOOGL', 'META', 'TSLA', 'AVGO', 'JPM', 'LLY',
+           'V', 'UNH', 'XOM', 'MA', 'JNJ', 'PG', 'HD', 'COST', 'MRK', 'ABBV',
+           'CVX', 'CRM', 'AMD', 'PEP', 'KO', 'ADBE', 'WMT', 'BAC', 'NFLX', 'TMO',
+           'MCD', 'CSCO', 'ACN', 'ABT', 'LIN', 'ORCL', 'INTC', 'DIS', 'WFC', 'IBM',
+           'QCOM', 'TXN', 'CAT', 'AMGN', 'PFE', 'INTU', 'GE', 'NOW', 'UBER', 'SPY']
+
+
+def quote(rng, symbols):
+    return f"/stock {rng.choice(symbols)}"
+
+
+def multi_quote(rng, symbols):
+    return "/stock " + " ".join(rng.sample(symbols, min(5, len(symbols))))
+
+
+def watchlist(rng, symbols):
+    if rng.random() < 0.2:
+        return "/watchlist " + " ".join(rng.sample(symbols, min(8, len(symbols))))
+    return "/watchlist"
+
+
+def movers(rng, symbols):
+    return rng.choice(["/top_gainers 5", "/top_losers", "/most_active volume=1000000"])
+
+
+def fundamentals(rng, symbols):
+    command = rng.choice(['dividend', 'holdings', 'earnings', 'sentiment', 'chart', 'indicators'])
+    return f"/{command} {rng.choice(symbols)}"
+
+
+def mixed(rng, symbols):
+    command = rng.choices([quote, multi_quote, watchlist, movers, fundamentals], weights=[5, 1, 2, 1, 1])[0]
+    return command(rng, symbols)
+
+
+SCENARIOS = {
+    'quote': quote,
+    'multi_quote': multi_quote,
+    'watchlist': watchlist,
+    'movers': movers,
+    'fundamentals': fundamentals,
+    'mixed': mixed,
+}
+
+
+async def run_scenario(name: str, args) -> dict:
+    telegram = FakeTelegram(port=args.telegram_port)
+    alpha_vantage = FakeAlphaVantage(port=args.av_port, latency=args.av_latency, jitter=args.av_jitter,
+                                     calls_per_minute=args.av_calls_per_minute, throttle_rate=args.av_throttle_rate,
+                                     premium=args.av_premium)
+    await telegram.start()
+    await alpha_vantage.start()
+    workdir = tempfile.TemporaryDirectory()
+    db = DatabaseManager(str(Path(workdir.name) / 'bench.db'))
+    db.init_tables()
+    bot = StockTelegramBot(
+        telegram_token=telegram.token,
+        db_manager=db,
+        security=Security(db, []),
+        alpha_vantage_key='bench',
+        api_calls_per_minute=args.api_calls_per_minute,
+        api_calls_per_day=10 ** 9,
+        max_concurrent_updates=args.concurrency,
+        telegram_base_url=telegram.base_url,
+        alpha_vantage_url=alpha_vantage.url
+    )
+    bot.register_handlers()
+    application = bot.application
+    rng = random.Random(args.seed)
+    symbols = SYMBOLS[:args.symbols]
+    command = SCENARIOS[name]
+    failures = 0
+
+    async def user(chat_id: int):
+        nonlocal failures
+        for _ in range(args.requests):
+            expected = len(telegram.sent[chat_id]) + 1
+            await telegram.push(chat_id, command(rng, symbols), username=f'user{chat_id}')
+            try:
+                await telegram.wait_for_chat(chat_id, expected, args.reply_timeout)
+            except asyncio.TimeoutError:
+                failures += 1
+                telegram.forget(chat_id)
+
+    # The bot prints its component stats at shutdown; keep them out of the report.
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        await application.initialize()
+        await bot._post_init(application)
+        await application.updater.start_polling(poll_interval=0.0, timeout=10)
+        await application.start()
+        # Steady state: load the lazily imported clients before the clock starts.
+        await bot._warm_up()
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(1000 + i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+        summary = summarize(telegram.latencies, elapsed)
+        summary.update(failures=failures, upstream_calls=sum(alpha_vantage.calls.values()),
+                       throttled=alpha_vantage.throttled)
+        return summary
+    finally:
+        with contextlib.redirect_stdout(log):
+            await application.updater.stop()
+            await application.stop()
+            await bot._post_shutdown(application)
+            await application.shutdown()
+        await alpha_vantage.stop()
+        await telegram.stop()
+        workdir.cleanup()
+        if args.verbose:
+            print(log.getvalue(), end='')
+
+
+async def main(args):
+    for name in args.scenarios:
+        summary = await run_scenario(name, args)
+        print(f"{format_summary(name, summary)}  failed={summary['failures']} "
+              f"upstream={summary['upstream_calls']} throttled={summary['throttled']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=20, help='commands sent by each user')
+    parser.add_argument('--symbols', type=int, default=len(SYMBOLS), help='size of the symbol pool')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--api-calls-per-minute', type=int, default=10 ** 6, help="the bot's own scheduler limit")
+    parser.add_argument('--av-latency', type=float, default=0.05, help='seconds per Alpha Vantage reply')
+    parser.add_argument('--av-jitter', type=float, default=0.05)
+    parser.add_argument('--av-calls-per-minute', type=int, default=None, help='throttle beyond this many calls')
+    parser.add_argument('--av-throttle-rate', type=float, default=0.0, help='share of calls answered with a Note')
+    parser.add_argument('--av-premium', action='store_true', help='serve REALTIME_BULK_QUOTES')
+    parser.add_argument('--reply-timeout', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--telegram-port', type=int, default=8081)
+    parser.add_argument('--av-port', type=int, default=8082)
+    parser.add_argument('--verbose', action='store_true', help="print the bot's shutdown stats")
+    asyncio.run(main(parser.parse_args()))
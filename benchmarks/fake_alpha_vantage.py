@@ -0,0 +1,136 @@
+import asyncio
+import json
+import random
+import time
+import zlib
+from collections import Counter, deque
+from pathlib import Path
+from typing import Dict, Optional
+
+from aiohttp import web
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'alpha_vantage.json'
+
+# Symbol the fixtures were recorded for; replaced by the requested one when replaying.
+RECORDED_SYMBOL = 'IBM'
+
+THROTTLE_NOTE = ('Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute '
+                 'and 500 calls per day.')
+PREMIUM_NOTE = 'Thank you for using Alpha Vantage! This is a premium endpoint.'
+
+
+class FakeAlphaVantage:
+    """
+    Local stand-in for https://www.alphavantage.co/query.
+
+    Replays the recorded payloads in fixtures/alpha_vantage.json with the
+    requested symbol substituted. Every reply waits `latency` seconds plus up to
+    `jitter`. Calls beyond `calls_per_minute` in a sliding minute, and a random
+    `throttle_rate` share of the rest, get the throttling "Note" instead.
+    REALTIME_BULK_QUOTES answers with the premium notice unless `premium` is set.
+    NEWS_SENTIMENT articles are re-dated to one an hour up to now, so they fall
+    in the bot's windows, and honour time_from.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8082, latency: float = 0.0, jitter: float = 0.0,
+                 calls_per_minute: Optional[int] = None, throttle_rate: float = 0.0, premium: bool = False,
+                 fixtures: Path = FIXTURES):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.calls_per_minute = calls_per_minute
+        self.throttle_rate = throttle_rate
+        self.premium = premium
+        with open(fixtures, encoding='utf-8') as f:
+            self._recorded: Dict[str, str] = {function: json.dumps(payload) for function, payload in json.load(f).items()}
+        self.calls: Counter = Counter()
+        self.throttled = 0
+        self._window: deque = deque()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/query"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/query', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def reset(self):
+        self.calls.clear()
+        self.throttled = 0
+        self._window.clear()
+
+    def _over_limit(self) -> bool:
+        now = time.monotonic()
+        while self._window and now - self._window[0] >= 60:
+            self._window.popleft()
+        if self.calls_per_minute is not None and len(self._window) >= self.calls_per_minute:
+            return True
+        self._window.append(now)
+        return random.random() < self.throttle_rate
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        function = request.query.get('function', '')
+        symbol = (request.query.get('symbol') or request.query.get('tickers') or RECORDED_SYMBOL).upper()
+        self.calls[function] += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self._over_limit():
+            self.throttled += 1
+            return web.json_response({'Note': THROTTLE_NOTE})
+        if function == 'REALTIME_BULK_QUOTES':
+            if not self.premium:
+                return web.json_response({'Information': PREMIUM_NOTE})
+            return web.json_response({'endpoint': 'Realtime Bulk Quotes',
+                                      'data': [self._bulk_row(s) for s in symbol.split(',') if s]})
+        if function == 'NEWS_SENTIMENT':
+            return web.json_response(self._news(symbol, request.query.get('time_from')))
+        recorded = self._recorded.get(function)
+        if recorded is None:
+            return web.json_response({'Error Message': f'Invalid API call. Unknown function {function}.'})
+        return web.Response(text=recorded.replace(f'"{RECORDED_SYMBOL}', f'"{symbol}'),
+                            content_type='application/json')
+
+    def _news(self, symbol: str, time_from: Optional[str]) -> dict:
+        payload = json.loads(self._recorded['NEWS_SENTIMENT'].replace(f'"{RECORDED_SYMBOL}', f'"{symbol}'))
+        hour = int(time.time()) // 3600 * 3600
+        feed = []
+        for age, article in enumerate(payload['feed']):
+            published = time.strftime('%Y%m%dT%H%M%S', time.gmtime(hour - age * 3600))
+            if time_from and published[:13] < time_from:
+                break
+            article['time_published'] = published
+            article['url'] = article['url'].replace(f'/{RECORDED_SYMBOL.lower()}/', f'/{symbol.lower()}/')
+            feed.append(article)
+        payload['items'] = str(len(feed))
+        payload['feed'] = feed
+        return payload
+
+    def _bulk_row(self, symbol: str) -> dict:
+        quote = json.loads(self._recorded['GLOBAL_QUOTE'])['Global Quote']
+        # Different but stable prices per symbol.
+        price = float(quote['05. price']) * (0.5 + zlib.crc32(symbol.encode()) % 1000 / 1000)
+        return {
+            'symbol': symbol,
+            'timestamp': f"{quote['07. latest trading day']} 16:00:00",
+            'open': quote['02. open'],
+            'high': quote['03. high'],
+            'low': quote['04. low'],
+            'close': f'{price:.4f}',
+            'volume': quote['06. volume'],
+            'previous_close': quote['08. previous close'],
+            'change': quote['09. change'],
+            'change_percent': quote['10. change percent'].rstrip('%'),
+        }
@@ -0,0 +1,165 @@
+import asyncio
+import itertools
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def command_update(update_id: int, chat_id: int, text: str, username: str = 'bench') -> dict:
+    """
+    Builds a private-chat message update in Bot API JSON, with a bot_command entity
+    when the text starts with '/'.
+    """
+    user = {'id': chat_id, 'is_bot': False, 'first_name': username, 'username': username}
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private', 'username': username},
+        'from': user,
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+class FakeTelegram:
+    """
+    Local stand-in for the Telegram Bot API.
+
+    Serves /bot<token>/<method> for the calls python-telegram-bot makes. Pushed
+    updates are queued for getUpdates, or POSTed to the webhook once one is set.
+    Every sendMessage is matched to the oldest unanswered update of its chat, so
+    `latencies` holds push-to-reply time per update.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8081, token: str = '123456:fake-token'):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.latencies: List[float] = []
+        self.sent: Dict[int, List[str]] = defaultdict(list)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._pending: List[dict] = []
+        self._new_updates = asyncio.Event()
+        self._unanswered: Dict[int, deque] = defaultdict(deque)
+        self._replied = asyncio.Condition()
+        self._runner: Optional[web.AppRunner] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._session = aiohttp.ClientSession()
+
+    async def stop(self):
+        if self._session is not None:
+            await self._session.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def reset(self):
+        self.latencies.clear()
+        self.sent.clear()
+
+    async def push(self, chat_id: int, text: str, username: str = 'bench'):
+        update = command_update(next(self._update_ids), chat_id, text, username)
+        self._unanswered[chat_id].append(time.perf_counter())
+        if self.webhook_url:
+            headers = {SECRET_HEADER: self.webhook_secret} if self.webhook_secret else {}
+            async with self._session.post(self.webhook_url, json=update, headers=headers) as response:
+                response.raise_for_status()
+        else:
+            self._pending.append(update)
+            self._new_updates.set()
+
+    async def wait_for_replies(self, count: int, timeout: float = 60.0):
+        async with self._replied:
+            await asyncio.wait_for(self._replied.wait_for(lambda: len(self.latencies) >= count), timeout)
+
+    async def wait_for_chat(self, chat_id: int, count: int, timeout: float = 60.0):
+        """
+        Waits until `count` messages in total were sent to `chat_id`.
+        """
+        async with self._replied:
+            await asyncio.wait_for(self._replied.wait_for(lambda: len(self.sent[chat_id]) >= count), timeout)
+
+    def forget(self, chat_id: int):
+        """
+        Drops the oldest unanswered update of `chat_id`, so a missing reply does not
+        shift the latencies of the ones after it.
+        """
+        if self._unanswered[chat_id]:
+            self._unanswered[chat_id].popleft()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if request.match_info['token'] != self.token:
+            return web.json_response({'ok': False, 'error_code': 401, 'description': 'Unauthorized'}, status=401)
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        method = request.match_info['method']
+        handler = getattr(self, f'_api_{method}', None)
+        if handler is None:
+            return web.json_response({'ok': True, 'result': True})
+        return web.json_response({'ok': True, 'result': await handler(params)})
+
+    async def _api_getMe(self, params):
+        return {'id': int(self.token.split(':')[0]), 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+    async def _api_setWebhook(self, params):
+        self.webhook_url = params.get('url') or None
+        self.webhook_secret = params.get('secret_token') or None
+        return True
+
+    async def _api_deleteWebhook(self, params):
+        self.webhook_url = None
+        return True
+
+    async def _api_getUpdates(self, params):
+        offset = int(params.get('offset') or 0)
+        self._pending = [update for update in self._pending if update['update_id'] >= offset]
+        if not self._pending:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._pending[:int(params.get('limit') or 100)]
+
+    async def _api_sendMessage(self, params):
+        chat_id = int(params['chat_id'])
+        now = time.perf_counter()
+        async with self._replied:
+            self.sent[chat_id].append(params.get('text', ''))
+            if self._unanswered[chat_id]:
+                self.latencies.append(now - self._unanswered[chat_id].popleft())
+            self._replied.notify_all()
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+
+    async def _api_answerCallbackQuery(self, params):
+        return True
+
+    async def _api_editMessageText(self, params):
+        return await self._api_sendMessage(params)
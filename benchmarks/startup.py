@@ -0,0 +1,138 @@
+"""
+Measures cold start: process launch to the first handled update.
+
+Queues a /start update on FakeTelegram, launches main.py in a fresh
+interpreter with -X importtime and times how long the reply takes. Also
+reports the bot module's import time and its slowest direct imports, and
+which heavy dependencies were loaded before the process was stopped.
+
+    python -m benchmarks.startup --runs 5 --top 10
+"""
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from benchmarks.fake_telegram import FakeTelegram
+
+ROOT = Path(__file__).resolve().parent.parent
+
+BOT_MODULE = 'app.stock_telegram_bot'
+
+# Dependencies that should stay off the startup path.
+HEAVY_MODULES = ('alpha_vantage', 'pandas', 'numpy', 'aiohttp', 'requests')
+
+CHAT_ID = 4242
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, int, str]]:
+    """
+    Parses -X importtime lines into (cumulative microseconds, depth, module).
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # One space after the bar, then two per nesting level.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((int(cumulative), depth, name.strip()))
+    return imports
+
+
+def bot_imports(imports: List[Tuple[int, int, str]]) -> Tuple[int, Dict[str, int]]:
+    """
+    Cumulative import time of BOT_MODULE and of each of its direct imports.
+
+    importtime prints a module after its children, so the children of
+    BOT_MODULE are the lines one level deeper right before it.
+    """
+    for index, (cumulative, depth, name) in enumerate(imports):
+        if name == BOT_MODULE:
+            children = {}
+            for child_cumulative, child_depth, child in reversed(imports[:index]):
+                if child_depth <= depth:
+                    break
+                if child_depth == depth + 1:
+                    children[child] = child_cumulative
+            return cumulative, children
+    return 0, {}
+
+
+async def run_once(args, workdir: str) -> dict:
+    telegram = FakeTelegram(port=args.telegram_port)
+    await telegram.start()
+    await telegram.push(CHAT_ID, '/start', username='startup')
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN=telegram.token,
+        TELEGRAM_BASE_URL=telegram.base_url,
+        ALPHA_VANTAGE_KEY='bench',
+        AZURE_API_KEY='bench',
+        ALLOWED_USERS=str(CHAT_ID),
+        WARMUP_DELAY=str(args.warmup_delay),
+        PYTHONDONTWRITEBYTECODE='1',
+    )
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, '-X', 'importtime', str(ROOT / 'main.py'),
+        cwd=workdir, env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+    )
+    stderr = asyncio.ensure_future(process.stderr.read())
+    try:
+        await telegram.wait_for_chat(CHAT_ID, 1, args.timeout)
+        first_reply = time.perf_counter() - started
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(process.wait(), args.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+        await telegram.stop()
+
+    imports = parse_importtime((await stderr).decode('utf-8', 'replace'))
+    import_us, children = bot_imports(imports)
+    loaded = {name for _, _, name in imports}
+    return {
+        'first_reply': first_reply,
+        'import': import_us / 1e6,
+        'children': children,
+        'heavy': [module for module in HEAVY_MODULES if module in loaded],
+    }
+
+
+async def main(args):
+    results = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            results.append(await run_once(args, workdir))
+
+    first_reply = [result['first_reply'] * 1000 for result in results]
+    imports = [result['import'] * 1000 for result in results]
+    print(f"first reply  median={statistics.median(first_reply):7.1f}ms  min={min(first_reply):7.1f}ms  "
+          f"({args.runs} runs)")
+    print(f"import {BOT_MODULE}  median={statistics.median(imports):7.1f}ms  min={min(imports):7.1f}ms")
+    last = results[-1]
+    print("slowest direct imports (last run):")
+    for name, cumulative in sorted(last['children'].items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+    print(f"heavy modules loaded before exit: {', '.join(last['heavy']) or 'none'}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='direct imports to list')
+    parser.add_argument('--warmup-delay', type=float, default=-1,
+                        help="the bot's WARMUP_DELAY; negative keeps the warm-up out of the measurement")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--telegram-port', type=int, default=8081)
+    asyncio.run(main(parser.parse_args()))
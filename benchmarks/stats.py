@@ -0,0 +1,29 @@
+from typing import Dict, List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """
+    Throughput and latency percentiles (in milliseconds) for one benchmark run.
+    """
+    return {
+        'count': len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies, default=0.0) * 1000,
+    }
+
+
+def format_summary(name: str, summary: Dict[str, float]) -> str:
+    return (f"{name:<24} n={summary['count']:<6} {summary['throughput']:8.1f} upd/s  "
+            f"p50={summary['p50_ms']:7.1f}ms  p95={summary['p95_ms']:7.1f}ms  "
+            f"p99={summary['p99_ms']:7.1f}ms  max={summary['max_ms']:7.1f}ms")
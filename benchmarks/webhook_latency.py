@@ -0,0 +1,89 @@
+"""
+Compares update latency in polling mode against webhook mode.
+
+Drives a minimal /ping bot through FakeTelegram, pushing updates at a fixed
+rate from several chats, and reports push-to-reply latency per mode.
+
+    python -m benchmarks.webhook_latency --updates 500 --rate 200
+"""
+import argparse
+import asyncio
+import time
+
+from telegram.ext import Application, CommandHandler
+
+from app.dispatcher import OrderedApplication
+from app.webhook import WebhookServer
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.stats import format_summary, summarize
+
+WEBHOOK_SECRET = 'bench-secret'
+
+
+async def run_mode(mode: str, args) -> dict:
+    fake = FakeTelegram(port=args.telegram_port)
+    await fake.start()
+    application = (
+        Application.builder()
+        .token(fake.token)
+        .base_url(fake.base_url)
+        .application_class(OrderedApplication, kwargs={'max_concurrent_updates': args.concurrency})
+        .build()
+    )
+
+    async def ping(update, context):
+        if args.handler_delay:
+            await asyncio.sleep(args.handler_delay)
+        await update.message.reply_text('pong')
+
+    application.add_handler(CommandHandler('ping', ping))
+    server = None
+    await application.initialize()
+    try:
+        if mode == 'polling':
+            await application.updater.start_polling(poll_interval=0.0, timeout=10)
+        else:
+            server = WebhookServer(application, WEBHOOK_SECRET, host='127.0.0.1', port=args.webhook_port,
+                                   path='/telegram')
+            await server.start()
+            await application.bot.set_webhook(url=f"http://127.0.0.1:{args.webhook_port}/telegram",
+                                              secret_token=WEBHOOK_SECRET)
+        await application.start()
+
+        started = time.perf_counter()
+        pushes = []
+        for i in range(args.updates):
+            # Telegram delivers over several connections, so pushes do not wait on each other.
+            pushes.append(asyncio.create_task(fake.push(chat_id=1000 + i % args.users, text='/ping')))
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*pushes)
+        await fake.wait_for_replies(args.updates)
+        elapsed = time.perf_counter() - started
+        return summarize(fake.latencies, elapsed)
+    finally:
+        if application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        if server is not None:
+            await server.stop()
+        await application.shutdown()
+        await fake.stop()
+
+
+async def main(args):
+    for mode in args.modes:
+        print(format_summary(mode, await run_mode(mode, args)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['polling', 'webhook'], choices=['polling', 'webhook'])
+    parser.add_argument('--updates', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=200.0, help='updates pushed per second')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--handler-delay', type=float, default=0.0, help='seconds each handler sleeps')
+    parser.add_argument('--telegram-port', type=int, default=8081)
+    parser.add_argument('--webhook-port', type=int, default=8443)
+    asyncio.run(main(parser.parse_args()))
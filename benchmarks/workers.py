@@ -0,0 +1,203 @@
+"""
+Measures update throughput of the multi-worker mode against the single process.
+
+Runs main.py as one process (WORKERS=1) and under the supervisor with each
+requested worker count, against FakeTelegram and FakeAlphaVantage. Every run
+first warms the quote cache with one /stock per symbol, then pushes
+--chats x --requests commands at once and times until all are answered.
+The 'stock' scenario sends /stock only; 'start' sends /start, which goes
+through authorization and the per-user request counters; 'mixed' alternates
+them. Alpha Vantage calls are reported too: with the shared cache they
+should not grow with the number of workers.
+
+Each run ends with a daily-limit check: one user sends MAX_REQUESTS + 3
+/start commands, spread over every worker's local webhook, and exactly
+MAX_REQUESTS of them must be served.
+
+Throughput can only scale up to the number of CPU cores.
+
+    python -m benchmarks.workers --workers 1 2 4 --chats 200 --requests 10 --scenario mixed
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import signal
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+from app.webhook import SECRET_HEADER
+from benchmarks.fake_alpha_vantage import FakeAlphaVantage
+from benchmarks.fake_telegram import FakeTelegram, command_update
+from benchmarks.stats import percentile
+from utils.db_utils import DatabaseManager
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SYMBOLS = ['AAPL', 'MSFT', 'NVDA', 'AMZN', 'GOOGL', 'META', 'TSLA', 'AVGO', 'JPM', 'V',
+           'NFLX', 'AMD', 'ADBE', 'CRM', 'COST', 'PEP', 'KO', 'ORCL', 'INTC', 'IBM']
+
+FIRST_CHAT = 10000
+
+# The user of the daily-limit check.
+LIMIT_USER = 9000
+
+WORKER_SECRET = 'bench-worker-secret'
+
+# Reply prefixes of /start and of the daily-limit refusal.
+WELCOME = 'ברוכים הבאים'
+LIMIT_REACHED = 'הגעת למגבלת'
+
+
+def seed_users(path: str, user_ids):
+    """
+    Creates the bot's database with `user_ids` authorized, so /start passes authorization.
+    """
+    db = DatabaseManager(path)
+    db.init_tables()
+    with db.get_connection() as conn:
+        conn.executemany('INSERT INTO users (user_id, username, requests_today, is_authorized) VALUES (?, ?, 0, 1)',
+                         [(user_id, 'bench') for user_id in user_ids])
+    db.close()
+
+
+def command(scenario: str, index: int, rng: random.Random) -> str:
+    if scenario == 'start' or scenario == 'mixed' and index % 2:
+        return '/start'
+    return f"/stock {rng.choice(SYMBOLS)}"
+
+
+async def check_daily_limit(telegram: FakeTelegram, workers: int, args) -> bool:
+    """
+    Sends MAX_REQUESTS + 3 /start commands of one user round-robin to every worker
+    (or through the update feed for a single process) and checks that exactly
+    MAX_REQUESTS were served.
+    """
+    total = args.daily_limit + 3
+    if workers == 1:
+        for _ in range(total):
+            await telegram.push(LIMIT_USER, '/start')
+    else:
+        update_ids = itertools.count(10 ** 6)
+        headers = {SECRET_HEADER: WORKER_SECRET}
+        async with aiohttp.ClientSession() as session:
+            for index in range(total):
+                url = f"http://127.0.0.1:{args.worker_base_port + index % workers}/telegram"
+                update = command_update(next(update_ids), LIMIT_USER, '/start')
+                async with session.post(url, json=update, headers=headers) as response:
+                    response.raise_for_status()
+    await telegram.wait_for_chat(LIMIT_USER, total, args.timeout)
+    replies = telegram.sent[LIMIT_USER]
+    served = sum(reply.startswith(WELCOME) for reply in replies)
+    refused = sum(reply.startswith(LIMIT_REACHED) for reply in replies)
+    return served == args.daily_limit and refused == total - args.daily_limit
+
+
+async def run_once(workers: int, args) -> dict:
+    telegram = FakeTelegram(port=args.telegram_port)
+    alpha_vantage = FakeAlphaVantage(port=args.av_port, latency=args.av_latency)
+    await telegram.start()
+    await alpha_vantage.start()
+    workdir = tempfile.TemporaryDirectory()
+    seed_users(str(Path(workdir.name) / 'bot_security.db'),
+               [LIMIT_USER, *range(FIRST_CHAT - len(SYMBOLS), FIRST_CHAT + args.chats)])
+    log = open(Path(workdir.name) / 'bot.log', 'w')
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN=telegram.token,
+        TELEGRAM_BASE_URL=telegram.base_url,
+        ALPHA_VANTAGE_KEY='bench',
+        ALPHA_VANTAGE_URL=alpha_vantage.url,
+        AZURE_API_KEY='bench',
+        ALLOWED_USERS='1',
+        WORKERS=str(workers),
+        WORKER_BASE_PORT=str(args.worker_base_port),
+        WORKER_SECRET=WORKER_SECRET,
+        MAX_REQUESTS=str(args.daily_limit),
+        AV_CALLS_PER_MINUTE='100000',
+        AV_CALLS_PER_DAY='1000000',
+        WARMUP_DELAY='0',
+        PYTHONUNBUFFERED='1',
+    )
+    env.pop('WORKER_ID', None)
+    process = await asyncio.create_subprocess_exec(sys.executable, str(ROOT / 'main.py'), cwd=workdir.name,
+                                                   env=env, stdout=log, stderr=asyncio.subprocess.STDOUT)
+    rng = random.Random(args.seed)
+    try:
+        # Warm-up: every symbol once, from chats spread over all workers.
+        for index, symbol in enumerate(SYMBOLS):
+            await telegram.push(FIRST_CHAT - 1 - index, f"/stock {symbol}")
+        await telegram.wait_for_replies(len(SYMBOLS), args.timeout)
+        telegram.reset()
+        upstream_before = sum(alpha_vantage.calls.values())
+
+        total = args.chats * args.requests
+        started = time.perf_counter()
+        for index in range(args.requests):
+            for chat_id in range(FIRST_CHAT, FIRST_CHAT + args.chats):
+                await telegram.push(chat_id, command(args.scenario, index, rng))
+        await telegram.wait_for_replies(total, args.timeout)
+        elapsed = time.perf_counter() - started
+        result = {
+            'workers': workers,
+            'throughput': total / elapsed,
+            'p50': statistics.median(telegram.latencies),
+            'p99': percentile(telegram.latencies, 99),
+            'upstream_warmup': upstream_before,
+            'upstream_load': sum(alpha_vantage.calls.values()) - upstream_before,
+        }
+        result['daily_limit_ok'] = await check_daily_limit(telegram, workers, args)
+        return result
+    except asyncio.TimeoutError:
+        log.flush()
+        print(f"workers={workers}: timed out with {len(telegram.latencies)} replies; log tail:")
+        print(''.join((Path(workdir.name) / 'bot.log').read_text().splitlines(True)[-20:]))
+        raise
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(process.wait(), args.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+        log.close()
+        workdir.cleanup()
+        await alpha_vantage.stop()
+        await telegram.stop()
+
+
+async def main(args):
+    print(f"{os.cpu_count()} CPU cores, {args.chats} chats x {args.requests} requests ({args.scenario})")
+    baseline = None
+    for workers in args.workers:
+        result = await run_once(workers, args)
+        baseline = baseline or result['throughput']
+        print(f"workers={result['workers']:<3} {result['throughput']:8.1f} upd/s  x{result['throughput'] / baseline:4.2f}  "
+              f"p50={result['p50'] * 1000:7.1f}ms  p99={result['p99'] * 1000:7.1f}ms  "
+              f"upstream warm-up={result['upstream_warmup']} load={result['upstream_load']}  "
+              f"daily limit {'ok' if result['daily_limit_ok'] else 'VIOLATED'}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='worker counts to run; 1 is the plain single process')
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=10, help='commands sent by each chat')
+    parser.add_argument('--scenario', choices=['stock', 'start', 'mixed'], default='mixed')
+    parser.add_argument('--daily-limit', type=int, default=20,
+                        help='MAX_REQUESTS for the run; must be at least --requests')
+    parser.add_argument('--av-latency', type=float, default=0.05, help='seconds per Alpha Vantage reply')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--telegram-port', type=int, default=8081)
+    parser.add_argument('--av-port', type=int, default=8082)
+    parser.add_argument('--worker-base-port', type=int, default=8600)
+    asyncio.run(main(parser.parse_args()))
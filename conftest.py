@@ -0,0 +1 @@
+# Lets pytest import the app and utils packages from the repository root.
@@ -0,0 +1,52 @@
+from app.alerts import ABOVE, BELOW, Alert, AlertIndex, parse_alert
+
+
+def make_index(*alerts) -> AlertIndex:
+    index = AlertIndex()
+    for alert_id, (user_id, symbol, direction, threshold) in enumerate(alerts, start=1):
+        index.add(Alert(alert_id, user_id, symbol, direction, threshold))
+    return index
+
+
+def test_parse_alert():
+    assert parse_alert('aapl > 200') == ('AAPL', ABOVE, 200.0)
+    assert parse_alert('BRK.B<399.5') == ('BRK.B', BELOW, 399.5)
+    assert parse_alert('AAPL = 200') is None
+    assert parse_alert('AAPL > -1') is None
+
+
+def test_trigger_fires_crossed_thresholds_only():
+    index = make_index((1, 'AAPL', ABOVE, 200), (1, 'AAPL', ABOVE, 210), (2, 'AAPL', BELOW, 190),
+                       (2, 'AAPL', BELOW, 180), (3, 'MSFT', ABOVE, 1))
+    assert index.trigger('AAPL', 195) == []
+    assert sorted(alert.alert_id for alert in index.trigger('AAPL', 205)) == [1]
+    assert sorted(alert.alert_id for alert in index.trigger('AAPL', 185)) == [3]
+    assert len(index) == 3
+    assert index.symbols() == ['AAPL', 'MSFT']
+
+
+def test_thresholds_equal_to_price_fire():
+    index = make_index((1, 'AAPL', ABOVE, 200), (1, 'AAPL', BELOW, 200))
+    assert sorted(alert.alert_id for alert in index.trigger('AAPL', 200)) == [1, 2]
+    assert index.symbols() == []
+
+
+def test_fired_alerts_are_removed_everywhere():
+    index = make_index((1, 'AAPL', ABOVE, 200), (1, 'MSFT', ABOVE, 300))
+    index.trigger('AAPL', 250)
+    assert [alert.alert_id for alert in index.for_user(1)] == [2]
+    assert index.trigger('AAPL', 250) == []
+
+
+def test_remove_keeps_same_threshold_siblings():
+    index = make_index((1, 'AAPL', ABOVE, 200), (2, 'AAPL', ABOVE, 200))
+    assert index.remove(1).alert_id == 1
+    assert index.remove(1) is None
+    assert [alert.alert_id for alert in index.trigger('AAPL', 200)] == [2]
+    assert len(index) == 0
+
+
+def test_for_user_is_ordered_by_id():
+    index = make_index((1, 'MSFT', ABOVE, 300), (2, 'AAPL', BELOW, 100), (1, 'AAPL', ABOVE, 200))
+    assert [alert.alert_id for alert in index.for_user(1)] == [1, 3]
+    assert index.for_user(3) == []
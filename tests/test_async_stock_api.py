@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from app.async_stock_api import AsyncStockAPI
+from app.c_stock_api import StockAPI
+from app.cache import ResponseCache
+
+
+class SlowStockAPI(StockAPI):
+    def __init__(self, cache, delay):
+        super().__init__('demo', cache=cache)
+        self.delay = delay
+
+    def _upstream_call(self, function, symbol):
+        time.sleep(self.delay)
+        return {'01. symbol': symbol}, {}
+
+
+def _run(api, coro):
+    try:
+        return asyncio.run(coro)
+    finally:
+        api.shutdown()
+
+
+def test_timeout_serves_the_stale_entry_with_its_age():
+    cache = ResponseCache(max_stale=60)
+    cache.restore('GLOBAL_QUOTE', 'AAPL', {'01. symbol': 'AAPL'}, ttl=-5, age=65)
+    api = AsyncStockAPI(SlowStockAPI(cache, delay=0.5), timeout=0.05)
+    data, stale_age = _run(api, api.get_stock_info('AAPL'))
+    assert data == {'01. symbol': 'AAPL'}
+    assert 64 < stale_age < 70
+
+
+def test_timeout_without_a_stale_entry_is_an_error():
+    api = AsyncStockAPI(SlowStockAPI(ResponseCache(), delay=0.5), timeout=0.05)
+    data, stale_age = _run(api, api.get_stock_info('AAPL'))
+    assert data == {'error': 'GLOBAL_QUOTE timed out after 0.05s'}
+    assert stale_age is None
+
+
+def test_fresh_replies_have_no_stale_age():
+    api = AsyncStockAPI(SlowStockAPI(ResponseCache(), delay=0))
+    assert _run(api, api.get_dividend('AAPL')) == ({
+        'DividendPerShare': 'No dividend data available.',
+        'DividendYield': 'No dividend yield available.',
+        'ExDividendDate': 'No ex-dividend date available.',
+        'DividendDate': 'No dividend date available.',
+    }, None)
+
+
+def test_timed_out_calls_keep_their_slot_until_the_thread_returns():
+    api = AsyncStockAPI(SlowStockAPI(ResponseCache(), delay=0.3), max_in_flight=1, timeout=0.05)
+
+    async def scenario():
+        await api.get_stock_info('AAPL')
+        held = api._in_flight.locked()
+        await asyncio.sleep(0.4)
+        return held, api._in_flight.locked()
+
+    assert _run(api, scenario()) == (True, False)
@@ -0,0 +1,79 @@
+import time
+
+from app.cache import ResponseCache
+
+
+def test_get_returns_fresh_values():
+    cache = ResponseCache()
+    cache.set('GLOBAL_QUOTE', 'AAPL', {'05. price': '1'})
+    assert cache.get('GLOBAL_QUOTE', 'AAPL') == {'05. price': '1'}
+    assert cache.get('GLOBAL_QUOTE', 'MSFT') is None
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_none_is_not_cached():
+    cache = ResponseCache()
+    cache.set('GLOBAL_QUOTE', 'AAPL', None)
+    assert cache.stats()['entries'] == 0
+
+
+def test_expired_values_are_misses_but_served_stale():
+    cache = ResponseCache(max_stale=60)
+    cache.set('GLOBAL_QUOTE', 'AAPL', {'p': 1}, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get('GLOBAL_QUOTE', 'AAPL') is None
+    assert cache.get_stale('GLOBAL_QUOTE', 'AAPL') == {'p': 1}
+    assert cache.staleness('GLOBAL_QUOTE', 'AAPL') >= 0.01
+    assert cache.version('GLOBAL_QUOTE', 'AAPL') is None
+
+
+def test_stale_values_expire_after_max_stale():
+    cache = ResponseCache(max_stale=0.01)
+    cache.set('GLOBAL_QUOTE', 'AAPL', {'p': 1}, ttl=0.01)
+    time.sleep(0.03)
+    assert cache.get_stale('GLOBAL_QUOTE', 'AAPL') is None
+
+
+def test_ttl_depends_on_function():
+    cache = ResponseCache(ttls={'OVERVIEW': 123}, default_ttl=7)
+    assert cache.ttl_for('OVERVIEW') == 123
+    assert cache.ttl_for('UNKNOWN') == 7
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.set('GLOBAL_QUOTE', 'A', {'p': 1})
+    cache.set('GLOBAL_QUOTE', 'B', {'p': 2})
+    cache.get('GLOBAL_QUOTE', 'A')
+    cache.set('GLOBAL_QUOTE', 'C', {'p': 3})
+    assert cache.get('GLOBAL_QUOTE', 'B') is None
+    assert cache.get('GLOBAL_QUOTE', 'A') == {'p': 1}
+    assert cache.evictions == 1
+
+
+def test_byte_limit_evicts_and_rejects_oversized_values():
+    cache = ResponseCache(max_bytes=2000)
+    assert not cache.restore('OVERVIEW', 'BIG', 'x' * 5000, ttl=60)
+    for index in range(20):
+        cache.set('GLOBAL_QUOTE', str(index), {'p': 'x' * 100})
+    assert cache.stats()['bytes'] <= 2000
+    assert cache.get('GLOBAL_QUOTE', '19') is not None
+
+
+def test_version_changes_when_value_is_replaced():
+    cache = ResponseCache()
+    cache.set('GLOBAL_QUOTE', 'AAPL', {'p': 1})
+    first = cache.version('GLOBAL_QUOTE', 'AAPL')
+    cache.set('GLOBAL_QUOTE', 'AAPL', {'p': 2})
+    assert cache.version('GLOBAL_QUOTE', 'AAPL') != first
+
+
+def test_on_set_is_skipped_by_restore():
+    cache = ResponseCache()
+    seen = []
+    cache.on_set = lambda function, symbol, value: seen.append(symbol)
+    cache.set('GLOBAL_QUOTE', 'A', {'p': 1})
+    cache.restore('GLOBAL_QUOTE', 'B', {'p': 2}, ttl=60, age=10)
+    assert seen == ['A']
+    assert cache.get('GLOBAL_QUOTE', 'B') == {'p': 2}
@@ -0,0 +1,47 @@
+import asyncio
+
+from app.history import HistoryStore
+
+
+def _bars(*days):
+    return {f'2024-06-{day:02d}': {'1. open': '1', '2. high': '2', '3. low': '0.5', '4. close': str(day),
+                                   '5. volume': '100'} for day in days}
+
+
+class FakeStockAPI:
+    def __init__(self, *payloads):
+        self.payloads = list(payloads)
+        self.calls = []
+
+    async def get_time_series(self, symbol, interval='daily', outputsize='compact'):
+        self.calls.append(outputsize)
+        return self.payloads.pop(0)
+
+
+def _closes(store):
+    async def scenario():
+        await store.get('AAPL')
+        return (await store.get('AAPL')).series.close.tolist()
+
+    return asyncio.run(scenario())
+
+
+def test_new_bars_are_appended():
+    api = FakeStockAPI(_bars(1, 2, 3), _bars(3, 4))
+    store = HistoryStore(api, ttls={'daily': 0})
+    assert _closes(store) == [1, 2, 3, 4]
+    assert store.appended_bars == 4
+
+
+def test_a_series_too_far_behind_is_rebuilt_from_the_compact_payload():
+    api = FakeStockAPI(_bars(1, 2, 3), _bars(10, 11))
+    store = HistoryStore(api, ttls={'daily': 0})
+    assert _closes(store) == [10, 11]
+    assert api.calls == ['compact', 'compact']
+
+
+def test_a_full_history_is_downloaded_again():
+    api = FakeStockAPI(_bars(1, 2, 3), _bars(10, 11), _bars(1, 2, 3, 10, 11))
+    store = HistoryStore(api, initial_outputsize='full', ttls={'daily': 0})
+    assert _closes(store) == [1, 2, 3, 10, 11]
+    assert api.calls == ['full', 'compact', 'full']
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from app import indicators
+
+
+def reference_ema(values, alpha):
+    out = [values[0]]
+    for value in values[1:]:
+        out.append(alpha * value + (1 - alpha) * out[-1])
+    return np.array(out)
+
+
+@pytest.fixture
+def close():
+    rng = np.random.default_rng(7)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 600)))
+
+
+def test_sma(close):
+    result = indicators.sma(close, 20)
+    assert np.isnan(result[:19]).all()
+    assert result[19] == pytest.approx(close[:20].mean())
+    assert result[-1] == pytest.approx(close[-20:].mean())
+    assert np.isnan(indicators.sma(close[:5], 20)).all()
+
+
+def test_ema_matches_the_recurrence(close):
+    # Slow decay crosses several closed-form blocks.
+    for period in (12, 26, 200):
+        np.testing.assert_allclose(indicators.ema(close, period), reference_ema(close, 2 / (period + 1)), rtol=1e-10)
+
+
+def test_ema_continues_from_a_previous_run(close):
+    full = indicators.ema(close, 26)
+    head = indicators.ema(close[:400], 26)
+    tail = indicators.ema(close[400:], 26, initial=head[-1])
+    np.testing.assert_allclose(np.concatenate((head, tail)), full, rtol=1e-10)
+
+
+def test_ema_of_empty_series():
+    assert len(indicators.ema(np.array([]), 12)) == 0
+
+
+def test_rsi_bounds_and_extremes(close):
+    values = indicators.rsi(close)
+    assert ((values >= 0) & (values <= 100)).all()
+    assert indicators.rsi(np.arange(1.0, 50.0))[-1] == 100.0
+    assert indicators.rsi(np.arange(50.0, 1.0, -1))[-1] == pytest.approx(0.0)
+
+
+def test_rsi_averages_continue_from_a_previous_run(close):
+    gains, losses = indicators.rsi_averages(close)
+    head_gains, head_losses = indicators.rsi_averages(close[:300])
+    tail_gains, tail_losses = indicators.rsi_averages(close[300:], previous=(head_gains[-1], head_losses[-1]),
+                                                      last_close=close[299])
+    np.testing.assert_allclose(tail_gains, gains[300:], rtol=1e-9)
+    np.testing.assert_allclose(tail_losses, losses[300:], rtol=1e-9)
+
+
+def test_macd_histogram(close):
+    line, signal, hist = indicators.macd(close)
+    np.testing.assert_allclose(line, indicators.ema(close, 12) - indicators.ema(close, 26))
+    np.testing.assert_allclose(hist, line - signal)
+
+
+def test_period_return_and_volatility():
+    close = np.array([100.0, 110.0, 121.0])
+    assert indicators.period_return(close, 2) == pytest.approx(0.21)
+    assert np.isnan(indicators.period_return(close, 3))
+    assert indicators.volatility(close, 2, periods_per_year=1) == pytest.approx(0.0, abs=1e-12)
+    assert np.isnan(indicators.volatility(close, 5))
+
+
+def test_sparkline():
+    assert indicators.sparkline(np.array([1.0, 2.0, 3.0])) == '▁▅█'
+    assert indicators.sparkline(np.array([5.0, 5.0])) == '▁▁'
+    assert len(indicators.sparkline(np.arange(100.0), width=30)) == 30
+    assert indicators.sparkline(np.array([])) == ''
@@ -0,0 +1,85 @@
+import asyncio
+
+from telegram.error import Forbidden, RetryAfter
+
+from app.outbox import Outbox
+
+
+class FakeBot:
+    """
+    Records delivered messages. Chats in `blocked` raise Forbidden; texts in
+    `flood` raise RetryAfter once.
+    """
+
+    def __init__(self, blocked=(), flood=()):
+        self.blocked = set(blocked)
+        self.flood = set(flood)
+        self.delivered = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0)
+        if chat_id in self.blocked:
+            raise Forbidden("bot was blocked by the user")
+        if text in self.flood:
+            self.flood.discard(text)
+            raise RetryAfter(0)
+        self.delivered.append((chat_id, text))
+
+
+def _outbox(workers=4):
+    return Outbox(workers=workers, global_rate=1000, chat_rate=1000, group_rate=1000)
+
+
+async def _until(condition):
+    while not condition():
+        await asyncio.sleep(0)
+
+
+def test_each_chat_gets_its_messages_in_order():
+    bot = FakeBot(flood={'b'})
+    outbox = _outbox()
+
+    async def scenario():
+        outbox.start(bot)
+        for text in 'abc':
+            outbox.send(1, text)
+            outbox.send(2, text)
+        await outbox.stop()
+
+    asyncio.run(scenario())
+    assert [text for chat_id, text in bot.delivered if chat_id == 1] == ['a', 'b', 'c']
+    assert [text for chat_id, text in bot.delivered if chat_id == 2] == ['a', 'b', 'c']
+    assert outbox.flood_waits == 1
+    assert outbox.sent == 6
+
+
+def test_interactive_messages_go_before_a_broadcast():
+    bot = FakeBot()
+    outbox = _outbox(workers=1)
+
+    async def scenario():
+        outbox.broadcast(range(1, 6), 'news')
+        await _until(lambda: outbox.stats()['queued'] == 5)
+        outbox.send(99, 'alert')
+        outbox.start(bot)
+        await outbox.stop()
+
+    asyncio.run(scenario())
+    assert bot.delivered[0] == (99, 'alert')
+    assert len(bot.delivered) == 6
+
+
+def test_broadcast_reports_sent_and_failed():
+    bot = FakeBot(blocked={2})
+    outbox = _outbox()
+
+    async def scenario():
+        outbox.start(bot)
+        progress = outbox.broadcast([1, 2, 3, 1], 'news')
+        await asyncio.wait_for(progress.done.wait(), 1)
+        await outbox.stop()
+        return progress
+
+    progress = asyncio.run(scenario())
+    assert (progress.total, progress.sent, progress.failed) == (3, 2, 1)
+    assert outbox.failed == 1
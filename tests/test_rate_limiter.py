@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import pytest
+
+from app.rate_limiter import BACKGROUND, INTERACTIVE, RequestScheduler, TokenBucket, is_throttle_message
+
+
+def test_throttle_messages_are_recognised():
+    assert is_throttle_message("Our standard API call frequency is 5 calls per minute and 500 calls per day.")
+    assert is_throttle_message("You have reached the rate limit")
+    assert not is_throttle_message("Invalid API call. Please retry or visit the documentation")
+    assert not is_throttle_message(None)
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(capacity=2, refill_per_second=100)
+    bucket.consume()
+    bucket.consume()
+    assert bucket.time_until_available() > 0
+    time.sleep(0.02)
+    assert bucket.time_until_available() == 0
+
+
+def test_token_bucket_drain_empties_it():
+    bucket = TokenBucket(capacity=5, refill_per_second=1)
+    bucket.drain()
+    assert bucket.tokens <= 0
+    assert bucket.time_until_available() == pytest.approx(1.0, abs=0.01)
+
+
+def test_scheduler_admits_burst_then_waits():
+    scheduler = RequestScheduler(per_minute=3000, per_day=100000)
+    scheduler.buckets[0] = TokenBucket(2, 50)
+
+    async def scenario():
+        started = time.monotonic()
+        for _ in range(3):
+            await scheduler.acquire()
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(scenario())
+    assert 0.015 <= elapsed < 0.5
+    assert scheduler.granted == 3
+
+
+def test_interactive_calls_go_before_background_ones():
+    scheduler = RequestScheduler()
+    scheduler.buckets[0] = TokenBucket(1, 100)
+    order = []
+
+    async def call(name, priority):
+        await scheduler.acquire(priority)
+        order.append(name)
+
+    async def scenario():
+        await scheduler.acquire()
+        # The bucket is empty now; both wait and the interactive one is served first.
+        await asyncio.gather(call('background', BACKGROUND), call('interactive', INTERACTIVE))
+
+    asyncio.run(scenario())
+    assert order == ['interactive', 'background']
+
+
+def test_on_throttled_holds_new_calls():
+    scheduler = RequestScheduler(per_minute=6000)
+    scheduler.on_throttled()
+    assert scheduler.throttled == 1
+    assert scheduler.buckets[0].time_until_available() > 0
+
+
+def test_acquire_blocking_from_another_thread():
+    scheduler = RequestScheduler()
+
+    async def scenario():
+        scheduler.bind(asyncio.get_running_loop())
+        await asyncio.to_thread(scheduler.acquire_blocking)
+
+    asyncio.run(scenario())
+    assert scheduler.granted == 1
+
+
+def test_acquire_blocking_on_the_scheduler_loop_is_refused():
+    scheduler = RequestScheduler()
+
+    async def scenario():
+        scheduler.bind(asyncio.get_running_loop())
+        scheduler.acquire_blocking()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
+
+
+def test_acquire_blocking_needs_a_bound_loop():
+    with pytest.raises(RuntimeError):
+        RequestScheduler().acquire_blocking()
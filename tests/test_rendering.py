@@ -0,0 +1,46 @@
+from app.rendering import MAX_MESSAGE_LENGTH, Renderer, compile_template, render, split_message
+
+
+def test_short_text_is_one_part():
+    assert split_message('hello') == ('hello',)
+    assert split_message('') == ('',)
+
+
+def test_split_prefers_paragraph_breaks():
+    text = 'a' * 6 + '\n\n' + 'b' * 6 + '\n' + 'c' * 3
+    assert split_message(text, limit=12) == ('a' * 6, 'b' * 6 + '\n' + 'c' * 3)
+
+
+def test_split_falls_back_to_line_breaks_then_hard_cuts():
+    assert split_message('aaaa\nbbbb', limit=6) == ('aaaa', 'bbbb')
+    assert split_message('x' * 25, limit=10) == ('x' * 10, 'x' * 10, 'x' * 5)
+
+
+def test_every_part_fits_the_telegram_limit():
+    text = '\n'.join(f"line {index} " + 'y' * (index % 90) for index in range(2000))
+    parts = split_message(text)
+    assert len(parts) > 1
+    assert all(len(part) <= MAX_MESSAGE_LENGTH for part in parts)
+    assert ''.join(parts).replace('\n', '') == text.replace('\n', '')
+
+
+def test_compile_template_formats_fields():
+    template = compile_template("{symbol}: {score:+.2f} {name!r} 'quoted' \"text\" {{braces}}")
+    assert template({'symbol': 'AAPL', 'score': 0.5, 'name': 'x'}) == "AAPL: +0.50 'x' 'quoted' \"text\" {braces}"
+    assert compile_template('')({}) == ''
+    assert compile_template('plain')({}) == 'plain'
+
+
+def test_throttled_replies_say_so():
+    throttled = {'error': 'Our standard API call frequency is 5 calls per minute'}
+    assert 'rate limit' in render('stock', throttled, 'en')
+    assert render('stock', {'error': 'Invalid API call'}, 'en') == 'No data found'
+
+
+def test_renderer_caches_by_version():
+    renderer = Renderer()
+    quote = {'01. symbol': 'AAPL', '05. price': '1'}
+    parts = renderer.render('stock', 'en', quote, key='AAPL', version=1, symbol='AAPL')
+    assert renderer.lookup('stock', 'en', 'AAPL', 1) == parts
+    assert renderer.lookup('stock', 'en', 'AAPL', 2) is None
+    assert renderer.lookup('stock', 'en', 'AAPL', None) is None
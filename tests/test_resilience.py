@@ -0,0 +1,151 @@
+import asyncio
+import time
+
+import pytest
+
+from app.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, Resilience, RetryPolicy
+
+
+def make_resilience(**kwargs) -> Resilience:
+    retry = RetryPolicy(attempts=3, base_delay=0.0, max_delay=0.0, budget=5.0)
+    return Resilience(failure_threshold=kwargs.pop('failure_threshold', 2),
+                      reset_timeout=kwargs.pop('reset_timeout', 0.05), retry=retry, **kwargs)
+
+
+def test_breaker_opens_after_threshold_and_probes_after_timeout():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time.
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+
+
+def test_unanswered_probe_expires():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+
+def test_call_retries_transient_errors():
+    resilience = make_resilience()
+    calls = []
+
+    async def attempt(timeout):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise ConnectionError()
+        return 'ok'
+
+    assert asyncio.run(resilience.call('F', attempt)) == 'ok'
+    assert len(calls) == 3
+    assert resilience.retries == 2
+    assert resilience.breaker('F').state == CLOSED
+
+
+def test_call_does_not_retry_permanent_errors():
+    resilience = make_resilience()
+    calls = []
+
+    async def attempt(timeout):
+        calls.append(timeout)
+        raise KeyError('bad reply')
+
+    with pytest.raises(KeyError):
+        asyncio.run(resilience.call('F', attempt, is_transient=lambda error: not isinstance(error, KeyError)))
+    assert len(calls) == 1
+    assert resilience.breaker('F').failures == 0
+
+
+def test_open_circuit_short_circuits():
+    resilience = make_resilience(failure_threshold=1, reset_timeout=60)
+
+    async def attempt(timeout):
+        raise ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(resilience.call('F', attempt))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(resilience.call('F', attempt))
+    assert resilience.short_circuited == 1
+    assert resilience.stats()['open'] == ['F']
+
+
+def test_cancelled_probe_does_not_leave_circuit_half_open():
+    resilience = make_resilience(failure_threshold=1, reset_timeout=0.05)
+
+    async def failing(timeout):
+        raise ConnectionError()
+
+    async def hanging(timeout):
+        await asyncio.sleep(10)
+
+    async def succeeding(timeout):
+        return 'ok'
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await resilience.call('F', failing)
+        await asyncio.sleep(0.06)
+        probe = asyncio.create_task(resilience.call('F', hanging))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert resilience.breaker('F').state == OPEN
+        await asyncio.sleep(0.06)
+        return await resilience.call('F', succeeding)
+
+    assert asyncio.run(scenario()) == 'ok'
+    assert resilience.breaker('F').state == CLOSED
+
+
+def test_acquire_wait_does_not_count_towards_budget():
+    resilience = Resilience(retry=RetryPolicy(attempts=1, budget=0.05))
+    timeouts = []
+
+    async def acquire():
+        await asyncio.sleep(0.1)
+
+    async def attempt(timeout):
+        timeouts.append(timeout)
+        return 'ok'
+
+    assert asyncio.run(resilience.call('F', attempt, acquire=acquire)) == 'ok'
+    assert timeouts[0] > 0.03
+
+
+def test_call_blocking_records_failure_after_last_attempt():
+    resilience = make_resilience(failure_threshold=1)
+    calls = []
+
+    def attempt(timeout):
+        calls.append(timeout)
+        raise ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        resilience.call_blocking('F', attempt)
+    assert len(calls) == 3
+    assert resilience.breaker('F').state == OPEN
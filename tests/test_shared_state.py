@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from app.shared_state import SharedRequestScheduler, init_shared_tables
+from utils.db_utils import DatabaseManager
+from utils.user_cache import SharedUserStateCache
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'bot.db'))
+    db.init_tables()
+    init_shared_tables(db)
+    yield db
+    db.close()
+
+
+def _buckets(db):
+    with db.get_connection() as conn:
+        return conn.execute('SELECT name, tokens, updated_at FROM shared_buckets ORDER BY name').fetchall()
+
+
+def test_workers_share_one_quota(db):
+    schedulers = [SharedRequestScheduler(db, per_minute=5, per_day=500) for _ in range(2)]
+    try:
+        granted = sum(scheduler._take() <= 0 for _ in range(10) for scheduler in schedulers)
+    finally:
+        for scheduler in schedulers:
+            scheduler.close()
+    assert granted == 5
+
+
+def test_a_take_without_a_token_writes_nothing(db):
+    scheduler = SharedRequestScheduler(db, per_minute=1, per_day=500)
+    try:
+        assert scheduler._take() <= 0
+        rows = _buckets(db)
+        assert scheduler._take() > 0
+        assert _buckets(db) == rows
+    finally:
+        scheduler.close()
+
+
+def test_daily_limit_holds_across_workers(db):
+    with db.get_connection() as conn:
+        conn.execute('INSERT INTO users (user_id, is_authorized, requests_today) VALUES (1, 1, 0)')
+    caches = [SharedUserStateCache(db) for _ in range(2)]
+
+    async def scenario():
+        states = [await cache.get(1) for cache in caches]
+        return [await cache.count_request(state, '2024-06-11', limit=3)
+                for _ in range(4) for cache, state in zip(caches, states)]
+
+    assert asyncio.run(scenario()) == [True, True, True, False, False, False, False, False]
+    assert caches[0].get_blocking(1).requests_today == 3
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_threads_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return 'value'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('key', slow)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do('key', slow))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader, *followers]:
+        thread.join()
+    assert results == ['value'] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {'calls': 1, 'coalesced': 4, 'in_flight': 0}
+
+
+def test_thread_error_reaches_every_caller_and_is_not_kept():
+    flight = SingleFlight()
+
+    def failing():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        flight.do('key', failing)
+    assert flight.do('key', lambda: 'ok') == 'ok'
+
+
+def test_concurrent_coroutines_share_one_call():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'value'
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do('key', slow) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ['value'] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {'calls': 1, 'coalesced': 4, 'in_flight': 0}
+
+
+def test_different_keys_do_not_coalesce():
+    flight = AsyncSingleFlight()
+
+    async def scenario():
+        return await asyncio.gather(flight.do('a', lambda: asyncio.sleep(0, 'a')),
+                                    flight.do('b', lambda: asyncio.sleep(0, 'b')))
+
+    assert asyncio.run(scenario()) == ['a', 'b']
+    assert flight.calls == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    flight = AsyncSingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return 'value'
+
+    async def scenario():
+        first = asyncio.create_task(flight.do('key', slow))
+        second = asyncio.create_task(flight.do('key', slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == 'value'
+
+
+def test_coroutine_error_reaches_every_caller():
+    flight = AsyncSingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0)
+        raise ValueError('boom')
+
+    async def scenario():
+        return await asyncio.gather(flight.do('key', failing), flight.do('key', failing), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
@@ -1,19 +1,133 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
+import asyncio
+import contextvars
+import queue
+import re
 import sqlite3
+import threading
+from utils.metrics import metrics
+
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE(?: IF NOT EXISTS)?)\s+(\w+)', re.IGNORECASE)
+
+
+def _query_labels(sql: str) -> dict:
+    table = _TABLE_PATTERN.search(sql)
+    return {'statement': sql.split(None, 1)[0].upper(), 'table': table.group(1) if table else ''}
+
+
+class _TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        with metrics.timer('db_query_seconds', **_query_labels(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with metrics.timer('db_query_seconds', **_query_labels(sql)):
+            return super().executemany(sql, seq_of_parameters)
+
+
+class _TimedConnection(sqlite3.Connection):
+    """
+    Connection whose queries are recorded in the db_query_seconds histogram.
+    """
+
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
 
 
 class DatabaseManager:
-    def __init__(self, db_path: str):
+    """
+    Pool of long-lived SQLite connections in WAL mode.
+
+    `get_connection` lends a pooled connection to synchronous code. The async
+    methods (`execute`, `fetchone`, ...) run on one dedicated DB thread, so
+    handlers can await them without blocking the event loop. Each connection
+    keeps its own prepared-statement cache.
+    """
+
+    def __init__(self, db_path: str, pool_size: int = 4, cached_statements: int = 128, busy_timeout: float = 5.0):
         self.db_path = db_path
+        self.pool_size = pool_size
+        self.cached_statements = cached_statements
+        self.busy_timeout = busy_timeout
+        self._pool = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements, factory=_TimedConnection)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._connections) < self.pool_size:
+                conn = self._connect()
+                self._connections.append(conn)
+                return conn
+        return self._pool.get()
 
     @contextmanager
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire()
         try:
             yield conn
-        finally:
             conn.commit()
-            conn.close()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
+    def _run(self, func, args):
+        with self.get_connection() as conn:
+            return func(conn, *args)
+
+    def submit(self, func, *args) -> Future:
+        """
+        Queues func(conn, *args) on the DB thread inside one transaction without waiting for it.
+        """
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._run, func, args)
+
+    async def run(self, func, *args):
+        """
+        Runs func(conn, *args) on the DB thread inside one transaction.
+        """
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    async def execute(self, sql: str, params=()) -> int:
+        return await self.run(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def executemany(self, sql: str, rows) -> int:
+        return await self.run(lambda conn: conn.executemany(sql, rows).rowcount)
+
+    async def fetchone(self, sql: str, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._pool = queue.LifoQueue()
 
     def init_tables(self):
         with self.get_connection() as conn:
@@ -24,4 +138,15 @@ class DatabaseManager:
                       requests_today INTEGER, 
                       last_request_date TEXT, 
                       is_authorized BOOLEAN,
-                      is_admin BOOLEAN DEFAULT FALSE)''')
\ No newline at end of file
+                      is_admin BOOLEAN DEFAULT FALSE)''')
+            c.execute('''CREATE TABLE IF NOT EXISTS watchlists
+                     (user_id INTEGER,
+                      symbol TEXT,
+                      position INTEGER,
+                      PRIMARY KEY (user_id, symbol))''')
+            c.execute('''CREATE TABLE IF NOT EXISTS alerts
+                     (alert_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id INTEGER,
+                      symbol TEXT,
+                      direction TEXT,
+                      threshold REAL)''')
\ No newline at end of file
@@ -0,0 +1,25 @@
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Returns module `name`, imported on first attribute access instead of now.
+
+    For heavy dependencies that only some code paths need, so they stay off
+    the startup path. Once loaded it is the regular module in sys.modules.
+    Parent packages of a dotted name are imported eagerly.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,227 @@
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+# Spans of the request being profiled, when it was sampled. Copied into the
+# executor and DB threads together with the rest of the context.
+current_trace: ContextVar[Optional[list]] = ContextVar('current_trace', default=None)
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th observation.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and latency histograms with Prometheus text output.
+
+    Collectors registered with `register_collector` are read at render time
+    and exported as gauges, so components keep their own stats() methods.
+    """
+
+    def __init__(self, prefix: str = 'stockybot'):
+        self.prefix = prefix
+        self._histograms: Dict[Tuple[str, LabelSet], Histogram] = {}
+        self._counters: Dict[Tuple[str, LabelSet], float] = {}
+        self._collectors: Dict[str, Callable[[], Dict]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> LabelSet:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.append((name, dict(labels), round(seconds * 1000, 3)))
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def register_collector(self, name: str, collect: Callable[[], Dict]):
+        self._collectors[name] = collect
+
+    def histograms(self, name: str) -> Dict[LabelSet, Histogram]:
+        with self._lock:
+            return {labels: histogram for (metric, labels), histogram in self._histograms.items() if metric == name}
+
+    def collect(self) -> Dict[str, Dict]:
+        return {name: collect() for name, collect in self._collectors.items()}
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        declared = set()
+        for (name, labels), histogram in histograms:
+            metric = f"{self.prefix}_{name}"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} histogram")
+                declared.add(metric)
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{metric}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+        for component, values in self.collect().items():
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {self.prefix}_{component}_{key} gauge")
+                lines.append(f"{self.prefix}_{component}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: LabelSet) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+class SlowRequestProfiler:
+    """
+    Opt-in profiler that traces a sample of requests and keeps the slowest.
+
+    A sampled request collects every metric observed while it runs (upstream
+    calls, DB queries) as spans. The `keep` slowest traces are retained and can
+    be dumped as JSON.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, keep: int = 20):
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self._slowest: List[tuple] = []
+        self._seq = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    @contextmanager
+    def profile(self, name: str, detail: str = ''):
+        if not self.enabled or random.random() >= self.sample_rate:
+            yield
+            return
+        spans = []
+        token = current_trace.set(spans)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            current_trace.reset(token)
+            elapsed = time.perf_counter() - started
+            record = {'request': name, 'detail': detail, 'ms': round(elapsed * 1000, 3),
+                      'at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'spans': spans}
+            entry = (elapsed, next(self._seq), record)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            elif elapsed > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def slowest(self) -> List[dict]:
+        return [record for _, _, record in sorted(self._slowest, reverse=True)]
+
+    def dump(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.slowest(), f, ensure_ascii=False, indent=2)
+
+
+class MetricsServer:
+    """
+    Serves the registry in Prometheus text format on GET /metrics.
+
+    aiohttp is imported on start, since the server only runs when METRICS_PORT is set.
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9102):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        from aiohttp import web
+        return web.Response(body=self.registry.render_prometheus().encode('utf-8'),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+metrics = MetricsRegistry()
@@ -1,26 +1,48 @@
 from datetime import datetime
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from functools import wraps
+from utils.user_cache import UserStateCache
 
 
 class Security:
-    def __init__(self, db_manager, admin_ids: list, max_requests: int = 30):
+    def __init__(self, db_manager, admin_ids: list, max_requests: int = 30, user_cache: UserStateCache = None):
         self.db = db_manager
         self.admin_ids = admin_ids
         self.max_requests = max_requests
+        self.user_cache = user_cache if user_cache is not None else UserStateCache(db_manager)
+        # Set by the bot to send admin notifications through its rate-limited Outbox.
+        self.outbox = None
+
+    def invalidate_user(self, user_id: int):
+        self.user_cache.invalidate(user_id)
+
+    async def flush_counters(self, context=None):
+        """
+        Writes cached request counters to the database. Runs as a repeating job and at shutdown.
+        """
+        await self.user_cache.flush()
+
+    async def notify_admins(self, bot, text: str, **kwargs):
+        if self.outbox is not None:
+            for admin_id in self.admin_ids:
+                self.outbox.send(admin_id, text, **kwargs)
+            return
+        for admin_id in self.admin_ids:
+            try:
+                await bot.send_message(chat_id=admin_id, text=text, **kwargs)
+            except Exception as e:
+                print(f"Failed to send message to admin {admin_id}: {e}")
 
     def is_admin(self, user_id: int) -> bool:
-        with self.db.get_connection() as conn:
-            c = conn.cursor()
-            c.execute('SELECT is_admin FROM users WHERE user_id = ?', (user_id,))
-            result = c.fetchone()
-            return bool(result[0]) if result else False
+        user = self.user_cache.get_blocking(user_id)
+        return user.is_admin if user else False
 
     def set_admin(self, user_id: int, is_admin: bool = True):
         with self.db.get_connection() as conn:
             c = conn.cursor()
             c.execute('UPDATE users SET is_admin = ? WHERE user_id = ?',
                       (is_admin, user_id))
+        self.invalidate_user(user_id)
 
     async def handle_access_request(self, update, context):
         query = update.callback_query
@@ -28,9 +50,8 @@ class Security:
         user_id = int(data[1])
 
         if str(query.from_user.id) in self.admin_ids:
-            with self.db.get_connection() as conn:
-                c = conn.cursor()
-                c.execute('UPDATE users SET is_authorized = TRUE WHERE user_id = ?', (user_id,))
+            await self.db.execute('UPDATE users SET is_authorized = TRUE WHERE user_id = ?', (user_id,))
+            self.invalidate_user(user_id)
 
             await query.edit_message_text(f"משתמש {user_id} אושר!")
             await context.bot.send_message(
@@ -44,40 +65,27 @@ class Security:
         @wraps(func)
         async def wrapped(update, context, *args, **kwargs):
             user_id = update.effective_user.id
-
-            with self.db.get_connection() as conn:
-                c = conn.cursor()
-                c.execute('SELECT is_authorized,requests_today, last_request_date, is_admin FROM users WHERE user_id = ?', (user_id,))
-                user_data = c.fetchall()
-
-                if not user_data:
-                    keyboard = [[InlineKeyboardButton("אשר משתמש",
-                                                      callback_data=f'approve_{user_id}')]]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-
-                    for admin_id in self.admin_ids:
-                        await context.bot.send_message(
-                            chat_id=admin_id,
-                            text=f"בקשת הרשאה חדשה:\nID: {user_id}\nUsername: {update.effective_user.username}",
-                            reply_markup=reply_markup
-                        )
-                    return await update.message.reply_text("בקשתך נשלחה למנהלים ותטופל בהקדם.")
-
-                is_authorized, requests_today, last_request_date, is_admin = user_data[0]
-
-                if not (is_authorized or is_admin):
-                    return await update.message.reply_text("המשתמש שלך אינו מורשה. אנא פנה למנהלת המערכת.")
-
-                if not is_admin:  # Skip request limit for admins
-                    current_date = datetime.now().strftime('%Y-%m-%d')
-                    if current_date != last_request_date:
-                        requests_today = 0
-
-                    if requests_today >= self.max_requests:
-                        return await update.message.reply_text("הגעת למגבלת הבקשות היומית. נסה שוב מחר.")
-
-                    c.execute('''UPDATE users SET requests_today = ?, last_request_date = ? 
-                                WHERE user_id = ?''', (requests_today + 1, current_date, user_id))
+            user = await self.user_cache.get(user_id)
+
+            if user is None:
+                keyboard = [[InlineKeyboardButton("אשר משתמש",
+                                                  callback_data=f'approve_{user_id}')]]
+                reply_markup = InlineKeyboardMarkup(keyboard)
+
+                await self.notify_admins(
+                    context.bot,
+                    f"בקשת הרשאה חדשה:\nID: {user_id}\nUsername: {update.effective_user.username}",
+                    reply_markup=reply_markup
+                )
+                return await update.message.reply_text("בקשתך נשלחה למנהלים ותטופל בהקדם.")
+
+            if not (user.is_authorized or user.is_admin):
+                return await update.message.reply_text("המשתמש שלך אינו מורשה. אנא פנה למנהלת המערכת.")
+
+            if not user.is_admin:  # Skip request limit for admins
+                current_date = datetime.now().strftime('%Y-%m-%d')
+                if not await self.user_cache.count_request(user, current_date, self.max_requests):
+                    return await update.message.reply_text("הגעת למגבלת הבקשות היומית. נסה שוב מחר.")
 
             return await func(update, context, *args, **kwargs)
 
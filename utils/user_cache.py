@@ -0,0 +1,146 @@
+import time
+from typing import Dict, Optional, Set
+
+_SELECT_USER = 'SELECT is_authorized, is_admin, requests_today, last_request_date FROM users WHERE user_id = ?'
+
+# Counts a request unless the user already made :limit today.
+_COUNT_REQUEST = (
+    'UPDATE users SET '
+    'requests_today = CASE WHEN last_request_date = :date THEN requests_today + 1 ELSE 1 END, '
+    'last_request_date = :date '
+    'WHERE user_id = :user_id AND (:limit IS NULL OR last_request_date IS NOT :date OR requests_today < :limit)'
+)
+
+
+class UserState:
+    __slots__ = ('user_id', 'is_authorized', 'is_admin', 'requests_today', 'last_request_date', 'dirty')
+
+    def __init__(self, user_id, is_authorized, is_admin, requests_today, last_request_date):
+        self.user_id = user_id
+        self.is_authorized = bool(is_authorized)
+        self.is_admin = bool(is_admin)
+        self.requests_today = requests_today or 0
+        self.last_request_date = last_request_date
+        self.dirty = False
+
+
+class UserStateCache:
+    """
+    Keeps authorization flags and daily request counters in memory.
+
+    Users are loaded from the `users` table on first use. Counter updates stay
+    in RAM and are written back in one batch by `flush`. Call `invalidate`
+    whenever a user's row changes outside this cache; the flags are then
+    reloaded on the next lookup while pending counters are kept.
+    """
+
+    def __init__(self, db_manager):
+        self.db = db_manager
+        self._users: Dict[int, UserState] = {}
+        self._stale: Set[int] = set()
+
+    async def get(self, user_id: int) -> Optional[UserState]:
+        state = self._users.get(user_id)
+        if state is None or user_id in self._stale:
+            row = await self.db.fetchone(_SELECT_USER, (user_id,))
+            state = self._load(user_id, row)
+        return state
+
+    def get_blocking(self, user_id: int) -> Optional[UserState]:
+        state = self._users.get(user_id)
+        if state is None or user_id in self._stale:
+            with self.db.get_connection() as conn:
+                row = conn.execute(_SELECT_USER, (user_id,)).fetchone()
+            state = self._load(user_id, row)
+        return state
+
+    def _load(self, user_id: int, row) -> Optional[UserState]:
+        self._stale.discard(user_id)
+        if row is None:
+            self._users.pop(user_id, None)
+            return None
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = UserState(user_id, *row)
+        else:
+            state.is_authorized = bool(row[0])
+            state.is_admin = bool(row[1])
+        return state
+
+    async def count_request(self, state: UserState, current_date: str, limit: Optional[int] = None) -> bool:
+        """
+        Counts one request on `current_date`. Returns False without counting it
+        if the user already made `limit` requests that day.
+        """
+        if state.last_request_date != current_date:
+            state.requests_today = 0
+            state.last_request_date = current_date
+        if limit is not None and state.requests_today >= limit:
+            return False
+        state.requests_today += 1
+        state.dirty = True
+        return True
+
+    def invalidate(self, user_id: int):
+        self._stale.add(user_id)
+
+    async def flush(self) -> int:
+        """
+        Writes all pending counters to the database and returns how many users were written.
+        """
+        rows = []
+        for user_id, state in self._users.items():
+            if state.dirty:
+                rows.append((state.requests_today, state.last_request_date, user_id))
+                state.dirty = False
+        if rows:
+            await self.db.executemany('UPDATE users SET requests_today = ?, last_request_date = ? WHERE user_id = ?',
+                                      rows)
+        return len(rows)
+
+
+class SharedUserStateCache(UserStateCache):
+    """
+    UserStateCache for worker processes that share one users table.
+
+    Requests are counted in the table itself, by one statement that also
+    checks the limit, so a user's daily limit holds whichever worker serves
+    them. Flags are reloaded once they are `max_age` seconds old, so an
+    /authorize handled by another worker is seen within that time.
+    """
+
+    def __init__(self, db_manager, max_age: float = 10.0):
+        super().__init__(db_manager)
+        self.max_age = max_age
+        self._loaded_at: Dict[int, float] = {}
+
+    async def get(self, user_id: int) -> Optional[UserState]:
+        if time.monotonic() - self._loaded_at.get(user_id, 0.0) >= self.max_age:
+            self.invalidate(user_id)
+        return await super().get(user_id)
+
+    def get_blocking(self, user_id: int) -> Optional[UserState]:
+        if time.monotonic() - self._loaded_at.get(user_id, 0.0) >= self.max_age:
+            self.invalidate(user_id)
+        return super().get_blocking(user_id)
+
+    def _load(self, user_id: int, row) -> Optional[UserState]:
+        self._loaded_at[user_id] = time.monotonic()
+        state = super()._load(user_id, row)
+        if state is not None and row is not None:
+            state.requests_today, state.last_request_date = row[2] or 0, row[3]
+        return state
+
+    async def count_request(self, state: UserState, current_date: str, limit: Optional[int] = None) -> bool:
+        params = {'date': current_date, 'user_id': state.user_id, 'limit': limit}
+        counted, row = await self.db.run(self._count, params)
+        if row is not None:
+            state.requests_today, state.last_request_date = row
+        return counted
+
+    @staticmethod
+    def _count(conn, params):
+        counted = conn.execute(_COUNT_REQUEST, params).rowcount == 1
+        row = conn.execute('SELECT requests_today, last_request_date FROM users WHERE user_id = ?',
+                           (params['user_id'],)).fetchone()
+        return counted, row